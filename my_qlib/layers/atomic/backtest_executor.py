@@ -1,5 +1,7 @@
 from qlib.backtest import backtest
 from qlib.backtest.executor import SimulatorExecutor
+from .exchange_cache import create_cached_exchange
+from .checkpoint import run_checkpointed_backtest
 
 def create_simulator_executor(time_per_step="day", generate_portfolio_metrics=True):
     """
@@ -10,10 +12,53 @@ def create_simulator_executor(time_per_step="day", generate_portfolio_metrics=Tr
         generate_portfolio_metrics=generate_portfolio_metrics
     )
 
-def run_backtest(start_time, end_time, strategy, executor, benchmark="SH000300", account=100000000, exchange_kwargs=None):
+def prepare_exchange_kwargs(start_time, end_time, exchange_kwargs=None, benchmark="SH000300", account=100000000,
+                            codes=None, quote_cache=True, quote_cache_dir=None):
+    """
+    准备交易所参数原子: 设置股票池，并按需替换为带行情缓存的交易所实例。
+    返回 (传给 qlib 的 exchange_kwargs, 计入断点指纹的设置)
+    """
+    exchange_kwargs = dict(exchange_kwargs or {})
+    if codes is not None:
+        exchange_kwargs.setdefault("codes", list(codes))
+    # 股票池随 end_time 扩展可能变化，不计入断点指纹
+    checkpoint_meta = {
+        "benchmark": benchmark, "account": account,
+        "exchange_kwargs": repr(sorted((k, v) for k, v in exchange_kwargs.items() if k != "codes"))
+    }
+    if quote_cache and "exchange" not in exchange_kwargs:
+        exchange_kwargs = {"exchange": create_cached_exchange(start_time, end_time, cache_dir=quote_cache_dir, **exchange_kwargs)}
+    return exchange_kwargs, checkpoint_meta
+
+def run_backtest(start_time, end_time, strategy, executor, benchmark="SH000300", account=100000000, exchange_kwargs=None,
+                 codes=None, quote_cache=True, quote_cache_dir=None, checkpoint_path=None, checkpoint_every=250, resume=True):
     """
     执行回测原子 (使用 qlib.backtest.backtest 以确保执行器被正确初始化)
+    :param codes: 交易所加载行情的股票池 (标的列表)，None 时使用 exchange_kwargs 中的 codes (默认 "all")
+    :param quote_cache: 是否复用进程内缓存的交易所行情表 (见 exchange_cache.py)
+    :param quote_cache_dir: 行情表磁盘缓存目录，None 表示只使用内存缓存
+    :param checkpoint_path: 断点文件路径，提供时定期保存回测状态并可从断点续跑 (见 checkpoint.py)
+    :param checkpoint_every: 保存断点的间隔 (交易步骤数)
+    :param resume: 是否从 checkpoint_path 中已有的断点续跑或扩展
     """
+    exchange_kwargs, checkpoint_meta = prepare_exchange_kwargs(
+        start_time, end_time, exchange_kwargs, benchmark=benchmark, account=account,
+        codes=codes, quote_cache=quote_cache, quote_cache_dir=quote_cache_dir
+    )
+    if checkpoint_path:
+        return run_checkpointed_backtest(
+            start_time=start_time,
+            end_time=end_time,
+            strategy=strategy,
+            executor=executor,
+            checkpoint_path=checkpoint_path,
+            checkpoint_every=checkpoint_every,
+            resume=resume,
+            benchmark=benchmark,
+            account=account,
+            exchange_kwargs=exchange_kwargs,
+            checkpoint_meta=checkpoint_meta
+        )
     return backtest(
         start_time=start_time,
         end_time=end_time,
@@ -21,5 +66,5 @@ def run_backtest(start_time, end_time, strategy, executor, benchmark="SH000300",
         executor=executor,
         benchmark=benchmark,
         account=account,
-        exchange_kwargs=exchange_kwargs or {}
+        exchange_kwargs=exchange_kwargs
     )
@@ -0,0 +1,329 @@
+import random
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from qlib.config import C
+
+from .strategy_pool import create_permanent_strategy
+
+# qlib risk_analysis 对日频收益的年化系数
+RISK_ANALYSIS_N = 238
+
+def _round_amount(amount: np.ndarray, factor: np.ndarray, trade_unit: Optional[float]) -> np.ndarray:
+    """
+    向量化的交易单位取整 (与 qlib Exchange.round_amount_by_trade_unit 相同)。
+    浮点 floor_divide 很慢，先用 floor(x / unit) 近似再做一次整数修正，结果与 x // unit 逐位一致。
+    """
+    if trade_unit is None:
+        return amount
+    x = amount * factor + 0.1
+    units = np.floor(x / trade_unit)
+    units -= units * trade_unit > x
+    units += (units + 1) * trade_unit <= x
+    return units * trade_unit / factor
+
+def _isclose(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.abs(a - b) <= 1e-8 + 1e-5 * np.abs(b)
+
+def make_weight_grid(ranges: Dict[str, Union[Tuple[float, float, float], List[float]]], max_total: float = 1.0) -> pd.DataFrame:
+    """
+    生成权重网格: 每个资产给出 (最小值, 最大值, 步长) 或取值列表，返回笛卡尔积中总权重不超过 max_total 的组合
+    :param ranges: 例如 {'SH518880': (0.15, 0.35, 0.05), 'SZ000012': [0.2, 0.3]}
+    :return: N × 资产 的权重 DataFrame，可直接传给 run_batch_backtest
+    """
+    axes = []
+    for spec in ranges.values():
+        if isinstance(spec, tuple):
+            low, high, step = spec
+            axes.append(np.round(np.arange(low, high + step / 2, step), 10))
+        else:
+            axes.append(np.asarray(spec, dtype=float))
+    mesh = np.meshgrid(*axes, indexing="ij")
+    grid = pd.DataFrame({code: axis.ravel() for code, axis in zip(ranges, mesh)})
+    return grid[grid.sum(axis=1) <= max_total + 1e-9].reset_index(drop=True)
+
+def run_batch_backtest(
+    market: Dict[str, Any],
+    weights: Union[pd.DataFrame, np.ndarray],
+    codes: Optional[List[str]] = None,
+    rebalance_freq: str = "month",
+    min_weight: float = 0.15,
+    max_weight: float = 0.35,
+    asset_groups: Optional[Dict[str, List[str]]] = None,
+    internal_weight_threshold: float = 0.1,
+    account: float = 100000000,
+    exchange_kwargs: Optional[Dict[str, Any]] = None,
+    start_time=None,
+    end_time=None,
+    return_series: bool = False
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    批量固定权重组合回测原子。
+    对 N 组权重向量只遍历一次时间轴: 持仓、现金、再平衡判断与手续费均为 N × 资产 的二维数组运算。
+    再平衡规则、下单与成交 (交易单位取整、min_cost、现金约束、停牌与涨跌停) 与 run_fast_backtest 相同；
+    区别只在于所有组合共用同一个随机成交顺序 (按全部资产计算)，以及市值按资产列顺序求和。
+    :param market: load_market_data 的返回值 (需包含 codes 中的全部标的)
+    :param weights: N × 资产 的权重矩阵；DataFrame 时列为资产代码、行索引为组合编号，ndarray 时需提供 codes
+    :param codes: 资产代码列表 (可包含 cash 伪资产)
+    :param asset_groups: 资产分组，默认每个资产自成一组
+    :param return_series: 是否同时返回每个组合的日收益序列 (date × N)
+    :return: (metrics, returns)，metrics 每个组合一行 (calculate_summary_stats 与 risk_analysis 指标)，
+             returns 在 return_series=False 时为 None
+    """
+    # 1. 参数整理
+    if isinstance(weights, pd.DataFrame):
+        codes = list(weights.columns)
+        portfolio_index = weights.index
+        weights = weights.to_numpy(dtype=float)
+    else:
+        weights = np.asarray(weights, dtype=float)
+        portfolio_index = pd.RangeIndex(len(weights))
+    if codes is None or len(codes) != weights.shape[1]:
+        raise ValueError("weights 的列数必须与 codes 一致")
+    exchange_kwargs = exchange_kwargs or {}
+    if exchange_kwargs.get("impact_cost") or exchange_kwargs.get("volume_threshold"):
+        raise ValueError("批量回测不支持 impact_cost 与 volume_threshold")
+    open_cost = exchange_kwargs.get("open_cost", 0.0015)
+    close_cost = exchange_kwargs.get("close_cost", 0.0025)
+    min_cost = exchange_kwargs.get("min_cost", 5.0)
+    trade_unit = exchange_kwargs.get("trade_unit", C.trade_unit)
+    if market["trade_w_adj_price"]:
+        trade_unit = None
+    # 现金比例取自策略本身 (与 run_fast_backtest 相同，所有组合一致)
+    risk_degree = create_permanent_strategy(
+        asset_weights=dict(zip(codes, weights[0])) if len(weights) else {},
+        rebalance_freq=rebalance_freq,
+        min_weight=min_weight,
+        max_weight=max_weight,
+        asset_groups=asset_groups,
+        internal_weight_threshold=internal_weight_threshold
+    ).get_risk_degree()
+
+    n_portfolios = len(weights)
+    has_cash = "cash" in codes
+    stock_cols = [j for j, code in enumerate(codes) if code != "cash"]
+    stock_codes = [codes[j] for j in stock_cols]
+    market_index = {code: i for i, code in enumerate(market["codes"])}
+    missing = [code for code in stock_codes if code not in market_index]
+    if missing:
+        raise KeyError(f"行情中缺少标的: {missing}")
+    cols = np.array([market_index[code] for code in stock_codes], dtype=np.intp)
+    # 状态数组均为 资产 × N (按资产存储)，逐资产处理与跨资产求和都是连续内存上的运算
+    weights_t = np.ascontiguousarray(weights.T)
+    stock_weights = weights_t[stock_cols]
+    cash_col = codes.index("cash") if has_cash else None
+
+    # 分组成员矩阵 (组 × 资产)，同一资产可属于多个组；cash 伪资产同样可以成组
+    asset_groups = asset_groups or {code: [code] for code in codes}
+    col_of = {code: j for j, code in enumerate(codes)}
+    membership = np.zeros((len(asset_groups), len(codes)))
+    for g, assets in enumerate(asset_groups.values()):
+        for asset in assets:
+            if asset in col_of:
+                membership[g, col_of[asset]] += 1
+    # 与 PermanentPortfolioStrategy._compile_groups 一致: 只检查出现在分组中且目标权重 > 0 的资产
+    checked = (membership.sum(axis=0) > 0)[:, None] & (weights_t > 0)
+    safe_targets = np.where(checked, weights_t, 1.0)
+
+    # 所有组合共用的成交顺序 (与 qlib 对排序后的代码做 random.seed(0) 洗牌一致)
+    order_codes = sorted(stock_codes)
+    random.Random(0).shuffle(order_codes)
+    order = [stock_codes.index(code) for code in order_codes]
+
+    # 2. 截取回测区间与行情
+    dates = market["dates"]
+    lo = 0 if start_time is None else dates.searchsorted(pd.Timestamp(start_time))
+    hi = len(dates) if end_time is None else dates.searchsorted(pd.Timestamp(end_time), side="right")
+    dates = dates[lo:hi]
+    close = market["close"][lo:hi][:, cols].astype(float)
+    buy_price = market["buy_price"][lo:hi][:, cols].astype(float)
+    sell_price = market["sell_price"][lo:hi][:, cols].astype(float)
+    factor = market["factor"][lo:hi][:, cols].astype(float)
+    suspended = market["suspended"][lo:hi][:, cols]
+    tradable = ~(market["limit_buy"][lo:hi][:, cols] | market["limit_sell"][lo:hi][:, cols])
+    if rebalance_freq == "month":
+        period_keys = np.asarray(dates.month)
+    elif rebalance_freq == "year":
+        period_keys = np.asarray(dates.year)
+    else:
+        period_keys = None
+
+    # 3. 账户状态。未持有的资产数量恒为 0，因此市值直接用 amount * price 计算
+    n_assets = len(stock_codes)
+    amount = np.zeros((n_assets, n_portfolios))
+    price = np.zeros((n_assets, n_portfolios))
+    held = np.zeros((n_assets, n_portfolios), dtype=bool)
+    cash = np.full(n_portfolios, float(account))
+    last_key = np.full(n_portfolios, -1)
+    started = False
+    total_cost = np.zeros(n_portfolios)
+    total_turnover = np.zeros(n_portfolios)
+    rebalance_days = np.zeros(n_portfolios, dtype=np.int64)
+    last_account_value = cash.copy()
+    last_total_cost = np.zeros(n_portfolios)
+    last_total_turnover = np.zeros(n_portfolios)
+
+    # 收益统计量逐日累积，不保留 T × N 的收益矩阵
+    sum_r = np.zeros(n_portfolios)
+    sum_r2 = np.zeros(n_portfolios)
+    growth = np.ones(n_portfolios)
+    cum_r = np.zeros(n_portfolios)
+    peak = np.full(n_portfolios, -np.inf)
+    max_drawdown = np.zeros(n_portfolios)
+    returns = np.empty((len(dates), n_portfolios)) if return_series else None
+
+    for t in range(len(dates)):
+        # 4. 再平衡判断 (与 PermanentPortfolioStrategy.generate_target_weight_position 一致)
+        if not started:
+            # 第一次运行: 所有组合执行初始权重分配
+            rebalance = np.ones(n_portfolios, dtype=bool)
+            started = True
+        else:
+            if period_keys is None:
+                candidate = np.ones(n_portfolios, dtype=bool)
+            else:
+                candidate = last_key != period_keys[t]
+            rebalance = candidate
+            if candidate.any():
+                # 每日频率时全部组合都是候选，直接使用整个数组，避免花式索引拷贝
+                rows = slice(None) if candidate.all() else np.flatnonzero(candidate)
+                c_cash = cash[rows]
+                market_value = amount[:, rows] * price[:, rows]
+                asset_values = np.empty((len(codes), len(c_cash)))
+                asset_values[stock_cols] = market_value
+                if has_cash:
+                    asset_values[cash_col] = c_cash
+                total_value = c_cash + market_value.sum(axis=0)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    w = asset_values / total_value
+                    drift = checked[:, rows] & (np.abs(w - weights_t[:, rows]) / safe_targets[:, rows] > internal_weight_threshold)
+                    group_weights = membership @ w
+                    need = drift.any(axis=0) | ((group_weights > max_weight) | (group_weights < min_weight)).any(axis=0)
+                need |= ~(total_value > 0)
+                rebalance = np.zeros(n_portfolios, dtype=bool)
+                rebalance[rows] = need
+        if period_keys is not None:
+            last_key[rebalance] = period_keys[t]
+
+        # 5. 目标权重 -> 订单 -> 成交 (只处理需要再平衡的组合)
+        if rebalance.any():
+            # 全部组合都需要再平衡时直接在原数组上操作 (切片为视图，成交结果直接写回)
+            rows = slice(None) if rebalance.all() else np.flatnonzero(rebalance)
+            r_amount, r_price, r_held, r_cash = amount[:, rows], price[:, rows], held[:, rows], cash[rows]
+            r_cost, r_turnover = total_cost[rows], total_turnover[rows]
+            risk_total_value = risk_degree * (r_cash + (r_amount * r_price).sum(axis=0))
+
+            # 目标数量 -> 订单数量 (只对当日可交易的资产下单)
+            sell_amount = np.zeros_like(r_amount)
+            buy_amount = np.zeros_like(r_amount)
+            for j in range(n_assets):
+                if not tradable[t, j]:
+                    continue
+                target_value = risk_total_value * stock_weights[j, rows]
+                if t > 0 and tradable[t - 1, j]:
+                    # 昨日可交易: 按昨日收盘价换算
+                    target = target_value / close[t - 1, j]
+                else:
+                    # 否则按持仓价格换算，未持有则目标为 0
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        target = np.where(r_held[j], target_value / r_price[j], 0.0)
+                delta = target - r_amount[j]
+                rounded = _round_amount(np.abs(delta), factor[t, j], trade_unit)
+                sell_amount[j] = np.where(delta < 0, np.where(target == 0, r_amount[j], rounded), 0.0)
+                buy_amount[j] = np.where(delta > 0, rounded, 0.0)
+
+            # 卖出先于买入，各组合按同一资产顺序逐笔成交，每笔只计算有订单的组合
+            for j in order:
+                idx = np.flatnonzero(sell_amount[j] > 0)
+                if not len(idx):
+                    continue
+                p = sell_price[t, j]
+                deal, current, cash_i = sell_amount[j, idx], r_amount[j, idx], r_cash[idx]
+                deal = np.where(_isclose(deal, current), deal, _round_amount(np.minimum(current, deal), factor[t, j], trade_unit))
+                deal = np.where(cash_i + deal * p < np.maximum(deal * p * close_cost, min_cost), 0.0, deal)
+                trade_val = deal * p
+                done = trade_val > 1e-5
+                cost = np.where(done, np.maximum(trade_val * close_cost, min_cost), 0.0)
+                trade_val = np.where(done, trade_val, 0.0)
+                trade_amount = trade_val / p
+                closed = done & _isclose(current, trade_amount)
+                r_amount[j, idx] = np.where(closed, 0.0, current - trade_amount)
+                r_held[j, idx] &= ~closed
+                r_cash[idx] = cash_i + trade_val - cost
+                r_cost[idx] += cost
+                r_turnover[idx] += trade_val
+
+            for j in order:
+                idx = np.flatnonzero(buy_amount[j] > 0)
+                if not len(idx):
+                    continue
+                p = buy_price[t, j]
+                deal, cash_i = buy_amount[j, idx], r_cash[idx]
+                trade_val = deal * p
+                min_fee = np.maximum(trade_val * open_cost, min_cost)
+                max_buy = np.where(
+                    cash_i >= min_cost,
+                    np.where(cash_i >= min_cost / open_cost + min_cost, cash_i / (1 + open_cost) / p, (cash_i - min_cost) / p),
+                    0.0
+                )
+                deal = np.where(
+                    cash_i < min_fee, 0.0,
+                    _round_amount(np.where(cash_i < trade_val + min_fee, np.minimum(max_buy, deal), deal), factor[t, j], trade_unit)
+                )
+                trade_val = deal * p
+                done = trade_val > 1e-5
+                cost = np.where(done, np.maximum(trade_val * open_cost, min_cost), 0.0)
+                trade_val = np.where(done, trade_val, 0.0)
+                # 新建仓的持仓价格为成交价，已有持仓保持原价格
+                r_price[j, idx] = np.where(done & ~r_held[j, idx], p, r_price[j, idx])
+                r_held[j, idx] |= done
+                r_amount[j, idx] += trade_val / p
+                r_cash[idx] = cash_i - (trade_val + cost)
+                r_cost[idx] += cost
+                r_turnover[idx] += trade_val
+
+            if not isinstance(rows, slice):
+                amount[:, rows], price[:, rows], held[:, rows], cash[rows] = r_amount, r_price, r_held, r_cash
+                total_cost[rows], total_turnover[rows] = r_cost, r_turnover
+
+        # 6. 收盘结算: 未停牌资产的价格更新为收盘价 (未持有的组合数量为 0，价格不影响市值)，累积收益统计量
+        for j in range(n_assets):
+            if not suspended[t, j]:
+                price[j] = close[t, j]
+        now_account_value = cash + (amount * price).sum(axis=0)
+        now_cost = total_cost - last_total_cost
+        r = (now_account_value - last_account_value + now_cost) / last_account_value
+        rebalance_days += total_turnover > last_total_turnover
+        last_account_value, last_total_cost, last_total_turnover = now_account_value, total_cost.copy(), total_turnover.copy()
+
+        sum_r += r
+        sum_r2 += r * r
+        growth *= 1 + r
+        cum_r += r
+        np.maximum(peak, cum_r, out=peak)
+        np.maximum(max_drawdown, peak - cum_r, out=max_drawdown)
+        if return_series:
+            returns[t] = r
+
+    # 7. 汇总指标 (与 calculate_summary_stats / risk_analysis 的定义相同)
+    n_days = len(dates)
+    mean = sum_r / n_days
+    std = np.sqrt(np.maximum(sum_r2 - n_days * mean * mean, 0.0) / max(n_days - 1, 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe_252 = np.where(std != 0, mean / std * np.sqrt(252), 0.0)
+        information_ratio = mean / std * np.sqrt(RISK_ANALYSIS_N)
+    metrics = pd.DataFrame(weights, index=portfolio_index, columns=[f"w_{code}" for code in codes])
+    metrics["Total Return"] = growth - 1
+    metrics["Annual Return"] = mean * 252
+    metrics["Sharpe Ratio"] = sharpe_252
+    metrics["Max Drawdown"] = max_drawdown
+    metrics["mean"] = mean
+    metrics["std"] = std
+    metrics["annualized_return"] = mean * RISK_ANALYSIS_N
+    metrics["information_ratio"] = information_ratio
+    metrics["max_drawdown"] = -max_drawdown
+    metrics["rebalance_days"] = rebalance_days
+    metrics["total_cost"] = total_cost
+    metrics["final_account"] = last_account_value
+    return metrics, (pd.DataFrame(returns, index=dates, columns=portfolio_index) if return_series else None)
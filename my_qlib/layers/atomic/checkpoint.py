@@ -0,0 +1,278 @@
+import os
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from tqdm.auto import tqdm
+from qlib.backtest import get_strategy_executor
+from qlib.backtest.executor import NestedExecutor
+from qlib.backtest.high_performance_ds import NumpyOrderIndicator
+from qlib.utils.index_data import SingleData
+from qlib.utils.time import Freq
+
+CHECKPOINT_VERSION = 1
+
+# PortfolioMetrics 中逐步累积的记录字段
+_METRIC_FIELDS = (
+    "accounts", "returns", "total_turnovers", "turnovers", "total_costs", "costs", "values", "cashes", "benches"
+)
+
+_SIMPLE_TYPES = (int, float, str, bool, dict, list, tuple, type(None))
+
+def checkpoint_fingerprint(first_step, strategy, **meta) -> str:
+    """
+    断点指纹: 回测起点、策略类型与参数 (策略的公开简单类型属性) 以及 meta 中的账户/基准/交易所设置。
+    指纹不一致的断点不会被用于续跑。注意信号数据本身不计入指纹。
+    """
+    params = {
+        key: value for key, value in vars(strategy).items()
+        if not key.startswith("_") and isinstance(value, _SIMPLE_TYPES)
+    }
+    key = (str(pd.Timestamp(first_step)), type(strategy).__name__, repr(sorted(params.items())), repr(sorted(meta.items())))
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+def _pack_order_indicators(order_indicator_his: dict) -> dict:
+    """
+    逐日的订单指标 (NumpyOrderIndicator，每个字段一个 SingleData) 按字段拼接为数组，
+    避免逐日序列化大量小对象 (占断点序列化耗时的绝大部分)
+    """
+    orders, lengths, indexes, values = [], {}, {}, {}
+    for day, indicator in enumerate(order_indicator_his.values()):
+        orders.append(tuple(indicator.data))
+        for name, sd in indicator.data.items():
+            lengths.setdefault(name, np.zeros(len(order_indicator_his), dtype=np.int64))[day] = len(sd.data)
+            if len(sd.data):
+                indexes.setdefault(name, []).append(sd.index.idx_list)
+                values.setdefault(name, []).append(sd.data)
+    return {
+        "dates": list(order_indicator_his),
+        "orders": orders,
+        "lengths": lengths,
+        "indexes": {name: np.concatenate(parts) for name, parts in indexes.items()},
+        "values": {name: np.concatenate(parts) for name, parts in values.items()},
+    }
+
+def _unpack_order_indicators(packed: dict) -> dict:
+    """
+    _pack_order_indicators 的逆操作，重建逐日的 NumpyOrderIndicator (无订单的日期共享同一个只读的空 SingleData)
+    """
+    empty = SingleData()
+    offsets = {name: np.concatenate([[0], np.cumsum(lengths)]) for name, lengths in packed["lengths"].items()}
+    his: dict = OrderedDict()
+    for day, (date, order) in enumerate(zip(packed["dates"], packed["orders"])):
+        indicator = NumpyOrderIndicator()
+        for name in order:
+            start, stop = offsets[name][day], offsets[name][day + 1]
+            if stop > start:
+                indicator.data[name] = SingleData(packed["values"][name][start:stop], packed["indexes"][name][start:stop])
+            else:
+                indicator.data[name] = empty
+        his[date] = indicator
+    return his
+
+def save_checkpoint(path: str, state: dict):
+    """
+    原子写入断点文件 (先写临时文件再替换)，压缩方式由扩展名决定 (如 .pkl.gz)，使用最快的压缩级别
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    method = pd.io.common.infer_compression(path, "infer")
+    compression = {"method": method, "compresslevel": 1} if method in ("gzip", "bz2") else method
+    pd.to_pickle(state, tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    """
+    读取断点文件，不存在或版本不符时返回 None
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        state = pd.read_pickle(path)
+    except Exception as e:
+        print(f"警告: 读取断点 {path} 失败 ({e})，从头开始回测")
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+        print(f"警告: 断点 {path} 版本不兼容，从头开始回测")
+        return None
+    return state
+
+def capture_state(trade_strategy, trade_executor, fingerprint: str, first_step) -> dict:
+    """
+    采集当前回测状态: 持仓、累计成交信息、组合指标记录、历史持仓、交易指标、执行器与策略状态、日历游标
+    :param first_step: 整个回测的第一个交易步骤 (续跑/实盘模式下执行器的日历不从回测起点开始)
+    """
+    account = trade_executor.trade_account
+    calendar = trade_executor.trade_calendar
+    metrics = account.portfolio_metrics
+    step_date = calendar.get_step_time(calendar.get_trade_step() - 1)[0] if calendar.get_trade_step() > 0 else None
+    get_strategy_state = getattr(trade_strategy, "get_checkpoint_state", None)
+    return {
+        "version": CHECKPOINT_VERSION,
+        "fingerprint": fingerprint,
+        "first_step": pd.Timestamp(first_step),
+        "step_date": step_date,
+        "position": account.current_position,
+        "accum_info": account.accum_info,
+        # 组合指标记录按字段存为数组 (比逐项序列化 NumPy 标量紧凑得多，保留原 dtype，如 float32 的 bench)
+        "metrics": None if metrics is None else {
+            "dates": list(metrics.accounts),
+            **{name: np.array(list(getattr(metrics, name).values())) for name in _METRIC_FIELDS},
+            "latest_pm_time": metrics.latest_pm_time
+        },
+        "hist_positions": account.hist_positions,
+        "indicator": (_pack_order_indicators(account.indicator.order_indicator_his), account.indicator.trade_indicator_his),
+        "executor": {"dealt_order_amount": trade_executor.dealt_order_amount, "deal_day": trade_executor.deal_day},
+        "strategy": get_strategy_state() if get_strategy_state else None,
+    }
+
+def restore_state(state: dict, trade_strategy, trade_executor) -> bool:
+    """
+    将断点状态恢复到已 reset 的策略/执行器上，并把日历游标移动到断点之后的第一个交易步骤。
+    断点日期不在当前回测区间内时 (例如新的 end_time 早于断点) 返回 False，不做任何修改。
+    """
+    calendar = trade_executor.trade_calendar
+    step_date = state["step_date"]
+    if step_date is None:
+        return False
+    step_times = pd.DatetimeIndex([calendar.get_step_time(i)[0] for i in range(calendar.get_trade_len())])
+    n_done = int(np.searchsorted(step_times.values, np.datetime64(pd.Timestamp(step_date)), side="right"))
+    if n_done == 0 or step_times[n_done - 1] != pd.Timestamp(step_date):
+        return False
+    apply_state(state, trade_strategy, trade_executor)
+    calendar.trade_step = n_done
+    return True
+
+def apply_state(state: dict, trade_strategy, trade_executor):
+    """
+    将断点中的账户/执行器/策略状态写入已 reset 的策略与执行器 (不移动日历游标)
+    """
+    account = trade_executor.trade_account
+    account.current_position = state["position"]
+    account.accum_info = state["accum_info"]
+    if state["metrics"] is not None and account.portfolio_metrics is not None:
+        metrics = account.portfolio_metrics
+        dates = state["metrics"]["dates"]
+        for name in _METRIC_FIELDS:
+            setattr(metrics, name, OrderedDict(zip(dates, list(state["metrics"][name]))))
+        metrics.latest_pm_time = state["metrics"]["latest_pm_time"]
+    account.hist_positions = state["hist_positions"]
+    order_indicator_his, trade_indicator_his = state["indicator"]
+    account.indicator.order_indicator_his = _unpack_order_indicators(order_indicator_his)
+    account.indicator.trade_indicator_his = trade_indicator_his
+    trade_executor.dealt_order_amount = state["executor"]["dealt_order_amount"]
+    trade_executor.deal_day = state["executor"]["deal_day"]
+    set_strategy_state = getattr(trade_strategy, "set_checkpoint_state", None)
+    if set_strategy_state and state["strategy"] is not None:
+        set_strategy_state(state["strategy"])
+
+def _derived_checkpoint_path(path: str, end_time) -> str:
+    """
+    派生的断点路径: 在文件名的第一个扩展名前加上本次回测的结束日期 (保留 .pkl.gz 等压缩扩展名)
+    """
+    directory, name = os.path.split(path)
+    stem, dot, ext = name.partition(".")
+    return os.path.join(directory, f"{stem}.until{pd.Timestamp(end_time):%Y%m%d}{dot}{ext}")
+
+def _resume_from(state: dict, path: str, resume: bool, fingerprint: str, trade_strategy, trade_executor) -> bool:
+    """
+    尝试从断点续跑，成功时返回 True；否则打印从头开始回测的原因并返回 False
+    """
+    step_date = state["step_date"]
+    calendar = trade_executor.trade_calendar
+    if not resume:
+        print(f"resume=False，忽略断点 {path}，从头开始回测")
+    elif state["fingerprint"] != fingerprint:
+        print(f"断点 {path} 与当前回测设置 (起点/策略参数/账户/交易所) 不一致，从头开始回测")
+    elif not restore_state(state, trade_strategy, trade_executor):
+        end_time = pd.Timestamp(calendar.get_all_time()[1])
+        if step_date is not None and pd.Timestamp(step_date) > end_time:
+            reason = f"{pd.Timestamp(step_date).date()} 晚于本次回测的结束日期 {end_time.date()}"
+        else:
+            reason = f"{step_date} 不是本次回测区间内的交易步骤"
+        print(f"断点 {path} 的日期 {reason}，从头开始回测")
+    else:
+        print(f"从断点 {path} 续跑: 已完成至 {pd.Timestamp(step_date).date()}，"
+              f"剩余 {calendar.get_trade_len() - calendar.get_trade_step()} 个交易步骤")
+        return True
+    return False
+
+def run_checkpointed_backtest(
+    start_time,
+    end_time,
+    strategy,
+    executor,
+    checkpoint_path: str,
+    checkpoint_every: int = 250,
+    resume: bool = True,
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs: Optional[dict] = None,
+    checkpoint_meta: Optional[dict] = None,
+):
+    """
+    带断点续跑的回测原子，返回值与 qlib.backtest.backtest 相同 (portfolio_dict, indicator_dict)。
+    逐步循环与 qlib 的 collect_data_loop 一致，每 checkpoint_every 个交易步骤及结束时将状态写入 checkpoint_path。
+    resume=True 且断点与本次回测的起点/策略参数/账户设置一致时，从断点之后继续:
+    同一 end_time 为中断续跑，更晚的 end_time 则在已有结果上向后扩展，不重放已模拟的历史。
+    已有断点比本次回测更靠后 (例如 end_time 早于断点日期) 时不会被覆盖，本次断点写入派生路径 (见 _derived_checkpoint_path)。
+    :param checkpoint_every: 保存断点的间隔 (交易步骤数)
+    :param checkpoint_meta: 计入断点指纹的额外设置 (基准、账户、交易所参数等)
+    """
+    # 1. 创建策略/执行器 (与 qlib.backtest.backtest 相同)
+    trade_strategy, trade_executor = get_strategy_executor(
+        start_time, end_time, strategy, executor, benchmark, account, exchange_kwargs or {}
+    )
+    if isinstance(trade_executor, NestedExecutor):
+        raise ValueError("断点续跑仅支持单层执行器 (SimulatorExecutor)")
+    trade_executor.reset(start_time=start_time, end_time=end_time)
+    trade_strategy.reset(level_infra=trade_executor.get_level_infra())
+    calendar = trade_executor.trade_calendar
+    first_step = calendar.get_step_time(0)[0]
+    fingerprint = checkpoint_fingerprint(first_step, trade_strategy, **(checkpoint_meta or {}))
+
+    # 2. 从断点恢复: 不能续跑时说明原因；已有断点比本次回测更靠后时不覆盖，本次断点写入派生路径
+    save_path = checkpoint_path
+    state = load_checkpoint(checkpoint_path)
+    if state is not None and not _resume_from(state, checkpoint_path, resume, fingerprint, trade_strategy, trade_executor):
+        if state["step_date"] is not None and pd.Timestamp(state["step_date"]) > pd.Timestamp(end_time):
+            save_path = _derived_checkpoint_path(checkpoint_path, end_time)
+            print(f"警告: 已有断点 {checkpoint_path} 已完成至 {pd.Timestamp(state['step_date']).date()}，"
+                  f"比本次回测 (至 {pd.Timestamp(end_time).date()}) 更靠后，不覆盖；本次断点写入 {save_path}")
+            derived = load_checkpoint(save_path)
+            if derived is not None:
+                _resume_from(derived, save_path, resume, fingerprint, trade_strategy, trade_executor)
+
+    # 3. 逐步回测，定期保存断点
+    with tqdm(total=calendar.get_trade_len(), initial=calendar.get_trade_step(), desc="backtest loop") as bar:
+        _execute_result = None
+        steps_since_save = 0
+        while not trade_executor.finished():
+            _trade_decision = trade_strategy.generate_trade_decision(_execute_result)
+            return_value: dict = {}
+            for _ in trade_executor.collect_data(_trade_decision, return_value=return_value, level=0):
+                pass
+            _execute_result = return_value.get("execute_result")
+            trade_strategy.post_exe_step(_execute_result)
+            bar.update(1)
+            steps_since_save += 1
+            if checkpoint_every and steps_since_save >= checkpoint_every:
+                save_checkpoint(save_path, capture_state(trade_strategy, trade_executor, fingerprint, first_step))
+                steps_since_save = 0
+        trade_strategy.post_upper_level_exe_step()
+    # 断点已是最新状态 (例如续跑时没有新的交易步骤) 时不再重复写入
+    if steps_since_save:
+        save_checkpoint(save_path, capture_state(trade_strategy, trade_executor, fingerprint, first_step))
+
+    # 4. 汇总结果 (与 qlib.backtest.backtest_loop 相同)
+    key = "{}{}".format(*Freq.parse(trade_executor.time_per_step))
+    trade_account = trade_executor.trade_account
+    portfolio_dict = {}
+    if trade_account.is_port_metr_enabled():
+        portfolio_dict[key] = trade_account.get_portfolio_metrics()
+    indicator_obj = trade_account.get_trade_indicator()
+    indicator_dict = {key: (indicator_obj.generate_trade_indicators_dataframe(), indicator_obj)}
+    return portfolio_dict, indicator_dict
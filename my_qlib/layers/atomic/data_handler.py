@@ -1,3 +1,13 @@
+import os
+import re
+import json
+import pickle
+import contextlib
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from qlib.config import C
 from qlib.data import D
 
 def get_instruments(market: str = "csi300"):
@@ -12,20 +22,384 @@ def get_benchmark(benchmark: str = "SH000300"):
     """
     return benchmark
 
-def get_simple_signal(start_time, end_time, market="csi300"):
+def get_simple_signal(start_time, end_time, market="csi300", snapshot_uri=None, cache_dir=None):
     """
     生成一个简单的信号原子。
     这里我们直接用 $close 的每日变化率作为信号（仅作演示）。
+    :param snapshot_uri: 数据目录 (provider_uri)，提供时从列式快照读取，不经过 D.features
+    :param cache_dir: 磁盘缓存目录，提供时相同查询直接读取缓存，不再访问数据源
     """
+    if cache_dir is not None:
+        cache = get_feature_cache(cache_dir)
+        key = {"kind": "simple_signal", "market": market, "start": str(start_time), "end": str(end_time),
+               "snapshot": snapshot_uri is not None}
+        version = get_data_version(["$close"], market=market, provider_uri=snapshot_uri,
+                                   snapshot_dir="snapshot" if snapshot_uri is not None else None)
+        return cache.get_or_compute(
+            key, version, lambda: get_simple_signal(start_time, end_time, market=market, snapshot_uri=snapshot_uri)
+        )
+
+    if snapshot_uri is not None:
+        return get_simple_signal_from_snapshot(start_time, end_time, market=market, provider_uri=snapshot_uri)
+
     instruments = D.instruments(market=market)
     # 获取收盘价
     df = D.features(instruments, ["$close"], start_time=start_time, end_time=end_time)
     if df.empty:
-        import pandas as pd
         return pd.Series(dtype=float)
-        
+
     # 计算简单的每日收益率作为信号
     # 注意：Qlib 的策略通常需要一个 Series，其索引为 <datetime, instrument>
     # 我们这里简单地将 $close 的变化作为分值
     df['score'] = df['$close'].groupby(level='instrument').pct_change()
     return df['score'].fillna(0)
+
+def get_trade_calendar(provider_uri=None):
+    """
+    直接读取 calendars/day.txt 获取交易日历，返回 DatetimeIndex
+    :param provider_uri: 数据目录，默认取当前 qlib 配置
+    """
+    if provider_uri is None:
+        provider_uri = str(C.dpm.get_data_uri(freq="day"))
+    with open(os.path.join(provider_uri, "calendars", "day.txt"), "r", encoding="utf-8") as f:
+        return pd.DatetimeIndex([line.strip() for line in f if line.strip()])
+
+def load_market_spans(market: str, provider_uri: str = "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"):
+    """
+    读取 instruments/<market>.txt，返回 [(instrument, start, end), ...]
+    """
+    spans = []
+    with open(os.path.join(provider_uri, "instruments", f"{market}.txt"), "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split("\t")
+            if len(parts) >= 3:
+                spans.append((parts[0].upper(), pd.Timestamp(parts[1]), pd.Timestamp(parts[2])))
+    return spans
+
+def build_market_mask(dates, instruments, spans, ranges=None):
+    """
+    生成 date×instrument 的布尔掩码: 标的处于股票池区间 (且在 .bin 数据区间内) 时为 True
+    :param spans: load_market_spans 的返回值
+    :param ranges: load_snapshot_ranges 的返回值，None 表示不限制数据区间
+    """
+    dates = np.asarray(pd.DatetimeIndex(dates).values)
+    col_idx = {code: i for i, code in enumerate(instruments)}
+    mask = np.zeros((len(dates), len(col_idx)), dtype=bool)
+    for code, start, end in spans:
+        if code not in col_idx:
+            continue
+        if ranges is not None:
+            if code not in ranges:
+                continue
+            start, end = max(start, ranges[code][0]), min(end, ranges[code][1])
+        mask[(dates >= start.to_datetime64()) & (dates <= end.to_datetime64()), col_idx[code]] = True
+    return mask
+
+# 已提示过与 .bin 数据版本不一致的快照文件 (每个文件只警告一次)
+_STALE_SNAPSHOTS = set()
+
+def _open_snapshot(field, provider_uri, snapshot_dir):
+    """
+    以内存映射方式打开字段的快照，返回 (record batch, 是否与当前 .bin 数据版本一致)。
+    导出时写入 schema 元数据的 data_version 与 get_data_version 不一致 (如增量转换后未重新导出快照) 时给出警告。
+    """
+    import pyarrow as pa
+
+    path = os.path.join(provider_uri, snapshot_dir, f"{field.lstrip('$')}.arrow")
+    batch = pa.ipc.open_file(pa.memory_map(path, "r")).get_batch(0)
+    saved = (batch.schema.metadata or {}).get(b"data_version", b"").decode("utf-8")
+    current = saved == get_data_version([field], instruments=batch.schema.names[1:], provider_uri=provider_uri)
+    if not current and path not in _STALE_SNAPSHOTS:
+        _STALE_SNAPSHOTS.add(path)
+        print(f"警告: 快照 {path} 与 .bin 数据版本不一致 (增量转换后未使用 --snapshot 重新导出?)，改为直接读取 .bin")
+    return batch, current
+
+def _read_bin_panel(field, codes, calendar, provider_uri):
+    """
+    直接从 .bin 读取 date×instrument 宽表 (快照过期时的回退)
+    """
+    values = np.full((len(calendar), len(codes)), np.nan, dtype=np.float32)
+    for j, code in enumerate(codes):
+        path = os.path.join(provider_uri, "features", code.lower(), f"{field.lstrip('$')}.day.bin")
+        if not os.path.exists(path) or os.path.getsize(path) < 8:
+            continue
+        data = np.fromfile(path, dtype="<f4")
+        start_idx = int(data[0])
+        column = data[1 : 1 + len(calendar) - start_idx]
+        if len(column) == 0:
+            continue
+        values[start_idx : start_idx + len(column), j] = column
+    return values
+
+def load_panel_snapshot(
+    fields,
+    start_time=None,
+    end_time=None,
+    instruments=None,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    snapshot_dir="snapshot"
+):
+    """
+    从列式快照 (scripts/convert_data.py --snapshot 导出) 读取 date×instrument 宽表原子。
+    快照以内存映射方式打开，只读取所需的标的列与日期范围，不经过 D.features。
+    快照与当前 .bin 数据版本不一致时警告并改为直接读取 .bin (结果相同，但较慢)。
+    :param fields: 字段列表，如 ["$close", "$open"]
+    :param instruments: 标的代码列表，或股票池名称 (如 "csi300")，None 表示全部
+    :return: {字段: DataFrame(index=datetime, columns=instrument, dtype=float32)}
+    """
+    if isinstance(instruments, str):
+        instruments = list(dict.fromkeys(code for code, _, _ in load_market_spans(instruments, provider_uri)))
+
+    panels = {}
+    for field in fields:
+        batch, current = _open_snapshot(field, provider_uri, snapshot_dir)
+        names = batch.schema.names
+        codes = names[1:] if instruments is None else list(instruments)
+
+        # 1. 按日期范围定位行区间
+        dates = batch.column(0).to_numpy() if current else get_trade_calendar(provider_uri).values
+        lo = 0 if start_time is None else np.searchsorted(dates, pd.Timestamp(start_time).to_datetime64(), side="left")
+        hi = len(dates) if end_time is None else np.searchsorted(dates, pd.Timestamp(end_time).to_datetime64(), side="right")
+
+        # 2. 只取所需的列，快照中不存在的标的补为 NaN 列
+        if current:
+            col_pos = {name: i for i, name in enumerate(names)}
+            values = np.full((hi - lo, len(codes)), np.nan, dtype=np.float32)
+            for j, code in enumerate(codes):
+                i = col_pos.get(code)
+                if i is not None:
+                    values[:, j] = batch.column(i).to_numpy()[lo:hi]
+        else:
+            values = _read_bin_panel(field, codes, pd.DatetimeIndex(dates), provider_uri)[lo:hi]
+        panels[field] = pd.DataFrame(values, index=pd.DatetimeIndex(dates[lo:hi], name="datetime"), columns=codes)
+    return panels
+
+def load_snapshot_ranges(
+    field,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    snapshot_dir="snapshot"
+):
+    """
+    读取快照中各标的在 .bin 里的数据区间，返回 {instrument: (start, end)}
+    (快照与 .bin 数据版本不一致时直接由 .bin 计算)
+    """
+    batch, current = _open_snapshot(field, provider_uri, snapshot_dir)
+    if not current:
+        # 由 .bin 的头部 (起始日历下标) 与长度计算数据区间
+        calendar = get_trade_calendar(provider_uri)
+        features_dir = os.path.join(provider_uri, "features")
+        ranges = {}
+        for symbol in os.listdir(features_dir):
+            path = os.path.join(features_dir, symbol, f"{field.lstrip('$')}.day.bin")
+            if not os.path.exists(path) or os.path.getsize(path) < 8:
+                continue
+            start_idx = int(np.fromfile(path, dtype="<f4", count=1)[0])
+            length = min(os.path.getsize(path) // 4 - 1, len(calendar) - start_idx)
+            if length > 0:
+                ranges[symbol.upper()] = (calendar[start_idx], calendar[start_idx + length - 1])
+        return ranges
+    ranges = json.loads((batch.schema.metadata or {}).get(b"data_range", b"{}"))
+    return {code: (pd.Timestamp(start), pd.Timestamp(end)) for code, (start, end) in ranges.items()}
+
+def get_simple_signal_from_snapshot(
+    start_time,
+    end_time,
+    market="csi300",
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"
+):
+    """
+    与 get_simple_signal 相同的演示信号，但从列式快照读取并在宽表上向量化计算。
+    只保留标的在股票池中且有数据的区间，返回 <datetime, instrument> 索引的 Series。
+    """
+    spans = load_market_spans(market, provider_uri)
+    close = load_panel_snapshot(["$close"], start_time, end_time, instruments=market, provider_uri=provider_uri)["$close"]
+    if close.empty:
+        return pd.Series(dtype=float)
+
+    # 按股票池区间与 .bin 数据区间的交集生成掩码，区间外的数据视为不存在
+    ranges = load_snapshot_ranges("$close", provider_uri)
+    mask = build_market_mask(close.index, close.columns, spans, ranges)
+    close = close.where(mask)
+
+    score = close.pct_change().stack(future_stack=True)
+    score = score[mask.reshape(-1)].astype(float).fillna(0)
+    score.index.names = ["datetime", "instrument"]
+    score.name = "score"
+    return score
+
+class FeatureCache:
+    """
+    特征查询的磁盘缓存 (容量上限 + LRU 淘汰)。
+    每个查询对应一个文件，文件内记录数据版本；数据版本变化 (.bin 被重写或追加) 时旧条目自动失效。
+    """
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        """
+        :param cache_dir: 缓存目录
+        :param max_bytes: 缓存目录容量上限，超出时按最近使用时间淘汰
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: dict) -> str:
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def get(self, key: dict, version: str):
+        """
+        命中返回缓存对象，否则返回 None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                cached_version, value = pickle.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, TypeError, ValueError):
+            # 写入进程被中断留下的截断/损坏文件 (或引用了已不存在的类)，视为未命中并删除
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if cached_version != version:
+            # 数据已更新，删除失效条目
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            with self._lock:
+                self.misses += 1
+                self.invalidations += 1
+            return None
+
+        # 更新修改时间作为 LRU 的最近使用时间 (文件可能已被其他进程淘汰)
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: dict, version: str, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_compute(self, key: dict, version: str, compute):
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+    def evict(self):
+        """
+        总大小超过上限时，按最近使用时间从旧到新删除条目
+        """
+        entries = []
+        total = 0
+        for file in os.listdir(self.cache_dir):
+            if not file.endswith(".pkl"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, file))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, file))
+            total += st.st_size
+        for _, size, file in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, file))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for file in os.listdir(self.cache_dir):
+            if file.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, file))
+
+    def stats(self) -> dict:
+        sizes = [
+            os.path.getsize(os.path.join(self.cache_dir, f)) for f in os.listdir(self.cache_dir) if f.endswith(".pkl")
+        ]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(sizes),
+                "bytes": sum(sizes),
+                "max_bytes": self.max_bytes,
+            }
+
+# 进程内按目录共享的缓存实例 (保留命中统计)
+_FEATURE_CACHES = {}
+
+def get_feature_cache(cache_dir: str, max_bytes: int = 2 * 1024 ** 3) -> FeatureCache:
+    """
+    获取 (或创建) 指定目录的特征缓存
+    """
+    cache = _FEATURE_CACHES.get(cache_dir)
+    if cache is None:
+        cache = _FEATURE_CACHES[cache_dir] = FeatureCache(cache_dir, max_bytes=max_bytes)
+    return cache
+
+def get_data_version(fields, market=None, instruments=None, provider_uri=None, snapshot_dir=None) -> str:
+    """
+    由日历、股票池文件以及相关 .bin 文件 (及列式快照文件) 的大小与修改时间计算数据版本。
+    convert_data.py 重写或追加任何相关 .bin、或重新导出快照时版本随之变化。
+    :param fields: 字段或表达式列表，如 ["$close", "Ref($close, 1)"]
+    :param market: 股票池名称；与 instruments 二选一
+    :param instruments: 标的代码列表
+    :param provider_uri: 数据目录，默认取当前 qlib 配置
+    :param snapshot_dir: 快照子目录，提供时 (数据从快照读取) 同时计入各字段的快照文件
+    """
+    if provider_uri is None:
+        provider_uri = str(C.dpm.get_data_uri(freq="day"))
+    names = sorted({name.lower() for field in fields for name in re.findall(r"\$(\w+)", field)})
+
+    files = [os.path.join(provider_uri, "calendars", "day.txt")]
+    if market is not None:
+        files.append(os.path.join(provider_uri, "instruments", f"{market}.txt"))
+        instruments = [code for code, _, _ in load_market_spans(market, provider_uri)]
+    for code in sorted(set(instruments or [])):
+        for name in names:
+            files.append(os.path.join(provider_uri, "features", code.lower(), f"{name}.day.bin"))
+    if snapshot_dir is not None:
+        files.extend(os.path.join(provider_uri, snapshot_dir, f"{name}.arrow") for name in names)
+
+    digest = hashlib.sha1()
+    for path in files:
+        try:
+            st = os.stat(path)
+            digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+        except FileNotFoundError:
+            digest.update(f"{path}:missing;".encode("utf-8"))
+    return digest.hexdigest()
+
+def load_features(market, fields, start_time, end_time, cache_dir=None):
+    """
+    带磁盘缓存的 D.features 原子。
+    :param cache_dir: 缓存目录，None 表示不使用缓存
+    """
+    def compute():
+        return D.features(D.instruments(market=market), list(fields), start_time=start_time, end_time=end_time)
+
+    if cache_dir is None:
+        return compute()
+    cache = get_feature_cache(cache_dir)
+    key = {"kind": "features", "market": market, "fields": list(fields), "start": str(start_time), "end": str(end_time)}
+    return cache.get_or_compute(key, get_data_version(fields, market=market), compute)
@@ -1,8 +1,124 @@
+import os
+import time
+import threading
+
+import pandas as pd
 import qlib
 from qlib.config import REG_CN
+from qlib.data import D
+
+from . import mmap_storage
+
+def get_feature_provider_config(storage: str = "file"):
+    """
+    根据存储后端名称生成 qlib 的 feature_provider 配置
+    :param storage: "file" 使用 qlib 默认的文件读取; "mmap" 使用内存映射零拷贝后端
+    """
+    if storage == "file":
+        return "LocalFeatureProvider"
+    if storage == "mmap":
+        return {
+            "class": "LocalFeatureProvider",
+            "module_path": "qlib.data.data",
+            "kwargs": {
+                "backend": {
+                    "class": "MmapFeatureStorage",
+                    "module_path": mmap_storage.__name__,
+                }
+            },
+        }
+    raise ValueError(f"不支持的存储后端: {storage} (可选 'file', 'mmap')")
+
+# 进程级的 qlib 初始化状态: 相同的 (数据目录, 区域, 存储后端, 日历文件版本) 只初始化一次
+_ENV_LOCK = threading.Lock()
+_ENV_STATE = {
+    "key": None,
+    "calendar": None,
+    "instruments": None,
+    "init_count": 0,
+    "reuse_count": 0,
+    "timings": {},
+}
+
+def _calendar_version(provider_uri: str):
+    """
+    日历文件的 (大小, 修改时间)，数据更新 (如 convert_data.py 增量追加) 后需要重新初始化
+    """
+    try:
+        st = os.stat(os.path.join(provider_uri, "calendars", "day.txt"))
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def init_qlib_env(
+    provider_uri: str = "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    storage: str = "file",
+    region: str = REG_CN,
+    force: bool = False
+):
+    """
+    初始化 Qlib 环境 (进程内记忆化)。
+    数据目录、区域、存储后端与日历文件均未变化时直接复用上一次的初始化结果，不再重复 qlib.init；
+    初始化后预加载交易日历与全部标的列表，供 get_env_calendar / get_env_instruments 使用。
+    :param storage: 特征存储后端，"file" 或 "mmap"
+    :param region: qlib 区域，REG_CN 用于控制 100的整数倍（100手起步）
+    :param force: 为 True 时无条件重新初始化
+    """
+    key = (os.path.abspath(os.path.expanduser(provider_uri)), region, storage, _calendar_version(provider_uri))
+    with _ENV_LOCK:
+        if not force and _ENV_STATE["key"] == key:
+            _ENV_STATE["reuse_count"] += 1
+            return
+
+        timings = {}
+        t_start = time.perf_counter()
+        qlib.init(
+            provider_uri=provider_uri,
+            region=region,
+            feature_provider=get_feature_provider_config(storage),
+        )
+        timings["qlib_init"] = time.perf_counter() - t_start
+
+        # 预加载交易日历与标的列表 (同时预热 qlib 自身的日历缓存)
+        t_start = time.perf_counter()
+        calendar = pd.DatetimeIndex(D.calendar(freq="day"))
+        timings["calendar"] = time.perf_counter() - t_start
+        t_start = time.perf_counter()
+        instruments = D.list_instruments(D.instruments("all"), as_list=True)
+        timings["instruments"] = time.perf_counter() - t_start
+
+        _ENV_STATE.update(key=key, calendar=calendar, instruments=instruments, timings=timings)
+        _ENV_STATE["init_count"] += 1
+        print(f"Qlib 环境初始化完成: {provider_uri} ({storage}), "
+              + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()))
+
+def get_env_calendar() -> pd.DatetimeIndex:
+    """
+    获取当前环境预加载的日频交易日历
+    """
+    if _ENV_STATE["calendar"] is None:
+        raise RuntimeError("qlib 环境尚未初始化，请先调用 init_qlib_env")
+    return _ENV_STATE["calendar"]
+
+def get_env_instruments() -> list:
+    """
+    获取当前环境预加载的全部标的列表 (instruments/all.txt)
+    """
+    if _ENV_STATE["instruments"] is None:
+        raise RuntimeError("qlib 环境尚未初始化，请先调用 init_qlib_env")
+    return _ENV_STATE["instruments"]
 
-def init_qlib_env(provider_uri: str = "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"):
+def get_env_init_stats() -> dict:
     """
-    初始化 Qlib 环境
+    获取环境初始化的统计: 当前数据目录、初始化/复用次数与最近一次初始化各步骤耗时 (秒)
     """
-    qlib.init(provider_uri=provider_uri, region=REG_CN) # REG_CN 用于控制 100的整数倍（100手起步）
+    with _ENV_LOCK:
+        key = _ENV_STATE["key"]
+        return {
+            "provider_uri": key[0] if key else None,
+            "region": key[1] if key else None,
+            "storage": key[2] if key else None,
+            "init_count": _ENV_STATE["init_count"],
+            "reuse_count": _ENV_STATE["reuse_count"],
+            "timings": dict(_ENV_STATE["timings"]),
+        }
@@ -0,0 +1,196 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import pandas as pd
+from qlib.backtest.exchange import Exchange
+from qlib.backtest.high_performance_ds import NumpyQuote
+from qlib.config import C
+from qlib.data import D
+
+class QuoteCache:
+    """
+    进程级交易所行情表缓存 (LRU)。
+    缓存项为 (quote_df, trade_w_adj_price, quote)，同一股票池/区间/成交价/涨跌停设置/数据版本的回测直接复用，
+    跳过 D.features 读取与 NumpyQuote 构建。缓存内容在回测中只读。
+    """
+    def __init__(self, max_size: int = 8):
+        """
+        :param max_size: 最多保留的行情表数量
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # key -> (行情表, 是否复权价模式, 行情对象)，按最近使用排序
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key: str, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record(self, kind: str):
+        """
+        记录一次磁盘命中 ("disk_hits") 或未命中 ("misses")
+        """
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_size": self.max_size, "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
+
+# 进程级共享缓存
+QUOTE_CACHE = QuoteCache()
+
+def get_quote_cache_stats() -> dict:
+    """
+    获取交易所行情表缓存的命中统计
+    """
+    return QUOTE_CACHE.stats()
+
+def clear_quote_cache():
+    """
+    清空内存中的交易所行情表缓存
+    """
+    QUOTE_CACHE.clear()
+
+def _data_version(codes, fields, freq: str) -> str:
+    """
+    数据版本: 日历文件，以及 (股票池为列表时) 各标的所用字段 .bin 文件的 (大小, 修改时间)。
+    股票池为 D.instruments 配置时使用对应的 instruments/<market>.txt 代替逐个标的的文件。
+    """
+    data_uri = str(C.dpm.get_data_uri(freq=freq))
+    paths = [os.path.join(data_uri, "calendars", f"{freq}.txt")]
+    if isinstance(codes, dict):
+        paths.append(os.path.join(data_uri, "instruments", f"{codes.get('market', 'all')}.txt"))
+    else:
+        raw_fields = sorted({name for field in fields for name in re.findall(r"\$(\w+)", field)})
+        paths.extend(
+            os.path.join(data_uri, "features", code.lower(), f"{field}.{freq}.bin") for code in codes for field in raw_fields
+        )
+    versions = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            versions.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            versions.append(None)
+    return hashlib.sha1(repr((data_uri, versions)).encode()).hexdigest()
+
+class CachedExchange(Exchange):
+    """
+    带行情表缓存的 qlib Exchange。
+    构建参数与 Exchange 完全相同；行情表 (quote_df 与 NumpyQuote) 先查内存缓存，再查磁盘缓存 (提供 cache_dir 时)，
+    都未命中时按原逻辑从 qlib 读取并写入缓存。使用 extra_quote 时不缓存。
+    """
+    def __init__(self, *args, cache_dir: Optional[str] = None, quote_cls=NumpyQuote, **kwargs):
+        """
+        :param cache_dir: 磁盘缓存目录，None 表示只使用内存缓存
+        """
+        self.cache_dir = cache_dir
+        self._base_quote_cls = quote_cls
+        self._cache_key: Optional[str] = None
+        self._cached_quote = None
+        super().__init__(*args, quote_cls=self._build_quote, **kwargs)
+
+    def _quote_cache_key(self) -> str:
+        codes = self.codes if isinstance(self.codes, dict) else sorted(self.codes)
+        key = (
+            repr(codes), str(pd.Timestamp(self.start_time)) if self.start_time is not None else None,
+            str(pd.Timestamp(self.end_time)) if self.end_time is not None else None, self.freq,
+            sorted(self.all_fields), self.buy_price, self.sell_price, repr(self.limit_threshold),
+            self._base_quote_cls.__name__, _data_version(codes, self.all_fields, self.freq),
+        )
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, f"quote_{key}.pkl") if self.cache_dir else None
+
+    def get_quote_from_qlib(self) -> None:
+        if self.extra_quote is not None:
+            return super().get_quote_from_qlib()
+        if len(self.codes) == 0:
+            self.codes = D.instruments()
+        key = self._quote_cache_key()
+
+        # 1. 内存缓存
+        entry = QUOTE_CACHE.get(key)
+        # 2. 磁盘缓存
+        path = self._disk_path(key)
+        if entry is None and path and os.path.exists(path):
+            try:
+                entry = pd.read_pickle(path)
+            except Exception as e:
+                print(f"警告: 读取行情缓存 {path} 失败 ({e})，重新构建")
+            else:
+                QUOTE_CACHE.put(key, entry)
+                QUOTE_CACHE.record("disk_hits")
+        if entry is not None:
+            self.quote_df, self.trade_w_adj_price, self._cached_quote = entry
+            return
+
+        # 3. 未命中: 按原逻辑读取，NumpyQuote 构建完成后 (_build_quote) 写入缓存
+        QUOTE_CACHE.record("misses")
+        super().get_quote_from_qlib()
+        self._cache_key = key
+
+    def _build_quote(self, quote_df: pd.DataFrame, freq: str):
+        if self._cached_quote is not None:
+            return self._cached_quote
+        quote = self._base_quote_cls(quote_df, freq)
+        if self._cache_key is not None:
+            entry = (quote_df, self.trade_w_adj_price, quote)
+            QUOTE_CACHE.put(self._cache_key, entry)
+            path = self._disk_path(self._cache_key)
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                pd.to_pickle(entry, tmp_path)
+                os.replace(tmp_path, path)
+        return quote
+
+def create_cached_exchange(start_time, end_time, codes="all", cache_dir: Optional[str] = None, **exchange_kwargs) -> CachedExchange:
+    """
+    创建带行情缓存的交易所原子 (参数默认值与 qlib.backtest.get_exchange 一致)
+    :param codes: 交易所加载的股票池: 标的列表或 qlib 股票池名称
+    :param cache_dir: 磁盘缓存目录，None 表示只使用内存缓存
+    """
+    if exchange_kwargs.get("limit_threshold") is None:
+        exchange_kwargs["limit_threshold"] = C.limit_threshold
+    exchange_kwargs.setdefault("freq", "day")
+    exchange_kwargs.setdefault("open_cost", 0.0015)
+    exchange_kwargs.setdefault("close_cost", 0.0025)
+    exchange_kwargs.setdefault("min_cost", 5.0)
+    if isinstance(codes, str):
+        codes = D.instruments(codes)
+    return CachedExchange(start_time=start_time, end_time=end_time, codes=codes, cache_dir=cache_dir, **exchange_kwargs)
+
+def exchange_price_panel(exchange: Exchange, field: str = "$close") -> pd.DataFrame:
+    """
+    交易所已加载的行情 (quote_df) 转为 date × instrument 宽表，供报告绘图复用而不再读取磁盘
+    """
+    return exchange.quote_df[field].unstack(level="instrument")
@@ -0,0 +1,333 @@
+import random
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from qlib.backtest.report import PortfolioMetrics
+from qlib.config import C
+from qlib.data import D
+
+from .strategy_pool import PositionView, create_permanent_strategy
+
+# 与 qlib PortfolioMetrics.generate_portfolio_metrics_dataframe 相同的列及顺序
+REPORT_COLUMNS = ["account", "return", "total_turnover", "turnover", "total_cost", "cost", "value", "cash", "bench"]
+
+def _isclose(a: float, b: float) -> bool:
+    """
+    标量版 np.isclose (rtol=1e-5, atol=1e-8)
+    """
+    return abs(a - b) <= 1e-8 + 1e-5 * abs(b)
+
+def _deal_price_fields(deal_price: Union[str, Tuple[str, str], List[str], None]) -> Tuple[str, str]:
+    """
+    与 qlib Exchange 相同的成交价字段解析，返回 (买入价字段, 卖出价字段)
+    """
+    if deal_price is None:
+        deal_price = C.deal_price
+    if isinstance(deal_price, str):
+        if deal_price[0] != "$":
+            deal_price = "$" + deal_price
+        return deal_price, deal_price
+    buy_price, sell_price = deal_price
+    return buy_price, sell_price
+
+def load_market_data(
+    codes: List[str],
+    start_time,
+    end_time,
+    benchmark: Union[str, List[str], None] = "SH000300",
+    deal_price: Union[str, Tuple[str, str], None] = None,
+    limit_threshold: Union[float, Tuple[str, str], None] = None
+) -> Dict[str, Any]:
+    """
+    一次性加载快速回测引擎所需的行情，整理为 date × code 的稠密数组。
+    字段与涨跌停/停牌判定与 qlib Exchange 一致，结果可在多次回测之间只读共享。
+    :param codes: 标的列表 (cash 伪资产会被忽略)
+    :param benchmark: 基准代码 (或代码列表，取平均日收益)，None 表示不计算基准
+    :param deal_price: 成交价字段，默认取 qlib 配置 (通常为 $close)
+    :param limit_threshold: 涨跌停阈值 (float) 或 (买入限制表达式, 卖出限制表达式)，默认取 qlib 配置
+    :return: 包含 dates, codes, close, buy_price, sell_price, factor, limit_buy, limit_sell, bench, trade_w_adj_price 的字典
+    """
+    codes = list(dict.fromkeys(code for code in codes if code != 'cash'))
+    buy_field, sell_field = _deal_price_fields(deal_price)
+    if limit_threshold is None:
+        limit_threshold = C.limit_threshold
+    limit_fields = list(limit_threshold) if isinstance(limit_threshold, tuple) else []
+    fields = list(dict.fromkeys([buy_field, sell_field, "$close", "$change", "$factor"] + limit_fields))
+
+    dates = pd.DatetimeIndex(D.calendar(start_time=start_time, end_time=end_time, freq="day"))
+    # 1. 读取行情并透视为 date × code (缺失行为 NaN，与 qlib 中查询不到数据同样视为停牌)
+    panel = {field: np.full((len(dates), len(codes)), np.nan, dtype=np.float32) for field in fields}
+    if codes:
+        df = D.features(codes, fields, start_time, end_time, freq="day")
+        if not df.empty:
+            df.columns = fields
+            for field in fields:
+                wide = df[field].unstack(level="instrument").reindex(index=dates, columns=codes)
+                panel[field] = wide.to_numpy(dtype=np.float32)
+
+    # 2. 停牌与涨跌停 (比较在 float32 上进行，与 qlib 对 quote_df 的比较一致)
+    close32 = panel["$close"]
+    suspended = np.isnan(close32)
+    if limit_threshold is None:
+        limit_buy, limit_sell = suspended.copy(), suspended.copy()
+    elif isinstance(limit_threshold, tuple):
+        limit_buy = panel[limit_threshold[0]].astype(bool) | suspended
+        limit_sell = panel[limit_threshold[1]].astype(bool) | suspended
+    else:
+        change = panel["$change"]
+        limit_buy = (change >= limit_threshold) | suspended
+        limit_sell = (change <= -limit_threshold) | suspended
+
+    # 3. 成交价: 缺失或非正时退回收盘价
+    close = close32.astype(np.float64)
+    def deal_prices(field):
+        price = panel[field].astype(np.float64)
+        with np.errstate(invalid="ignore"):
+            invalid = np.isnan(price) | (price <= 1e-08)
+        return np.where(invalid, close, price)
+
+    factor32 = panel["$factor"]
+    # 4. 基准日收益 (与 qlib PortfolioMetrics 相同的计算与 float32 精度)
+    bench = None
+    if benchmark is not None:
+        bench_series = PortfolioMetrics._cal_benchmark(
+            {"benchmark": benchmark, "start_time": start_time, "end_time": end_time}, "day"
+        )
+        # 与 resam_ts_data + cal_change 相同: (x + 1).prod() - 1，缺失日期为 0.0
+        present = dates.isin(bench_series.index)
+        values = ((bench_series.reindex(dates) + 1) - 1).to_numpy()
+        bench = [value if ok else 0.0 for value, ok in zip(values, present)]
+
+    return {
+        "dates": dates,
+        "codes": codes,
+        "close": close,
+        "buy_price": deal_prices(buy_field),
+        "sell_price": deal_prices(sell_field),
+        "factor": factor32.astype(np.float64),
+        "suspended": suspended,
+        "limit_buy": limit_buy,
+        "limit_sell": limit_sell,
+        "bench": bench,
+        # 存在收盘价但缺少复权因子时，qlib 以复权价交易且不按交易单位取整
+        "trade_w_adj_price": bool((np.isnan(factor32) & ~suspended).any()),
+    }
+
+def market_price_panel(market: Dict[str, Any], field: str = "close") -> pd.DataFrame:
+    """
+    快速引擎行情 (load_market_data 的结果) 转为 date × code 宽表，供报告绘图复用而不再读取磁盘
+    """
+    return pd.DataFrame(market[field], index=market["dates"], columns=market["codes"])
+
+def run_fast_backtest(
+    market: Dict[str, Any],
+    asset_weights: Dict[str, float],
+    rebalance_freq: str = "month",
+    min_weight: float = 0.15,
+    max_weight: float = 0.35,
+    asset_groups: Optional[Dict[str, List[str]]] = None,
+    internal_weight_threshold: float = 0.1,
+    account: float = 100000000,
+    exchange_kwargs: Optional[Dict[str, Any]] = None,
+    start_time=None,
+    end_time=None
+) -> Tuple[pd.DataFrame, Dict[pd.Timestamp, dict]]:
+    """
+    固定权重组合的纯 NumPy 快速回测引擎原子。
+    在 load_market_data 的数组上逐日模拟 PermanentPortfolioStrategy + OrderGenWOInteract + SimulatorExecutor:
+    再平衡判断直接复用策略本身，下单、交易单位取整、手续费 (open_cost/close_cost/min_cost)、
+    现金约束、涨跌停与停牌判定均与 qlib 一致。
+    :param market: load_market_data 的返回值
+    :param exchange_kwargs: 与 qlib 回测相同的交易所参数 (open_cost, close_cost, min_cost, trade_unit)；
+                            行情相关参数 (deal_price, limit_threshold) 在 load_market_data 中生效
+    :param start_time: 回测起始日，默认使用行情的全部日期
+    :param end_time: 回测结束日
+    :return: (report_normal, positions)，report_normal 的列与 qlib 相同；positions 为 {日期: 持仓字典}
+    """
+    exchange_kwargs = exchange_kwargs or {}
+    if exchange_kwargs.get("impact_cost") or exchange_kwargs.get("volume_threshold"):
+        raise ValueError("快速回测引擎不支持 impact_cost 与 volume_threshold")
+    open_cost = exchange_kwargs.get("open_cost", 0.0015)
+    close_cost = exchange_kwargs.get("close_cost", 0.0025)
+    min_cost = exchange_kwargs.get("min_cost", 5.0)
+    trade_unit = exchange_kwargs.get("trade_unit", C.trade_unit)
+    round_by_unit = not market["trade_w_adj_price"] and trade_unit is not None
+
+    strategy = create_permanent_strategy(
+        asset_weights=asset_weights,
+        rebalance_freq=rebalance_freq,
+        min_weight=min_weight,
+        max_weight=max_weight,
+        asset_groups=asset_groups,
+        internal_weight_threshold=internal_weight_threshold
+    )
+    risk_degree = strategy.get_risk_degree()
+
+    # 1. 截取回测区间 (step 0 的预测日不在行情区间内，与 qlib 一致视为不可交易)
+    dates = market["dates"]
+    lo = 0 if start_time is None else dates.searchsorted(pd.Timestamp(start_time))
+    hi = len(dates) if end_time is None else dates.searchsorted(pd.Timestamp(end_time), side="right")
+    dates = dates[lo:hi]
+    codes = market["codes"]
+    index = {code: i for i, code in enumerate(codes)}
+    close = market["close"][lo:hi].tolist()
+    buy_price = market["buy_price"][lo:hi].tolist()
+    sell_price = market["sell_price"][lo:hi].tolist()
+    factor = market["factor"][lo:hi].tolist()
+    suspended = market["suspended"][lo:hi].tolist()
+    limit_buy = market["limit_buy"][lo:hi].tolist()
+    limit_sell = market["limit_sell"][lo:hi].tolist()
+    tradable = (~(market["limit_buy"][lo:hi] | market["limit_sell"][lo:hi])).tolist()
+    bench = market["bench"][lo:hi] if market["bench"] is not None else [None] * len(dates)
+
+    def round_amount(amount, f):
+        if round_by_unit:
+            return (amount * f + 0.1) // trade_unit * trade_unit / f
+        return amount
+
+    # 2. 账户状态: 持仓字典保持与 qlib Position 相同的插入顺序，以复现其市值求和顺序
+    cash = float(account)
+    holdings: Dict[str, List[float]] = {}  # code -> [amount, price, count]
+    total_turnover = total_cost = 0.0
+    last_account_value, last_total_cost, last_total_turnover = cash, 0.0, 0.0
+
+    def stock_list():
+        return list(set(["cash", "now_account_value", *holdings]) - {"cash", "now_account_value", "cash_delay"})
+
+    def stock_value(order):
+        value = 0
+        for code in order:
+            item = holdings[code]
+            value += item[0] * item[1]
+        return value
+
+    report = {column: [] for column in REPORT_COLUMNS}
+    positions: Dict[pd.Timestamp, dict] = {}
+    for t, date in enumerate(dates):
+        # 3. 策略决策 (复用 PermanentPortfolioStrategy 的再平衡判断)
+        raw = {"cash": cash, "now_account_value": 0.0}
+        for code, item in holdings.items():
+            raw[code] = {"amount": item[0], "price": item[1]}
+        target = strategy.generate_target_weight_position(trade_start_time=date, current=PositionView(raw))
+
+        if target is not None:
+            # 4. 目标权重 -> 目标数量 (OrderGenWOInteract)
+            risk_total_value = risk_degree * (stock_value(stock_list()) + cash)
+            amount_dict = {}
+            for code in target:
+                i = index.get(code)
+                if i is not None and tradable[t][i] and t > 0 and tradable[t - 1][i]:
+                    amount_dict[code] = risk_total_value * target[code] / close[t - 1][i]
+                elif code in holdings:
+                    amount_dict[code] = risk_total_value * target[code] / holdings[code][1]
+
+            # 5. 目标数量 -> 订单 (Exchange.generate_order_for_target_amount_position)
+            sorted_ids = sorted(set(list(holdings) + list(amount_dict)))
+            random.Random(0).shuffle(sorted_ids)
+            sell_orders, buy_orders = [], []
+            for code in sorted_ids:
+                i = index.get(code)
+                if i is None or not tradable[t][i]:
+                    continue
+                target_amount = amount_dict.get(code, 0)
+                current_amount = holdings[code][0] if code in holdings else 0
+                if current_amount == target_amount:
+                    continue
+                if current_amount < target_amount:
+                    sell_amount, buy_amount = 0, round_amount(target_amount - current_amount, factor[t][i])
+                elif target_amount == 0:
+                    sell_amount, buy_amount = current_amount, 0
+                else:
+                    sell_amount, buy_amount = round_amount(current_amount - target_amount, factor[t][i]), 0
+                if buy_amount > 0:
+                    buy_orders.append((code, i, buy_amount))
+                elif sell_amount > 0:
+                    sell_orders.append((code, i, sell_amount))
+
+            # 6. 逐笔成交 (SimulatorExecutor 串行模式: 先卖后买)
+            for code, i, deal_amount in sell_orders:
+                if limit_sell[t][i]:
+                    continue
+                price = sell_price[t][i]
+                current_amount = holdings[code][0] if code in holdings else 0
+                if not _isclose(deal_amount, current_amount):
+                    deal_amount = round_amount(min(current_amount, deal_amount), factor[t][i])
+                if cash + deal_amount * price < max(deal_amount * price * close_cost, min_cost):
+                    deal_amount = 0
+                trade_val = deal_amount * price
+                if trade_val <= 1e-5:
+                    continue
+                cost = max(trade_val * close_cost, min_cost)
+                trade_amount = trade_val / price
+                total_turnover += trade_val
+                total_cost += cost
+                item = holdings[code]
+                if _isclose(item[0], trade_amount):
+                    del holdings[code]
+                else:
+                    item[0] -= trade_amount
+                cash += trade_val - cost
+
+            for code, i, deal_amount in buy_orders:
+                if limit_buy[t][i]:
+                    continue
+                price = buy_price[t][i]
+                trade_val = deal_amount * price
+                if cash < max(trade_val * open_cost, min_cost):
+                    deal_amount = 0
+                elif cash < trade_val + max(trade_val * open_cost, min_cost):
+                    max_buy_amount = 0.0
+                    if cash >= min_cost:
+                        if cash >= min_cost / open_cost + min_cost:
+                            max_buy_amount = cash / (1 + open_cost) / price
+                        else:
+                            max_buy_amount = (cash - min_cost) / price
+                    deal_amount = round_amount(min(max_buy_amount, deal_amount), factor[t][i])
+                else:
+                    deal_amount = round_amount(deal_amount, factor[t][i])
+                trade_val = deal_amount * price
+                if trade_val <= 1e-5:
+                    continue
+                cost = max(trade_val * open_cost, min_cost)
+                trade_amount = trade_val / price
+                if code in holdings:
+                    holdings[code][0] += trade_amount
+                else:
+                    holdings[code] = [trade_amount, price, 0]
+                cash -= trade_val + cost
+                total_turnover += trade_val
+                total_cost += cost
+
+        # 7. 收盘结算: 更新价格与持有天数，记录账户指标
+        for code, item in holdings.items():
+            i = index[code]
+            if not suspended[t][i]:
+                item[1] = close[t][i]
+            item[2] += 1
+        order = stock_list()
+        now_stock_value = stock_value(order)
+        now_account_value = now_stock_value + cash
+        now_cost = total_cost - last_total_cost
+        report["account"].append(now_account_value)
+        report["return"].append((now_account_value - last_account_value + now_cost) / last_account_value)
+        report["total_turnover"].append(total_turnover)
+        report["turnover"].append((total_turnover - last_total_turnover) / last_account_value)
+        report["total_cost"].append(total_cost)
+        report["cost"].append(now_cost / last_account_value)
+        report["value"].append(now_stock_value)
+        report["cash"].append(cash)
+        report["bench"].append(bench[t])
+        last_account_value, last_total_cost, last_total_turnover = now_account_value, total_cost, total_turnover
+
+        position = {"cash": cash, "now_account_value": now_account_value}
+        for code, item in holdings.items():
+            position[code] = {
+                "amount": item[0], "price": item[1],
+                "weight": item[0] * item[1] / now_account_value, "count_day": item[2]
+            }
+        positions[date] = position
+
+    report_normal = pd.DataFrame({column: pd.Series(values, index=dates) for column, values in report.items()})
+    report_normal.index.name = "datetime"
+    return report_normal, positions
@@ -0,0 +1,213 @@
+import copy
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import qlib
+from qlib.backtest import get_strategy_executor
+from qlib.backtest.decision import Order
+from qlib.backtest.executor import NestedExecutor
+from qlib.data import D
+
+from .checkpoint import load_checkpoint, save_checkpoint, capture_state, apply_state, checkpoint_fingerprint
+from .backtest_executor import prepare_exchange_kwargs
+
+def _orders_frame(records) -> pd.DataFrame:
+    """
+    将各交易日的执行结果 [(date, [(order, trade_val, trade_cost, trade_price), ...]), ...] 整理为订单表
+    """
+    rows = [
+        {
+            "datetime": date,
+            "instrument": order.stock_id,
+            "direction": "sell" if order.direction == Order.SELL else "buy",
+            "amount": order.amount,
+            "deal_amount": order.deal_amount,
+            "factor": order.factor,
+            "trade_price": trade_price,
+            "trade_value": trade_val,
+            "trade_cost": trade_cost,
+        }
+        for date, execute_result in records
+        for order, trade_val, trade_cost, trade_price in execute_result
+    ]
+    columns = ["datetime", "instrument", "direction", "amount", "deal_amount", "factor", "trade_price", "trade_value", "trade_cost"]
+    return pd.DataFrame(rows, columns=columns)
+
+# 已验证 extend_step_calendar 所依赖的 TradeCalendarManager 内部实现的 qlib 版本 (见 scripts/check_live_step.py)
+CALENDAR_PATCH_QLIB_VERSIONS = ("0.9.",)
+
+def extend_step_calendar(trade_calendar) -> bool:
+    """
+    为实盘最新交易日补齐交易步骤的右端点。
+    qlib 以下一个交易日作为每个交易步骤的右端点 (TradeCalendarManager.get_step_time 读取私有数组 _calendar[index + 1])，
+    最新一天的数据 (没有 day_future.txt 时) 之后没有日历项。此时在执行器自己的日历副本末尾补一个下一工作日作为右端点
+    (只用于界定步骤区间，不读取该日数据；qlib 全局的日历缓存不受影响)。
+    依赖 qlib 的私有实现: 内部结构不符合时报错，版本不在 CALENDAR_PATCH_QLIB_VERSIONS 中时给出警告。
+    :param trade_calendar: 执行器的 TradeCalendarManager
+    :return: 是否补齐了日历
+    """
+    calendar = getattr(trade_calendar, "_calendar", None)
+    if not isinstance(calendar, np.ndarray) or not isinstance(getattr(trade_calendar, "end_index", None), (int, np.integer)):
+        raise RuntimeError(f"qlib {qlib.__version__} 的 TradeCalendarManager 内部结构已变化，无法补齐实盘交易步骤的右端点")
+    if not qlib.__version__.startswith(CALENDAR_PATCH_QLIB_VERSIONS):
+        print(f"警告: 实盘日历补齐只在 qlib {CALENDAR_PATCH_QLIB_VERSIONS} 上验证过，当前为 {qlib.__version__}，"
+              f"请运行 scripts/check_live_step.py 确认")
+    if trade_calendar.end_index + 1 < len(calendar):
+        return False
+    next_day = pd.Timestamp(calendar[-1]) + pd.offsets.BDay(1)
+    trade_calendar._calendar = np.append(calendar, np.array([next_day], dtype=calendar.dtype))
+    return True
+
+def _new_metrics_frame(portfolio_metrics, start_time) -> pd.DataFrame:
+    """
+    只取 start_time 之后新增交易日的组合指标 (与 generate_portfolio_metrics_dataframe 的列一致，不重建全部历史)
+    """
+    new_dates = [date for date in portfolio_metrics.accounts if date >= start_time]
+    columns = {
+        "account": "accounts", "return": "returns", "total_turnover": "total_turnovers", "turnover": "turnovers",
+        "total_cost": "total_costs", "cost": "costs", "value": "values", "cash": "cashes", "bench": "benches",
+    }
+    frame = pd.DataFrame({
+        column: pd.Series([getattr(portfolio_metrics, name)[date] for date in new_dates], index=new_dates)
+        for column, name in columns.items()
+    })
+    frame.index.name = "datetime"
+    return frame
+
+def _position_account(position: dict, prev_day: pd.Timestamp) -> dict:
+    """
+    将持久化的持仓 {"cash": 现金, 代码: 数量 或 {"amount": 数量, "price": 价格}} 转为 qlib 账户配置。
+    未给出价格的标的使用截至上一交易日的最新收盘价 (与完整回测中当日决策所见的持仓估值一致)。
+    """
+    position = copy.deepcopy(position)
+    cash = position.pop("cash", 0.0)
+    holding = {code: value if isinstance(value, dict) else {"amount": value} for code, value in position.items()}
+    missing = [code for code, value in holding.items() if value.get("price") is None]
+    if missing:
+        # 最近 30 天内最后一个有效收盘价 (停牌日跳过)，与回测中持仓价格的更新方式一致
+        close = D.features(missing, ["$close"], prev_day - pd.Timedelta(days=30), prev_day, freq="day")["$close"].dropna()
+        last_close = close.groupby(level="instrument").last()
+        lack = set(missing) - set(last_close.index)
+        if lack:
+            raise ValueError(f"{lack} 在 {prev_day.date()} 之前 30 天内没有收盘价")
+        for code in missing:
+            holding[code]["price"] = float(last_close[code])
+    return {"cash": cash, **holding}
+
+def run_live_step(
+    strategy,
+    executor,
+    trade_date=None,
+    checkpoint_path: Optional[str] = None,
+    position: Optional[dict] = None,
+    strategy_state: Optional[dict] = None,
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs: Optional[dict] = None,
+    codes=None,
+    quote_cache_dir: Optional[str] = None,
+    save: bool = True,
+) -> Optional[dict]:
+    """
+    实盘 (增量) 模式原子: 只对新的交易日做出调仓决策，不重放历史。
+    状态来源二选一:
+    - checkpoint_path: 完整回测/上次实盘保存的断点，依次处理断点之后到 trade_date 的所有交易日 (通常只有 1 天)，
+      结果与完整回测逐位一致，并 (save=True 时) 写回断点供下一个交易日使用
+    - position: 持久化的当前持仓 (数量与回测持仓的单位相同)，配合 strategy_state (如 {"last_rebalance_date": ...})，
+      只处理 trade_date 当天。持仓视为已完成初始建仓: month/year 频率必须给出 last_rebalance_date，
+      day 频率未给出时取上一交易日 (只表示不是第一次运行，按偏离度判断是否再平衡)
+    :param trade_date: 决策日期，默认取交易日历的最后一天 (convert_data.py 追加的最新数据)
+    :param account: 初始资金，须与生成断点的回测一致 (计入断点指纹)
+    :param codes: 交易所加载行情的股票池 (标的列表)
+    :return: {"date", "orders" (订单表), "rebalance" (trade_date 当天是否下单), "position", "strategy_state", "report"}，
+             断点已包含 trade_date 时返回 None
+    """
+    # 1. 确定需要处理的交易日
+    if checkpoint_path and position is not None:
+        raise ValueError("checkpoint_path 与 position 只能二选一")
+    calendar = D.calendar(freq="day")
+    trade_date = calendar[-1] if trade_date is None else pd.Timestamp(trade_date)
+    if trade_date not in calendar:
+        raise ValueError(f"{trade_date.date()} 不是交易日或数据尚未更新")
+    state = None
+    if checkpoint_path:
+        state = load_checkpoint(checkpoint_path)
+        if state is None:
+            raise ValueError(f"找不到可用的断点 {checkpoint_path}，请先运行带断点的完整回测")
+        if state["step_date"] >= trade_date:
+            print(f"断点已包含 {trade_date.date()} (已处理至 {state['step_date'].date()})，无需重新计算")
+            return None
+        start_time = calendar[calendar.searchsorted(state["step_date"], side="right")]
+    elif position is not None:
+        start_time = trade_date
+        prev_days = calendar[calendar < trade_date]
+        if len(prev_days) == 0:
+            raise ValueError(f"{trade_date.date()} 之前没有交易日，无法为持仓估值")
+    else:
+        raise ValueError("实盘模式需要 checkpoint_path 或 position")
+
+    # 2. 仅在待处理区间上创建交易所/策略/执行器，并恢复状态
+    exchange_kwargs, checkpoint_meta = prepare_exchange_kwargs(
+        start_time, trade_date, exchange_kwargs, benchmark=benchmark, account=account,
+        codes=codes, quote_cache_dir=quote_cache_dir
+    )
+    if position is not None:
+        account = _position_account(position, prev_days[-1])
+    trade_strategy, trade_executor = get_strategy_executor(
+        start_time, trade_date, strategy, executor, benchmark, account, exchange_kwargs
+    )
+    if isinstance(trade_executor, NestedExecutor):
+        raise ValueError("实盘模式仅支持单层执行器 (SimulatorExecutor)")
+    trade_executor.reset(start_time=start_time, end_time=trade_date)
+    extend_step_calendar(trade_executor.trade_calendar)
+    trade_strategy.reset(level_infra=trade_executor.get_level_infra())
+    if state is not None:
+        if checkpoint_fingerprint(state["first_step"], trade_strategy, **checkpoint_meta) != state["fingerprint"]:
+            raise ValueError(f"断点 {checkpoint_path} 与当前策略/账户/交易所设置不一致")
+        apply_state(state, trade_strategy, trade_executor)
+    else:
+        # 持仓模式: 以持仓在上一交易日的市值作为收益计算的基数
+        trade_executor.trade_account.init_cash = trade_executor.trade_account.current_position.calculate_value()
+    if state is None and hasattr(trade_strategy, "set_checkpoint_state"):
+        # 上次再平衡日期为空时策略会当作第一次运行直接按目标权重建仓，持仓模式下必须避免
+        strategy_state = dict(strategy_state or {})
+        if strategy_state.get("last_rebalance_date") is None:
+            if getattr(trade_strategy, "rebalance_freq", None) in ("month", "year"):
+                raise ValueError("使用 position 时 month/year 再平衡频率需要提供上次再平衡日期 last_rebalance_date")
+            strategy_state["last_rebalance_date"] = prev_days[-1]
+        trade_strategy.set_checkpoint_state({
+            key: pd.Timestamp(value) if key.endswith("_date") and value is not None else value
+            for key, value in strategy_state.items()
+        })
+
+    # 3. 逐日决策并撮合
+    records = []
+    execute_result = None
+    while not trade_executor.finished():
+        step_date = trade_executor.trade_calendar.get_step_time()[0]
+        trade_decision = trade_strategy.generate_trade_decision(execute_result)
+        return_value: dict = {}
+        for _ in trade_executor.collect_data(trade_decision, return_value=return_value, level=0):
+            pass
+        execute_result = return_value.get("execute_result")
+        trade_strategy.post_exe_step(execute_result)
+        records.append((step_date, execute_result))
+    trade_strategy.post_upper_level_exe_step()
+
+    # 4. 写回断点
+    if state is not None and save:
+        save_checkpoint(checkpoint_path, capture_state(trade_strategy, trade_executor, state["fingerprint"], state["first_step"]))
+
+    account_obj = trade_executor.trade_account
+    get_strategy_state = getattr(trade_strategy, "get_checkpoint_state", None)
+    report = _new_metrics_frame(account_obj.portfolio_metrics, start_time) if account_obj.is_port_metr_enabled() else None
+    orders = _orders_frame(records)
+    return {
+        "date": trade_date,
+        "orders": orders,
+        "rebalance": bool((orders["datetime"] == trade_date).any()),
+        "position": copy.deepcopy(account_obj.current_position.position),
+        "strategy_state": get_strategy_state() if get_strategy_state else None,
+        "report": report,
+    }
@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+from qlib.data.storage.file_storage import FileFeatureStorage
+
+def default_cache_size() -> int:
+    """
+    默认缓存容量: 每个映射占用一个文件描述符，取进程文件描述符上限的一半 (最多 4096)
+    """
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):
+        return 512
+    if soft == resource.RLIM_INFINITY:
+        return 4096
+    return max(64, min(4096, soft // 2))
+
+class MmapCache:
+    """
+    进程级 .bin 内存映射缓存 (LRU)。
+    每个文件只映射一次；文件大小或修改时间变化 (如 convert_data.py 追加数据) 时自动重新映射。
+    返回的数组 (及 MmapFeatureStorage 切片得到的 Series) 直接引用映射内存，因此要求写入方
+    只以临时文件 + os.replace 整体替换 .bin (convert_data.py 的全量、追加与改写文件头均如此)，
+    不得原地截断或改写: 已映射的旧文件在替换后保持完整，而原地截断会使读取被截断的页触发 SIGBUS。
+    """
+    def __init__(self, max_size: int = None):
+        """
+        :param max_size: 最多同时保持的映射数量 (每个映射占用一个文件描述符)，默认见 default_cache_size
+        """
+        self.max_size = max_size or default_cache_size()
+        self.hits = 0
+        self.misses = 0
+        self._maps: "OrderedDict[str, Tuple[Tuple[int, int], np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> np.ndarray:
+        """
+        返回文件内容的只读 float32 数组 (第 0 个元素为 start_index)
+        """
+        st = os.stat(path)
+        version = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._maps.get(path)
+            if entry is not None and entry[0] == version:
+                self._maps.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+
+        if st.st_size < 4:
+            data = np.empty(0, dtype="<f4")
+        else:
+            # np.asarray 去掉 memmap 子类，得到引用映射内存的普通只读数组
+            data = np.asarray(np.memmap(path, dtype="<f4", mode="r"))
+        with self._lock:
+            self.misses += 1
+            self._maps[path] = (version, data)
+            self._maps.move_to_end(path)
+            while len(self._maps) > self.max_size:
+                self._maps.popitem(last=False)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._maps.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"maps": len(self._maps), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+# 进程级共享缓存
+MMAP_CACHE = MmapCache()
+
+def set_mmap_cache_size(max_size: int):
+    """
+    调整内存映射缓存的容量
+    """
+    MMAP_CACHE.max_size = max_size
+
+def get_mmap_cache_stats() -> dict:
+    """
+    获取内存映射缓存的命中统计
+    """
+    return MMAP_CACHE.stats()
+
+class MmapFeatureStorage(FileFeatureStorage):
+    """
+    基于内存映射的特征存储后端。
+    与 FileFeatureStorage 读取同样的 .bin 文件，但每个文件在进程内只映射一次，
+    按日期区间查询时直接返回映射内存上的零拷贝切片 (只读)。
+    """
+    def _data(self) -> np.ndarray:
+        self.check()
+        return MMAP_CACHE.get(str(self.uri))
+
+    @property
+    def start_index(self) -> Union[int, None]:
+        if not self.uri.exists():
+            return None
+        data = self._data()
+        return int(data[0]) if len(data) else None
+
+    @property
+    def end_index(self) -> Union[int, None]:
+        if not self.uri.exists():
+            return None
+        return self.start_index + len(self) - 1
+
+    def __len__(self) -> int:
+        return max(len(self._data()) - 1, 0)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Tuple[int, float], pd.Series]:
+        if not self.uri.exists():
+            if isinstance(i, int):
+                return None, None
+            elif isinstance(i, slice):
+                return pd.Series(dtype=np.float32)
+            else:
+                raise TypeError(f"type(i) = {type(i)}")
+
+        data = self._data()
+        if len(data) < 2:
+            return (None, None) if isinstance(i, int) else pd.Series(dtype=np.float32)
+        storage_start_index = int(data[0])
+        storage_end_index = storage_start_index + len(data) - 2
+        if isinstance(i, int):
+            if not storage_start_index <= i <= storage_end_index:
+                raise IndexError(f"{i}: index range is [{storage_start_index}, {storage_end_index}]")
+            return i, float(data[i - storage_start_index + 1])
+        elif isinstance(i, slice):
+            start_index = storage_start_index if i.start is None else i.start
+            end_index = storage_end_index if i.stop is None else i.stop - 1
+            si = max(start_index, storage_start_index)
+            ei = min(end_index, storage_end_index)
+            if si > ei:
+                return pd.Series(dtype=np.float32)
+            values = data[si - storage_start_index + 1 : ei - storage_start_index + 2]
+            return pd.Series(values, index=pd.RangeIndex(si, si + len(values)), copy=False)
+        else:
+            raise TypeError(f"type(i) = {type(i)}")
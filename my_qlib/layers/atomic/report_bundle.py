@@ -0,0 +1,148 @@
+import os
+import html
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+# 参与降采样的折线类图形
+_LINE_TRACE_TYPES = {"scatter", "scattergl"}
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    LTTB (Largest-Triangle-Three-Buckets) 降采样，返回保留点的下标。
+    保留首尾点，中间每个桶选出与前一个保留点、下一个桶均值构成三角形面积最大的点，折线形状 (峰谷) 得以保留。
+    :param x: 数值型横坐标 (单调递增)
+    :param y: 纵坐标
+    :param threshold: 保留的点数
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # 中间 n - 2 个点均分到 threshold - 2 个桶
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.intp) + 1
+    edges[-1] = n - 1
+    # 各桶的均值与所选点无关，一次性计算；最后一个桶的 "下一桶" 为末尾点
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / counts, y[-1])
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def _numeric_x(x) -> np.ndarray:
+    """
+    横坐标转为数值 (日期转为纳秒时间戳，类别型横坐标按位置等距处理)
+    """
+    arr = np.asarray(x)
+    if arr.dtype.kind in "iuf":
+        return arr.astype(np.float64)
+    try:
+        return pd.DatetimeIndex(pd.to_datetime(arr)).asi8.astype(np.float64)
+    except (ValueError, TypeError):
+        return np.arange(len(arr), dtype=np.float64)
+
+def downsample_figure(fig, max_points: int = 2000):
+    """
+    对图中点数超过 max_points 的折线 (scatter) 做 LTTB 降采样 (只影响显示)。
+    :param fig: plotly Figure 或图形字典 ({"data": [...], "layout": {...}})
+    :return: (降采样后的图形字典, {trace 名称: 原始数据 DataFrame})，未降采样时原始数据为空字典
+    """
+    fig = fig.to_dict() if isinstance(fig, go.Figure) else fig
+    data, raw = [], {}
+    for i, trace in enumerate(fig.get("data", [])):
+        y = trace.get("y")
+        if trace.get("type", "scatter") not in _LINE_TRACE_TYPES or y is None or len(y) <= max_points:
+            data.append(trace)
+            continue
+        y = np.asarray(y, dtype=np.float64)
+        x = np.arange(len(y)) if trace.get("x") is None else np.asarray(trace["x"])
+        finite = np.flatnonzero(np.isfinite(y))
+        keep = finite[lttb_indices(_numeric_x(x[finite]), y[finite], max_points)]
+        raw[trace.get("name") or f"trace_{i}"] = pd.DataFrame({"x": x, "y": y})
+        data.append({**trace, "x": x[keep], "y": y[keep]})
+    return {**fig, "data": data}, raw
+
+def _render_figure(task) -> tuple:
+    """
+    子进程任务: 降采样并写出单个图表页面 (引用共享的 plotly.js)，原始数据另存为 CSV
+    """
+    name, fig, save_path, plotlyjs_src, max_points = task
+    fig, raw = downsample_figure(fig, max_points)
+    html_path = os.path.join(save_path, f"{name}.html")
+    pio.write_html(fig, html_path, include_plotlyjs=plotlyjs_src, full_html=True, validate=False)
+    data_path = None
+    if raw:
+        data_path = os.path.join(save_path, "data", f"{name}.csv")
+        pd.concat(raw, names=["trace", None]).reset_index(level=0).to_csv(data_path, index=False)
+    return name, html_path, data_path
+
+def write_plotlyjs_asset(asset_dir: str) -> str:
+    """
+    写出共享的 plotly.js 文件 (文件名包含版本号，已存在时不重复写入)，返回文件路径
+    """
+    os.makedirs(asset_dir, exist_ok=True)
+    path = os.path.join(asset_dir, f"plotly-{plotly.__version__}.min.js")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp_path, path)
+    return path
+
+def write_report_bundle(sections: dict, save_path=".", max_points: int = 2000, max_workers=None,
+                        asset_dir=None, title="回测报告") -> str:
+    """
+    报告包原子: 所有页面引用同一个本地 plotly.js，长序列按 LTTB 降采样显示 (原始数据保存在 data/ 下)，
+    各图表在进程池中并行渲染，最后生成链接全部图表的 index.html。
+    :param sections: {章节标题: {图表名: plotly Figure}}，图表名即输出文件名
+    :param max_points: 每条折线显示的最大点数
+    :param max_workers: 渲染进程数，默认使用全部 CPU 核心
+    :param asset_dir: plotly.js 所在目录，默认 save_path/assets (多个报告包可共用同一目录)
+    :return: index.html 路径
+    """
+    # 1. 共享的 plotly.js
+    os.makedirs(os.path.join(save_path, "data"), exist_ok=True)
+    asset_path = write_plotlyjs_asset(asset_dir or os.path.join(save_path, "assets"))
+    plotlyjs_src = os.path.relpath(asset_path, save_path).replace(os.sep, "/")
+
+    # 2. 并行渲染各图表
+    tasks = [(name, fig, save_path, plotlyjs_src, max_points) for figs in sections.values() for name, fig in figs.items()]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if max_workers <= 1:
+        rendered = [_render_figure(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            rendered = list(pool.map(_render_figure, tasks))
+    outputs = {name: (html_path, data_path) for name, html_path, data_path in rendered}
+
+    # 3. 索引页
+    parts = [f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title></head><body>",
+             f"<h1>{html.escape(title)}</h1>"]
+    for section, figs in sections.items():
+        if not figs:
+            continue
+        parts.append(f"<h2>{html.escape(section)}</h2><ul>")
+        for name in figs:
+            html_path, data_path = outputs[name]
+            link = f"<a href='{os.path.basename(html_path)}'>{html.escape(name)}</a>"
+            if data_path:
+                link += f" (<a href='data/{os.path.basename(data_path)}'>原始数据</a>)"
+            parts.append(f"<li>{link}</li>")
+        parts.append("</ul>")
+    parts.append("</body></html>")
+    index_path = os.path.join(save_path, "index.html")
+    with open(index_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    print(f"已保存报告包 ({len(rendered)} 个图表) 到: {index_path}")
+    return index_path
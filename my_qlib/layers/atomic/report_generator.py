@@ -3,62 +3,94 @@ import numpy as np
 from qlib.contrib.evaluate import risk_analysis
 from qlib.contrib.report import analysis_position
 import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+import plotly.io as pio
 from qlib.data import D
 
+from .report_bundle import write_report_bundle
+
 def analyze_risk(report_normal):
     """
     风险分析原子
     """
     return risk_analysis(report_normal["return"])
 
-def plot_instruments_price(instruments, start_time, end_time, save_path="."):
+def load_price_panel(instruments, start_time, end_time, field="$close") -> pd.DataFrame:
     """
-    绘制各个标的价格走势图的原子函数 (交互式 HTML 版本)
+    读取标的价格并整理为 date × instrument 宽表 (未提供回测已加载的行情时使用)
     """
-    # 1. 获取标的价格数据 (使用 $close)
-    df = D.features(instruments, ["$close"], start_time=start_time, end_time=end_time)
-    
+    df = D.features(instruments, [field], start_time=start_time, end_time=end_time)
     if df.empty:
+        return pd.DataFrame()
+    return df[field].unstack(level="instrument")
+
+def build_price_figures(instruments, start_time, end_time, prices=None) -> dict:
+    """
+    构建各个标的价格走势图 (不写文件)，返回 {"price_<标的>": 图形字典}。
+    图形直接以字典构建 (共用同一个模板)，跳过 plotly 对象逐项校验与模板深拷贝。
+    :param prices: date × instrument 的价格宽表 (如回测交易所/快速引擎已加载的收盘价)，None 时从 qlib 读取
+    """
+    # 1. 获取标的价格数据 (使用 $close)，优先复用回测已加载的行情
+    if prices is None:
+        prices = load_price_panel(instruments, start_time, end_time)
+    else:
+        prices = prices.loc[pd.Timestamp(start_time):pd.Timestamp(end_time)]
+    
+    if prices.empty:
         print("警告: 未找到任何标的价格数据，跳过绘图。")
-        return
+        return {}
     
-    # 2. 遍历每个标的进行绘图
+    # 2. 遍历每个标的构建图形 (按列取宽表，不做逐个标的的 MultiIndex 截面)
+    template = pio.templates["plotly_white"].to_plotly_json()
+    figs = {}
     for instrument in instruments:
-        try:
-            # 提取单个标的的数据
-            data = df.xs(instrument, level='instrument')
-            
-            if data.empty:
-                continue
-                
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=data.index, 
-                y=data['$close'],
-                mode='lines',
-                name=f'{instrument} Close'
-            ))
-            
-            fig.update_layout(
-                title=f'标的价格走势图: {instrument}',
-                xaxis_title='日期',
-                yaxis_title='价格',
-                template='plotly_white',
-                hovermode='x unified'
-            )
-            
-            # 保存为 HTML
-            html_path = f"{save_path}/price_{instrument}.html"
-            fig.write_html(html_path)
-            print(f"已保存标的价格图到: {html_path}")
+        if instrument not in prices.columns:
+            continue
+        # 宽表按全部标的的日期对齐，去掉该标的上市前/退市后的空值 (区间内停牌的空值保留为断点)
+        data = prices[instrument]
+        first, last = data.first_valid_index(), data.last_valid_index()
+        if first is None:
+            continue
+        data = data.loc[first:last]
             
-        except Exception as e:
-            print(f"绘制标的 {instrument} 时出错: {e}")
+        figs[f"price_{instrument}"] = {
+            "data": [{
+                "type": "scatter",
+                "x": data.index.values,
+                "y": data.values,
+                "mode": "lines",
+                "name": f"{instrument} Close"
+            }],
+            "layout": {
+                "title": {"text": f"标的价格走势图: {instrument}"},
+                "xaxis": {"title": {"text": "日期"}},
+                "yaxis": {"title": {"text": "价格"}},
+                "template": template,
+                "hovermode": "x unified"
+            }
+        }
+    return figs
 
-def plot_backtest_analysis(report_normal, instruments=None, start_time=None, end_time=None, show_plot=False, save_path="."):
+def plot_instruments_price(instruments, start_time, end_time, save_path=".", prices=None):
+    """
+    绘制各个标的价格走势图的原子函数 (交互式 HTML 版本)
+    :param prices: date × instrument 的价格宽表，None 时从 qlib 读取
+    """
+    for name, fig in build_price_figures(instruments, start_time, end_time, prices=prices).items():
+        # 保存为 HTML
+        html_path = f"{save_path}/{name}.html"
+        pio.write_html(fig, html_path, validate=False)
+        print(f"已保存标的价格图到: {html_path}")
+
+def plot_backtest_analysis(report_normal, instruments=None, start_time=None, end_time=None, show_plot=False, save_path=".",
+                           bundle=False, max_points=2000, max_workers=None, asset_dir=None, prices=None):
     """
     持仓分析绘图原子
+    :param prices: 标的价格图使用的 date × instrument 价格宽表 (回测已加载的行情)，None 时从 qlib 读取
+    :param bundle: 为 True 时输出报告包 (共享 plotly.js、长序列降采样、并行渲染、index.html 索引页，见 report_bundle.py)，
+                   否则每个图表写出独立的 HTML 文件
+    :param max_points: 报告包中每条折线显示的最大点数
+    :param max_workers: 报告包渲染进程数，默认使用全部 CPU 核心
+    :param asset_dir: 报告包共享 plotly.js 的目录，默认 save_path/assets
     """
     # 1. 基础报表图形
     analysis_df = report_normal.copy()
@@ -66,7 +98,7 @@ def plot_backtest_analysis(report_normal, instruments=None, start_time=None, end
     # 绘图：报告图表 (设置 show_notebook=False 以获取 Figure 对象)
     # report_graph 返回 (figure,)
     figs_report = analysis_position.report_graph(analysis_df, show_notebook=False)
-    if figs_report:
+    if figs_report and not bundle:
         for i, fig in enumerate(figs_report):
             html_path = f"{save_path}/report_graph_{i}.html"
             fig.write_html(html_path)
@@ -82,15 +114,28 @@ def plot_backtest_analysis(report_normal, instruments=None, start_time=None, end
     
     # risk_analysis_graph 返回 figure list
     figs_risk = analysis_position.risk_analysis_graph(analysis_results_df, analysis_df, show_notebook=False)
-    if figs_risk:
+    if figs_risk and not bundle:
         for i, fig in enumerate(figs_risk):
             html_path = f"{save_path}/risk_analysis_graph_{i}.html"
             fig.write_html(html_path)
             print(f"已保存风险分析图表到: {html_path}")
     
     # 3. 绘制各个标的价格图 (如果提供)
+    price_figs = {}
     if instruments and start_time and end_time:
-        plot_instruments_price(instruments, start_time, end_time, save_path=save_path)
+        if bundle:
+            price_figs = build_price_figures(instruments, start_time, end_time, prices=prices)
+        else:
+            plot_instruments_price(instruments, start_time, end_time, save_path=save_path, prices=prices)
+
+    # 4. 报告包: 所有图表一次性并行写出
+    if bundle:
+        sections = {
+            "报告图表": {f"report_graph_{i}": fig for i, fig in enumerate(figs_report or [])},
+            "风险分析": {f"risk_analysis_graph_{i}": fig for i, fig in enumerate(figs_risk or [])},
+            "标的价格": price_figs,
+        }
+        write_report_bundle(sections, save_path=save_path, max_points=max_points, max_workers=max_workers, asset_dir=asset_dir)
     
     return figs_report, figs_risk
 
@@ -106,66 +151,486 @@ def calculate_summary_stats(returns):
     }
     return stats
 
-def format_positions_df(positions):
+# 绩效指标引擎输出的指标 (持续期单位为交易日)
+PERFORMANCE_METRICS = (
+    "total_return", "annualized_return", "volatility", "sharpe", "sortino", "calmar",
+    "max_drawdown", "max_drawdown_duration", "drawdown_duration",
+)
+# 滚动模式的指标 (不含窗口内最长回撤持续期)
+ROLLING_METRICS = tuple(name for name in PERFORMANCE_METRICS if name != "max_drawdown_duration")
+
+def _as_return_matrix(returns):
+    """
+    收益统一为 (T, N) 的 float64 数组，返回 (数组, 日期索引, 序列名称)。
+    Series/一维数组为单条序列 (名称为 None)，DataFrame/二维数组的每一列为一条序列；NaN 视为该序列当日无数据。
+    """
+    if isinstance(returns, pd.Series):
+        return returns.to_numpy(dtype=np.float64)[:, None], returns.index, None
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=np.float64), returns.index, returns.columns
+    arr = np.asarray(returns, dtype=np.float64)
+    if arr.ndim == 1:
+        return arr[:, None], pd.RangeIndex(len(arr)), None
+    return arr, pd.RangeIndex(arr.shape[0]), pd.RangeIndex(arr.shape[1])
+
+def _window_length(window, periods) -> int:
+    """
+    窗口长度 (交易日数): 整数，或 "1y"/"3y"/"6m" 形式的年/月数
+    """
+    if isinstance(window, str):
+        value, unit = float(window[:-1]), window[-1].lower()
+        if unit not in ("y", "m"):
+            raise ValueError(f"无法识别的窗口: {window}")
+        return int(round(value * periods if unit == "y" else value * periods / 12))
+    return int(window)
+
+def _safe_div(a, b):
+    """
+    逐元素相除，分母为 0 时记为 0 (与 calculate_summary_stats 中夏普比率的处理一致)
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b != 0, np.divide(a, b), 0.0)
+
+def _ratio_metrics(n, mean, var, down_sq_sum, log_growth, max_drop, periods) -> dict:
+    """
+    由样本数、均值、方差、下行平方和、对数收益和与最大对数回落计算指标 (全区间/滚动/增量三种模式共用)
+    """
+    std = np.sqrt(np.maximum(var, 0.0))
+    downside = np.sqrt(_safe_div(down_sq_sum, n))
+    annualized = np.expm1(_safe_div(log_growth * periods, n))
+    max_drawdown = -np.expm1(-max_drop)
+    return {
+        "total_return": np.expm1(log_growth),
+        "annualized_return": annualized,
+        "volatility": std * np.sqrt(periods),
+        "sharpe": _safe_div(mean, std) * np.sqrt(periods),
+        "sortino": _safe_div(mean, downside) * np.sqrt(periods),
+        "calmar": _safe_div(annualized, max_drawdown),
+        "max_drawdown": max_drawdown,
+    }
+
+def _returns_state(R) -> dict:
+    """
+    一次遍历 (T, N) 收益数组得到增量指标状态: 样本数、均值、离差平方和、下行平方和、对数财富、
+    历史高点、最近高点位置、最大对数回落与最长回撤持续期 (位置以交易日计，0 为起点)
+    """
+    valid = ~np.isnan(R)
+    r = np.where(valid, R, 0.0)
+    n = valid.sum(axis=0).astype(np.float64)
+    mean = _safe_div(r.sum(axis=0), n)
+    log_wealth = np.vstack([np.zeros((1, R.shape[1])), np.cumsum(np.log1p(r), axis=0)])
+    peak = np.maximum.accumulate(log_wealth, axis=0)
+    steps = np.arange(len(log_wealth))[:, None]
+    last_peak = np.maximum.accumulate(np.where(log_wealth >= peak, steps, 0), axis=0)
+    return {
+        "steps": len(R),
+        "n": n,
+        "mean": mean,
+        "m2": (((r - mean) * valid) ** 2).sum(axis=0),
+        "down_sq": (np.minimum(r, 0.0) ** 2).sum(axis=0),
+        "log_wealth": log_wealth[-1],
+        "peak": peak[-1],
+        "last_peak": last_peak[-1],
+        "max_drop": (peak - log_wealth).max(axis=0),
+        "max_duration": (steps - last_peak).max(axis=0),
+    }
+
+def _state_metrics(state, periods) -> dict:
+    """
+    由增量状态计算全区间指标，没有任何有效样本的序列记为 NaN
+    """
+    n = state["n"]
+    metrics = _ratio_metrics(
+        n, state["mean"], _safe_div(state["m2"], n - 1), state["down_sq"], state["log_wealth"], state["max_drop"], periods
+    )
+    metrics["max_drawdown_duration"] = state["max_duration"]
+    metrics["drawdown_duration"] = state["steps"] - state["last_peak"]
+    return {name: np.where(n > 0, metrics[name], np.nan) for name in PERFORMANCE_METRICS}
+
+def _metrics_frame(metrics, names):
+    """
+    单条序列返回 指标 Series，多条序列返回 序列 × 指标 的 DataFrame
+    """
+    if names is None:
+        return pd.Series({name: float(metrics[name][0]) for name in PERFORMANCE_METRICS})
+    return pd.DataFrame({name: metrics[name] for name in PERFORMANCE_METRICS}, index=names)
+
+def performance_metrics(returns, periods=252):
+    """
+    全区间绩效指标原子 (NumPy 单次遍历，可一次计算多条序列，如参数扫描的全部收益序列):
+    总收益、复利年化收益、年化波动率、夏普、索提诺、卡玛、复利最大回撤、最长回撤持续期与当前回撤持续期。
+    无风险利率取 0，分母为 0 的比率记为 0。
+    :param returns: 日收益 Series (返回指标 Series)，或每列一条序列的 DataFrame/二维数组 (返回 序列 × 指标 的 DataFrame)
+    :param periods: 每年交易日数
+    """
+    R, _, names = _as_return_matrix(returns)
+    return _metrics_frame(_state_metrics(_returns_state(R), periods), names)
+
+class IncrementalMetrics:
+    """
+    增量绩效指标: 每追加一个交易日的收益以 O(1) 更新状态 (每条序列)，随时可取与 performance_metrics 相同的全区间指标。
+    可同时跟踪多条序列 (每次传入长度为 N 的收益数组)，NaN 表示该序列当日无数据。
+    """
+    def __init__(self, n_series=1, periods=252, names=None):
+        """
+        :param n_series: 序列数量
+        :param names: 序列名称，None 时 metrics() 按单条序列返回指标 Series
+        """
+        self.periods = periods
+        self.names = names
+        self.state = _returns_state(np.empty((0, n_series)))
+
+    @classmethod
+    def from_returns(cls, returns, periods=252) -> "IncrementalMetrics":
+        """
+        由已有的收益历史初始化 (一次向量化遍历)，之后逐日 update
+        """
+        R, _, names = _as_return_matrix(returns)
+        tracker = cls(R.shape[1], periods=periods, names=names)
+        tracker.state = _returns_state(R)
+        return tracker
+
+    def update(self, returns) -> "IncrementalMetrics":
+        """
+        追加一个交易日的收益 (标量或长度为 N 的数组)
+        """
+        s = self.state
+        r = np.broadcast_to(np.asarray(returns, dtype=np.float64), s["n"].shape)
+        valid = ~np.isnan(r)
+        r = np.where(valid, r, 0.0)
+        s["steps"] += 1
+        n = s["n"] + valid
+        delta = r - s["mean"]
+        mean = s["mean"] + np.where(valid, _safe_div(delta, n), 0.0)
+        s["m2"] = s["m2"] + np.where(valid, delta * (r - mean), 0.0)
+        s["n"], s["mean"] = n, mean
+        s["down_sq"] = s["down_sq"] + np.minimum(r, 0.0) ** 2
+        s["log_wealth"] = s["log_wealth"] + np.log1p(r)
+        s["last_peak"] = np.where(s["log_wealth"] >= s["peak"], s["steps"], s["last_peak"])
+        s["peak"] = np.maximum(s["peak"], s["log_wealth"])
+        s["max_drop"] = np.maximum(s["max_drop"], s["peak"] - s["log_wealth"])
+        s["max_duration"] = np.maximum(s["max_duration"], s["steps"] - s["last_peak"])
+        return self
+
+    def metrics(self):
+        return _metrics_frame(_state_metrics(self.state, self.periods), self.names)
+
+def _combine_drop(left, right):
     """
-    将原始持仓数据转换为更易读的 DataFrame。
-    支持 Qlib 的 Position 对象以及普通字典结构。
+    合并相邻两段的 (最大值, 最后一个最大值的位置, 最小值, 最大回落)，left 在前
     """
-    data = []
+    left_max, left_arg, left_min, left_drop = left
+    right_max, right_arg, right_min, right_drop = right
+    return (
+        np.maximum(left_max, right_max),
+        np.where(right_max >= left_max, right_arg, left_arg),
+        np.minimum(left_min, right_min),
+        np.maximum(np.maximum(left_drop, right_drop), left_max - right_min),
+    )
+
+def _doubling_tables(points, max_length) -> list:
+    """
+    倍增表: 第 k 层为从每个位置开始、长度 2^k 的区间的 (最大值, 最后一个最大值的位置, 最小值, 最大回落)，
+    最大回落为区间内 s <= t 时 points[s] - points[t] 的最大值 (对数财富上即最大回撤)
+    """
+    positions = np.broadcast_to(np.arange(len(points))[:, None], points.shape)
+    tables = [(points, positions, points, np.zeros_like(points))]
+    size = 1
+    while size * 2 <= max_length:
+        level = tables[-1]
+        count = len(level[0]) - size
+        tables.append(_combine_drop(
+            tuple(arr[:count] for arr in level), tuple(arr[size:size + count] for arr in level)
+        ))
+        size *= 2
+    return tables
+
+def _window_drop(tables, length, count):
+    """
+    用倍增表一次求出 count 个连续区间 (第 i 个为 points[i : i + length]) 的最大回落与最后一个最大值的位置，
+    每个区间按 length 的二进制拆成 O(log length) 段依次合并
+    """
+    acc, offset = None, 0
+    for k in reversed(range(len(tables))):
+        size = 1 << k
+        if length & size:
+            block = tuple(arr[offset:offset + count] for arr in tables[k])
+            acc = block if acc is None else _combine_drop(acc, block)
+            offset += size
+    return acc[3], acc[1]
+
+def rolling_performance_metrics(returns, windows=("1y", "3y"), periods=252) -> pd.DataFrame:
+    """
+    滚动窗口绩效指标原子: 每个日期计算截至该日最近 window 个交易日的指标 (不足一个窗口的日期为 NaN)。
+    所有窗口共用一次前缀和与一组倍增表: 收益/波动/比率由前缀和差分得到，复利最大回撤由倍增表精确合并，
+    整体复杂度 O(T × N × log window)。drawdown_duration 为该日距窗口内最近高点的交易日数。
+    :param returns: 日收益 Series，或每列一条序列的 DataFrame/二维数组
+    :param windows: 窗口长度 (交易日数) 或 "1y"/"3y"/"6m" 形式，单个值或列表
+    :return: 日期 × (窗口, 指标) 的 DataFrame，多条序列时列为 (窗口, 指标, 序列)
+    """
+    R, index, names = _as_return_matrix(returns)
+    windows = list(windows) if isinstance(windows, (list, tuple)) else [windows]
+    lengths = {window: _window_length(window, periods) for window in windows}
+    T, N = R.shape
+
+    # 1. 前缀和 (首行为 0)
+    valid = ~np.isnan(R)
+    r = np.where(valid, R, 0.0)
+    prefix = {
+        name: np.vstack([np.zeros((1, N)), np.cumsum(arr, axis=0)])
+        for name, arr in {"n": valid.astype(np.float64), "sum": r, "sumsq": r * r,
+                          "down_sq": np.minimum(r, 0.0) ** 2, "log": np.log1p(r)}.items()
+    }
+    usable = [w for w in lengths.values() if 1 <= w <= T]
+    tables = _doubling_tables(prefix["log"], max(usable) + 1) if usable else []
+
+    # 2. 逐窗口差分，最大回撤与距高点天数由倍增表求出
+    columns, data = [], []
+    for window, w in lengths.items():
+        out = {name: np.full((T, N), np.nan) for name in ROLLING_METRICS}
+        if 1 <= w <= T:
+            diff = {name: p[w:] - p[:-w] for name, p in prefix.items()}
+            n = diff["n"]
+            mean = _safe_div(diff["sum"], n)
+            drop, last_max = _window_drop(tables, w + 1, T - w + 1)
+            metrics = _ratio_metrics(
+                n, mean, _safe_div(diff["sumsq"] - n * mean ** 2, n - 1), diff["down_sq"], diff["log"], drop, periods
+            )
+            metrics["drawdown_duration"] = np.arange(w, T + 1)[:, None] - last_max
+            for name in ROLLING_METRICS:
+                out[name][w - 1:] = np.where(n > 0, metrics[name], np.nan)
+        for name in ROLLING_METRICS:
+            if names is None:
+                columns.append((window, name))
+                data.append(out[name][:, 0])
+            else:
+                columns.extend((window, name, series) for series in names)
+                data.extend(out[name].T)
+
+    level_names = ["window", "metric"] if names is None else ["window", "metric", "series"]
+    return pd.DataFrame(np.column_stack(data), index=index, columns=pd.MultiIndex.from_tuples(columns, names=level_names))
+
+# 起点 × 持有期敏感性分析输出的指标
+SENSITIVITY_METRICS = ("total_return", "annualized_return", "max_drawdown", "sharpe")
+
+def _month_bounds(index) -> pd.DatetimeIndex:
+    """
+    收益序列覆盖的月份边界: 从首个交易日所在月的月初起 (回测起点视为该月的开始)，
+    到最后一个完整月份之后的月初止 (最后一个交易日之后的下一个工作日已进入下月时，该月视为完整)
+    """
+    first = index[0].to_period("M").to_timestamp()
+    end = (index[-1] + pd.offsets.BDay(1)).to_period("M").to_timestamp()
+    return pd.date_range(first, end, freq="MS")
+
+def start_horizon_metrics(returns, horizons=None, periods=252) -> pd.DataFrame:
+    """
+    起点 × 持有期敏感性分析原子: 对每个 (起始月份, 持有月数) 组合计算总收益、复利年化收益、复利最大回撤与夏普，不重新模拟。
+    收益/夏普由前缀和差分得到；最大回撤对每个起点做一次运行高点与运行最大回落的累积 (所有持有期共用)，
+    整体为 O(起点数 × T) 的数组运算。指标定义与 performance_metrics 相同。
+    :param returns: 全历史日收益 Series (各起点截取同一条收益路径)；
+                    或 DataFrame，每列为从该列标签 (起始月份) 开始单独回测的收益路径 (起点之前为 NaN)，用于精确模式
+    :param horizons: 持有月数列表，None 表示所有可能的持有期
+    :return: 以 (start, horizon) 为索引的 DataFrame，列为 end、days 与 SENSITIVITY_METRICS；
+             热力图可用 table["sharpe"].unstack("horizon") 得到
+    """
+    R, index, names = _as_return_matrix(returns)
+    index = pd.DatetimeIndex(index)
+    bounds = _month_bounds(index)
+    positions = index.searchsorted(bounds)
+    n_months = len(bounds) - 1
+
+    # 1. 起点及其使用的收益路径 (列)
+    if names is None:
+        starts = np.arange(n_months)
+        cols = np.zeros(n_months, dtype=np.intp)
+    else:
+        month_of = {pd.Timestamp(name).to_period("M").to_timestamp(): j for j, name in enumerate(names)}
+        starts = np.array([i for i in range(n_months) if bounds[i] in month_of], dtype=np.intp)
+        cols = np.array([month_of[bounds[i]] for i in starts], dtype=np.intp)
+
+    # 2. 所有 (起点, 持有期) 组合
+    horizon_set = None if horizons is None else set(int(h) for h in horizons)
+    pair_start, pair_horizon = [], []
+    for k, i in enumerate(starts):
+        h = np.arange(1, n_months - i + 1)
+        if horizon_set is not None:
+            h = h[np.isin(h, list(horizon_set))]
+        pair_start.append(np.full(len(h), k))
+        pair_horizon.append(h)
+    pair_start = np.concatenate(pair_start) if pair_start else np.array([], dtype=np.intp)
+    pair_horizon = np.concatenate(pair_horizon) if pair_horizon else np.array([], dtype=np.intp)
+    a = positions[starts[pair_start]]
+    b = positions[starts[pair_start] + pair_horizon]
+    c = cols[pair_start]
+
+    # 3. 前缀和 (首行为 0) 差分得到各组合的样本数、均值、方差与对数收益
+    valid = ~np.isnan(R)
+    r = np.where(valid, R, 0.0)
+    zeros = np.zeros((1, R.shape[1]))
+    prefix = {
+        name: np.vstack([zeros, np.cumsum(arr, axis=0)])
+        for name, arr in {"n": valid.astype(np.float64), "sum": r, "sumsq": r * r,
+                          "down_sq": np.minimum(r, 0.0) ** 2, "log": np.log1p(r)}.items()
+    }
+    diff = {name: p[b, c] - p[a, c] for name, p in prefix.items()}
+    n = diff["n"]
+    mean = _safe_div(diff["sum"], n)
+
+    # 4. 最大回撤: 每个起点沿时间累积运行高点与运行最大回落，持有期为 b 的回撤即第 b 个点上的运行最大回落
+    log_wealth = prefix["log"][:, cols].T
+    steps = np.arange(log_wealth.shape[1])
+    started = steps[None, :] >= positions[starts][:, None]
+    peak = np.maximum.accumulate(np.where(started, log_wealth, -np.inf), axis=1)
+    running_drop = np.maximum.accumulate(np.where(started, peak - log_wealth, 0.0), axis=1)
+    drop = running_drop[pair_start, b]
+
+    metrics = _ratio_metrics(
+        n, mean, _safe_div(diff["sumsq"] - n * mean ** 2, n - 1), diff["down_sq"], diff["log"], drop, periods
+    )
+    table = pd.DataFrame({
+        "start": bounds[starts[pair_start]],
+        "horizon": pair_horizon,
+        "end": index[np.maximum(b - 1, 0)],
+        "days": n.astype(np.int64),
+        **{name: np.where(n > 0, metrics[name], np.nan) for name in SENSITIVITY_METRICS},
+    })
+    return table.set_index(["start", "horizon"])
+
+# 持仓字典中的非标的键
+_POSITION_META_KEYS = {"cash", "now_account_value", "cash_delay"}
+
+def _raw_position(pos_info) -> dict:
+    """
+    取出持仓的原始字典: 支持 qlib Position 对象、普通持仓字典以及 {"position": ...} 包装
+    """
+    if isinstance(pos_info, dict):
+        inner = pos_info.get("position", pos_info)
+        return inner if isinstance(inner, dict) else getattr(inner, "position", {})
+    return getattr(pos_info, "position", {})
+
+def positions_to_long_df(positions) -> pd.DataFrame:
+    """
+    持仓历史转换为长表原子: 每个 (日期, 标的) 一行，列为 date, code, amount, price, value, weight, cash, total_value。
+    一次遍历收集原始数值，市值/权重向量化计算；code 为 category，price/weight 为 float32。
+    空仓日保留一行 (code 为空) 以记录当日现金与总资产。
+    :param positions: {日期: qlib Position 或持仓字典}
+    """
+    dates, codes, amounts, prices, day_index = [], [], [], [], []
+    day_cash, day_cash_delay, day_total = [], [], []
     for date, pos_info in positions.items():
-        # 1. 提取内部持仓对象/字典
-        if isinstance(pos_info, dict):
-            inner_pos = pos_info.get('position', pos_info)
-        else:
-            inner_pos = pos_info
-            
-        # 2. 根据类型提取信息
-        if hasattr(inner_pos, 'get_cash'):
-            # 情况 A: inner_pos 是 Qlib 的 Position 对象
-            cash = inner_pos.get_cash()
-            total_value = inner_pos.calculate_value()
-            hold_str = []
-            try:
-                # 遍历持仓代码
-                for code in inner_pos.get_stock_list():
-                    amount = inner_pos.get_stock_amount(code)
-                    price = inner_pos.get_stock_price(code)
-                    stock_value = amount * price
-                    # 计算权重
-                    weight = stock_value / total_value if total_value != 0 else 0
-                    hold_str.append(f"{code}(数量:{amount:,.0f}, 价值:{stock_value:,.2f}, 权重:{weight:.2%})")
-            except Exception:
-                # 备选方案
-                hold_dict = getattr(inner_pos, 'position', {})
-                hold_str = [str(code) for code in hold_dict if code not in ['cash', 'cash_delay']]
-            holdings_label = " | ".join(hold_str)
-        elif isinstance(inner_pos, dict):
-            # 情况 B: inner_pos 是普通字典
-            cash = inner_pos.get('cash', 0)
-            total_value = inner_pos.get('now_account_value', cash)
-            holdings = {k: v for k, v in inner_pos.items() if k not in ['cash', 'now_account_value', 'cash_delay']}
-            hold_parts = []
-            for code, detail in holdings.items():
-                if isinstance(detail, dict):
-                    amount = detail.get('amount', 0)
-                    price = detail.get('price', 0)
-                    stock_value = amount * price
-                    weight = detail.get('weight', 0)
-                    hold_parts.append(f"{code}(数量:{amount:,.0f}, 价值:{stock_value:,.2f}, 权重:{weight:.2%})")
-                else:
-                    hold_parts.append(str(code))
-            holdings_label = " | ".join(hold_parts)
-        else:
-            cash, total_value, holdings_label = 0, 0, "Unknown"
-
-        data.append({
-            'date': date,
-            'cash': cash,
-            'total_value': total_value,
-            'holdings': holdings_label if holdings_label else "Empty"
-        })
-    
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df.set_index('date', inplace=True)
+        raw = _raw_position(pos_info)
+        day = len(day_cash)
+        held = False
+        for code, detail in raw.items():
+            if code in _POSITION_META_KEYS or not isinstance(detail, dict):
+                continue
+            dates.append(date)
+            codes.append(code)
+            amounts.append(detail.get("amount", 0.0))
+            prices.append(detail.get("price") or 0.0)
+            day_index.append(day)
+            held = True
+        if not held:
+            dates.append(date)
+            codes.append(None)
+            amounts.append(0.0)
+            prices.append(0.0)
+            day_index.append(day)
+        day_cash.append(raw.get("cash", 0.0))
+        day_cash_delay.append(raw.get("cash_delay", 0.0))
+        day_total.append(raw.get("now_account_value", np.nan))
+
+    amount = np.asarray(amounts, dtype=np.float64)
+    price = np.asarray(prices, dtype=np.float64)
+    value = amount * price
+    day_index = np.asarray(day_index, dtype=np.intp)
+    cash = np.asarray(day_cash, dtype=np.float64)
+    total = np.asarray(day_total, dtype=np.float64)
+    # 没有记录总资产的持仓 (如普通字典): 现金 (含待交收) + 各标的市值
+    missing_total = np.isnan(total)
+    if missing_total.any():
+        stock_value = np.bincount(day_index, weights=value, minlength=len(total))
+        cash_delay = np.asarray(day_cash_delay, dtype=np.float64)
+        total[missing_total] = (cash + cash_delay + stock_value)[missing_total]
+    row_total = total[day_index]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(row_total != 0, value / row_total, 0.0)
+
+    return pd.DataFrame({
+        "date": pd.DatetimeIndex(dates),
+        "code": pd.Categorical(codes),
+        "amount": amount,
+        "price": price.astype(np.float32),
+        "value": value,
+        "weight": weight.astype(np.float32),
+        "cash": cash[day_index],
+        "total_value": row_total,
+    })
+
+def iter_positions_long(positions, chunk_days=250):
+    """
+    按交易日分块生成持仓长表，内存占用与回测区间长度无关
+    :param chunk_days: 每块包含的交易日数
+    """
+    dates = list(positions)
+    for i in range(0, len(dates), chunk_days):
+        yield positions_to_long_df({date: positions[date] for date in dates[i:i + chunk_days]})
+
+def write_positions_table(positions, path, chunk_days=250):
+    """
+    分块写出持仓长表原子: .parquet 使用 pyarrow 逐块追加 row group，其余扩展名写 CSV
+    :param path: 输出文件路径
+    """
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in iter_positions_long(positions, chunk_days):
+                # 各块的 category 取值不同，写入 Parquet 时统一为字符串 (Parquet 本身按字典编码存储)
+                chunk["code"] = chunk["code"].astype(object)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for i, chunk in enumerate(iter_positions_long(positions, chunk_days)):
+            chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    print(f"已保存持仓明细到: {path}")
+
+def format_positions_df(positions, last_n=None):
+    """
+    将持仓转换为易读的 DataFrame (每日一行，holdings 为持仓描述字符串)。
+    仅用于展示: 字符串只为需要显示的交易日生成 (last_n 指定时只渲染最后 last_n 个交易日)。
+    :param positions: {日期: qlib Position 或持仓字典}，或 positions_to_long_df 生成的长表
+    """
+    if isinstance(positions, pd.DataFrame):
+        long_df = positions
+        if last_n is not None:
+            keep = long_df["date"].drop_duplicates().iloc[-last_n:] if last_n > 0 else long_df["date"].iloc[:0]
+            long_df = long_df[long_df["date"].isin(keep)]
+    else:
+        dates = list(positions)
+        if last_n is not None:
+            dates = dates[-last_n:] if last_n > 0 else []
+        long_df = positions_to_long_df({date: positions[date] for date in dates})
+
+    if long_df.empty:
+        return pd.DataFrame(columns=["cash", "total_value", "holdings"], index=pd.Index([], name="date"))
+    held = long_df[long_df["code"].notna()]
+    labels = [
+        f"{code}(数量:{amount:,.0f}, 价值:{value:,.2f}, 权重:{weight:.2%})"
+        for code, amount, value, weight in zip(held["code"], held["amount"], held["value"], held["weight"].astype(np.float64))
+    ]
+    # 长表中同一交易日的行是连续的，按日期边界切片拼接
+    held_dates = held["date"].values
+    starts = np.flatnonzero(np.r_[True, held_dates[1:] != held_dates[:-1]]) if len(held_dates) else np.array([], dtype=np.intp)
+    stops = np.r_[starts[1:], len(labels)]
+    holdings = pd.Series([" | ".join(labels[a:b]) for a, b in zip(starts, stops)], index=held_dates[starts], dtype=object)
+    df = long_df.drop_duplicates("date").set_index("date")[["cash", "total_value"]]
+    df["holdings"] = holdings.reindex(df.index).fillna("Empty")
+    df.index.name = "date"
     return df
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+# 报告生成方式: sync 同步绘图，async 提交到后台报告执行器，off 不绘图 (无头模式)
+REPORT_MODES = ("sync", "async", "off")
+
+class ReportJobs:
+    """
+    进程级后台报告执行器。
+    报告任务在单个后台线程中依次执行 (同一目录的图表文件不会被并发写入)，提交后立即返回 Future；
+    报告包的图表渲染本身仍在 report_bundle 的进程池中并行。
+    未完成的任务在解释器退出前会被等待，也可以通过 wait/cancel 主动等待或取消。
+    """
+    def __init__(self, max_workers: int = 1):
+        """
+        :param max_workers: 后台线程数
+        """
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.failed = 0
+        self._futures: List[Future] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="report")
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._futures = [f for f in self._futures if not f.done()] + [future]
+            self.submitted += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            with self._lock:
+                self.failed += 1
+            print(f"警告: 后台报告生成失败: {future.exception()}")
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        等待所有未完成的报告任务，返回 (已完成, 未完成) 的 Future 集合
+        """
+        with self._lock:
+            futures = list(self._futures)
+        return wait(futures, timeout=timeout)
+
+    def cancel(self) -> int:
+        """
+        取消尚未开始的报告任务 (正在运行的任务会执行完毕)，返回取消的数量
+        """
+        with self._lock:
+            futures = list(self._futures)
+        return sum(future.cancel() for future in futures)
+
+    def stats(self) -> dict:
+        with self._lock:
+            futures = list(self._futures)
+        return {"submitted": self.submitted, "pending": sum(not f.done() for f in futures), "failed": self.failed}
+
+# 进程级共享的后台报告执行器
+REPORT_JOBS = ReportJobs()
+
+def submit_report(fn, *args, **kwargs) -> Future:
+    """
+    提交一个报告生成任务到后台执行器，立即返回 Future
+    """
+    return REPORT_JOBS.submit(fn, *args, **kwargs)
+
+def wait_reports(timeout: Optional[float] = None):
+    """
+    等待所有后台报告任务完成 (如在程序退出前)，返回 (已完成, 未完成) 的 Future 集合
+    """
+    return REPORT_JOBS.wait(timeout)
+
+def cancel_reports() -> int:
+    """
+    取消所有尚未开始的后台报告任务，返回取消的数量
+    """
+    return REPORT_JOBS.cancel()
+
+def get_report_jobs_stats() -> dict:
+    """
+    获取后台报告任务的统计 (已提交、未完成、失败数量)
+    """
+    return REPORT_JOBS.stats()
@@ -0,0 +1,332 @@
+import ast
+import numpy as np
+import pandas as pd
+from qlib.backtest.signal import Signal
+from qlib.config import C
+from qlib.data import D
+from qlib.utils.resam import resam_ts_data
+
+from .data_handler import (
+    build_market_mask,
+    get_trade_calendar,
+    load_market_spans,
+    load_panel_snapshot,
+    load_snapshot_ranges,
+)
+
+# ---------------- 向量化算子 (输入输出均为 dates×instruments 的二维数组) ----------------
+def _shift(x, n):
+    out = np.full_like(x, np.nan)
+    if n < len(x):
+        out[n:] = x[: len(x) - n]
+    return out
+
+def _centered_prefix(x, n):
+    """
+    每列先减去该列首个有效值 (±inf 与 NaN 一样视为缺失)，再做前缀累加，
+    避免大数值水平 (如 1e8 的成交量) 下累加和相减的精度损失。
+    返回 (二维数组, 各列参考值, 有效掩码, 窗口起点的滞后位置, {名称: 前缀和数组}, 中心化后的数组)
+    """
+    x2 = x.reshape(len(x), -1)
+    valid = np.isfinite(x2)
+    first = valid.argmax(axis=0)
+    ref = np.where(valid.any(axis=0), x2[first, np.arange(x2.shape[1])], 0.0)
+    d = np.where(valid, x2 - ref, 0.0)
+    zeros = np.zeros((1, x2.shape[1]))
+    prefix = {
+        "count": np.concatenate([zeros, np.cumsum(valid, axis=0)]),
+        "sum": np.concatenate([zeros, np.cumsum(d, axis=0)]),
+    }
+    lag = np.maximum(np.arange(1, len(x2) + 1) - n, 0)
+    return x2, ref, valid, lag, prefix, d
+
+def _rolling_window(x, n):
+    """
+    基于累加和的滚动窗口统计，返回 (窗口内有效值之和, 有效值个数)。
+    与 qlib 的 Rolling 算子 (pandas rolling) 一致: 跳过 NaN 与 ±inf，min_periods=1。
+    """
+    _, ref, _, lag, prefix, _ = _centered_prefix(x, n)
+    window_count = prefix["count"][1:] - prefix["count"][lag]
+    window_total = prefix["sum"][1:] - prefix["sum"][lag] + window_count * ref
+    return window_total.reshape(x.shape), window_count.reshape(x.shape)
+
+def _rolling_sum(x, n):
+    window_total, window_count = _rolling_window(x, n)
+    return np.where(window_count > 0, window_total, np.nan)
+
+def _rolling_mean(x, n):
+    window_total, window_count = _rolling_window(x, n)
+    return window_total / np.where(window_count > 0, window_count, np.nan)
+
+def _rolling_std(x, n, tolerance=1e-8, block_cells=1 << 22):
+    """
+    滚动样本标准差 (ddof=1)，有效值少于 2 个时为 NaN。
+    先由 (按列中心化的) 累加和得到方差；累加和相减的舍入误差约与前缀平方和成正比，
+    估计误差超过 tolerance × 方差的窗口 (如数值水平从 1e8 跳变到 1 之后) 改为在窗口内用两遍法重新计算。
+    :param block_cells: 重算时每块的最大元素数 (窗口数 × 窗口长度)
+    """
+    x2, _, valid, lag, prefix, d = _centered_prefix(x, n)
+    sq = np.concatenate([np.zeros((1, x2.shape[1])), np.cumsum(d * d, axis=0)])
+    count = prefix["count"][1:] - prefix["count"][lag]
+    total = prefix["sum"][1:] - prefix["sum"][lag]
+    denom = np.where(count > 1, count, np.nan)
+    var = (sq[1:] - sq[lag] - total * total / denom) / (denom - 1)
+
+    suspect = np.argwhere((count > 1) & (8 * np.finfo(np.float64).eps * sq[1:] > tolerance * np.abs(var)))
+    if len(suspect):
+        finite = np.where(valid, x2, np.nan)
+        padded = np.concatenate([np.full((n - 1, x2.shape[1]), np.nan), finite])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, n, axis=0)
+        step = max(1, block_cells // n)
+        for lo in range(0, len(suspect), step):
+            rows, cols = suspect[lo:lo + step].T
+            block = windows[rows, cols]
+            mean = np.nanmean(block, axis=1, keepdims=True)
+            var[rows, cols] = np.nansum((block - mean) ** 2, axis=1) / (count[rows, cols] - 1)
+    return np.sqrt(np.maximum(var, 0.0)).reshape(x.shape)
+
+def _zscore(x, n):
+    std = _rolling_std(x, n)
+    return (x - _rolling_mean(x, n)) / np.where(std > 0, std, np.nan)
+
+def _cs_members(x, mask):
+    """
+    截面算子只在当日的股票池成员内计算: 非成员置为 NaN
+    """
+    return x if mask is None else np.where(mask, x, np.nan)
+
+def _cs_rank(x, mask=None):
+    """
+    截面百分位排名 (每个日期内在股票池成员中排序)
+    """
+    return pd.DataFrame(_cs_members(x, mask)).rank(axis=1, pct=True).values
+
+def _cs_zscore(x, mask=None):
+    x = _cs_members(x, mask)
+    mean = np.nanmean(x, axis=1, keepdims=True)
+    std = np.nanstd(x, axis=1, keepdims=True)
+    return (x - mean) / np.where(std > 0, std, np.nan)
+
+# 算子表: 名称 -> (函数, 窗口参数个数, 窗口对回看长度的贡献)
+OPERATORS = {
+    "ref": (lambda x, n: _shift(x, n), 1, lambda n: n),
+    "delta": (lambda x, n: x - _shift(x, n), 1, lambda n: n),
+    "ret": (lambda x, n=1: x / _shift(x, n) - 1, 1, lambda n=1: n),
+    "mom": (lambda x, n, skip=0: _shift(x, skip) / _shift(x, n) - 1, 2, lambda n, skip=0: n),
+    "mean": (_rolling_mean, 1, lambda n: n - 1),
+    "sum": (_rolling_sum, 1, lambda n: n - 1),
+    "std": (_rolling_std, 1, lambda n: n - 1),
+    "zscore": (_zscore, 1, lambda n: n - 1),
+    "rank": (_cs_rank, 0, lambda: 0),
+    "cs_zscore": (_cs_zscore, 0, lambda: 0),
+    "abs": (np.abs, 0, lambda: 0),
+    "log": (np.log, 0, lambda: 0),
+}
+
+# 截面算子: 需要股票池掩码
+_CROSS_SECTIONAL = {"rank", "cs_zscore"}
+
+_BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+def parse_expression(expression: str) -> ast.AST:
+    """
+    解析信号表达式，如 "zscore($close, 20)"、"rank(mom(close, 60, 5))"
+    """
+    return ast.parse(expression.replace("$", ""), mode="eval").body
+
+def _window_args(node):
+    args = []
+    for arg in node.args[1:]:
+        if not (isinstance(arg, ast.Constant) and isinstance(arg.value, (int, float))):
+            raise ValueError(f"算子 {node.func.id} 的窗口参数必须是数字: {ast.unparse(node)}")
+        args.append(int(arg.value))
+    return args
+
+def expression_fields(node) -> set:
+    """
+    表达式引用的原始字段
+    """
+    return {n.id.lower() for n in ast.walk(node) if isinstance(n, ast.Name) and n.id not in OPERATORS}
+
+def expression_lookback(node) -> int:
+    """
+    表达式需要的回看交易日数 (各嵌套路径上窗口之和的最大值)
+    """
+    if isinstance(node, ast.Call):
+        child = max((expression_lookback(arg) for arg in node.args[:1]), default=0)
+        return OPERATORS[node.func.id][2](*_window_args(node)) + child
+    return max((expression_lookback(c) for c in ast.iter_child_nodes(node)), default=0)
+
+def evaluate_expressions(expressions, fields, cache=None, mask=None):
+    """
+    在 dates×instruments 的二维数组上一次性批量计算多个表达式，
+    相同的子表达式在整批中只计算一次。
+    :param expressions: {名称: 表达式字符串}
+    :param fields: {字段名(小写, 不含 $): 二维数组}
+    :param mask: 与字段同形状的股票池成员掩码，截面算子 (rank/cs_zscore) 只在当日成员内计算；None 表示全部参与
+    :return: {名称: 二维数组}
+    """
+    cache = {} if cache is None else cache
+
+    def evaluate(node):
+        key = ast.dump(node)
+        if key in cache:
+            return cache[key]
+        if isinstance(node, ast.Name):
+            value = fields[node.id.lower()]
+        elif isinstance(node, ast.Constant):
+            value = float(node.value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = -evaluate(node.operand)
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            value = _BINARY_OPS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in OPERATORS:
+            func = OPERATORS[node.func.id][0]
+            if node.func.id in _CROSS_SECTIONAL:
+                value = func(evaluate(node.args[0]), *_window_args(node), mask=mask)
+            else:
+                value = func(evaluate(node.args[0]), *_window_args(node))
+        else:
+            raise ValueError(f"不支持的表达式: {ast.unparse(node)}")
+        cache[key] = value
+        return value
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {name: evaluate(parse_expression(expr)) for name, expr in expressions.items()}
+
+def load_dense_fields(fields, start_time, end_time, market="csi300", snapshot_uri=None):
+    """
+    一次性加载所需原始字段为 dates×instruments 的 float64 二维数组。
+    :param snapshot_uri: 数据目录，提供时从列式快照读取，否则经 D.features 读取一次
+    :return: (dates, instruments, {字段: 二维数组}, 股票池掩码)
+    """
+    fields = sorted(fields)
+    if snapshot_uri is not None:
+        panels = load_panel_snapshot([f"${f}" for f in fields], start_time, end_time,
+                                     instruments=market, provider_uri=snapshot_uri)
+        first = panels[f"${fields[0]}"]
+        ranges = load_snapshot_ranges(f"${fields[0]}", snapshot_uri)
+        mask = build_market_mask(first.index, first.columns, load_market_spans(market, snapshot_uri), ranges)
+        return first.index, first.columns, {f: panels[f"${f}"].values.astype(np.float64) for f in fields}, mask
+
+    # 按标的列表而不是股票池读取，保留标的进入股票池之前的数据供回看窗口使用，再用股票池区间生成掩码
+    spans = load_market_spans(market, str(C.dpm.get_data_uri(freq="day")))
+    codes = list(dict.fromkeys(code for code, _, _ in spans))
+    df = D.features(codes, [f"${f}" for f in fields], start_time=start_time, end_time=end_time)
+    wide = df.unstack(level="instrument")
+    dates = wide.index
+    instruments = wide[f"${fields[0]}"].columns
+    present = pd.Series(True, index=df.index).unstack(level="instrument").reindex(index=dates, columns=instruments)
+    mask = present.fillna(False).values.astype(bool) & build_market_mask(dates, instruments, spans)
+    arrays = {f: wide[f"${f}"].reindex(columns=instruments).values.astype(np.float64) for f in fields}
+    return dates, instruments, arrays, mask
+
+def compute_signals(expressions, start_time, end_time, market="csi300", snapshot_uri=None, score=None):
+    """
+    向量化多信号计算原子。
+    原始字段只加载一次，所有表达式在 dates×instruments 矩阵上批量计算，
+    结果为 <datetime, instrument> 索引的 DataFrame，可直接传给 create_simple_strategy。
+    :param expressions: 表达式列表或 {名称: 表达式} 字典，如 {"mom20": "ret($close, 20)", "z": "zscore($close, 20)"}
+    :param score: None 保持原顺序; 字符串表示把该列放在第一列 (TopkDropoutStrategy 使用第一列);
+                  字典 {名称: 权重} 表示新增加权合成的 "score" 列并放在第一列
+    """
+    if not isinstance(expressions, dict):
+        expressions = {expr: expr for expr in expressions}
+    nodes = {name: parse_expression(expr) for name, expr in expressions.items()}
+    fields = set().union(*(expression_fields(node) for node in nodes.values()))
+    lookback = max(expression_lookback(node) for node in nodes.values())
+
+    # 为回看窗口向前多加载 lookback 个交易日，计算后再截掉
+    calendar = get_trade_calendar(snapshot_uri)
+    start_pos = calendar.searchsorted(pd.Timestamp(start_time))
+    load_start = calendar[max(start_pos - lookback, 0)] if len(calendar) else start_time
+
+    dates, instruments, arrays, mask = load_dense_fields(fields, load_start, end_time, market, snapshot_uri)
+    results = evaluate_expressions(expressions, arrays, mask=mask)
+
+    keep = np.asarray(dates >= pd.Timestamp(start_time))
+    mask = mask[keep]
+    columns = {name: value[keep][mask] for name, value in results.items()}
+    if isinstance(score, dict):
+        weighted = np.stack([columns[name] * weight for name, weight in score.items()])
+        combined = np.where(np.isnan(weighted).all(axis=0), np.nan, np.nansum(weighted, axis=0))
+        columns = {"score": combined, **columns}
+    elif isinstance(score, str):
+        columns = {score: columns[score], **{k: v for k, v in columns.items() if k != score}}
+
+    rows, cols = np.nonzero(mask)
+    index = pd.MultiIndex.from_arrays([dates[keep][rows], instruments[cols]], names=["datetime", "instrument"])
+    return pd.DataFrame(columns, index=index)
+
+# ---------------- 按时间分块的流式信号 ----------------
+# 流式模式的默认表达式: 与 get_simple_signal 相同的每日收益率演示信号
+DEFAULT_STREAM_EXPRESSIONS = {"score": "ret($close, 1)"}
+
+def iter_signal_chunks(
+    start_time,
+    end_time,
+    market="csi300",
+    expressions=None,
+    chunk_size=250,
+    snapshot_uri=None,
+    score=None
+):
+    """
+    按交易日历分块生成信号的生成器原子。
+    每块只加载 [块起点 - 回看窗口, 块终点] 的数据 (回看部分由 compute_signals 自动补足)，
+    峰值内存由 chunk_size 决定而与历史长度无关。
+    第一块从 start_time 的前一个交易日开始，以覆盖策略首个交易日所需的预测信号。
+    :param chunk_size: 每块的交易日数
+    :yield: (块起点, 块终点, <datetime, instrument> 索引的信号 DataFrame)
+    """
+    expressions = expressions or DEFAULT_STREAM_EXPRESSIONS
+    calendar = get_trade_calendar(snapshot_uri)
+    lo = max(calendar.searchsorted(pd.Timestamp(start_time)) - 1, 0)
+    hi = calendar.searchsorted(pd.Timestamp(end_time), side="right")
+    for pos in range(lo, hi, chunk_size):
+        chunk_start, chunk_end = calendar[pos], calendar[min(pos + chunk_size, hi) - 1]
+        block = compute_signals(expressions, chunk_start, chunk_end, market=market, snapshot_uri=snapshot_uri, score=score)
+        yield chunk_start, chunk_end, block.fillna(0)
+
+class StreamingSignal(Signal):
+    """
+    从 iter_signal_chunks 按需拉取信号块的 qlib Signal。
+    回测按时间推进时才读取下一块，并丢弃已过期的块，内存中最多保留两块。
+    """
+    def __init__(self, chunks):
+        """
+        :param chunks: iter_signal_chunks 返回的生成器
+        """
+        self.chunks = iter(chunks)
+        self.blocks = []
+        self.exhausted = False
+        # 出现过的标的 (用于回测后绘制价格图)
+        self.instruments = set()
+
+    def _advance(self, end_time):
+        while not self.exhausted and (not self.blocks or self.blocks[-1][1] < end_time):
+            try:
+                chunk_start, chunk_end, block = next(self.chunks)
+            except StopIteration:
+                self.exhausted = True
+                break
+            self.instruments.update(block.index.get_level_values("instrument").unique())
+            self.blocks.append((chunk_start, chunk_end, block))
+
+    def get_signal(self, start_time: pd.Timestamp, end_time: pd.Timestamp):
+        self._advance(pd.Timestamp(end_time))
+        # 丢弃已完全早于查询区间的块 (至少保留最后一块)
+        while len(self.blocks) > 1 and self.blocks[0][1] < pd.Timestamp(start_time):
+            self.blocks.pop(0)
+        for chunk_start, chunk_end, block in reversed(self.blocks):
+            if chunk_start <= pd.Timestamp(end_time):
+                signal = resam_ts_data(block, start_time=start_time, end_time=end_time, method="last")
+                if signal is not None and len(signal) > 0:
+                    return signal
+        return None
@@ -1,11 +1,70 @@
 from typing import Any, Optional, Dict, List, Union, cast
 import copy
+import numpy as np
 import pandas as pd
 
 from qlib.contrib.strategy.signal_strategy import TopkDropoutStrategy, WeightStrategyBase
 from qlib.backtest.decision import TradeDecisionWO
 from qlib.backtest.position import Position
 
+class PositionView:
+    """
+    持仓的只读快照视图。
+    只拷贝现金与各标的的数量/价格，供权重检查使用，避免每个交易步骤深拷贝整个 Position。
+    """
+    _NON_STOCK_KEYS = {"cash", "now_account_value", "cash_delay"}
+
+    def __init__(self, position: Union[Position, dict]):
+        """
+        :param position: 当前持仓对象，或与 Position.position 结构相同的字典
+        """
+        raw = position.position if isinstance(position, Position) else position
+        self.cash = raw["cash"]
+        self.cash_delay = raw.get("cash_delay", 0.0)
+        # 与 Position.get_stock_list 相同的遍历顺序，保证市值求和结果逐位一致
+        self.stocks = {
+            code: (raw[code]["amount"], raw[code].get("price"))
+            for code in list(set(raw.keys()) - self._NON_STOCK_KEYS)
+        }
+
+    def get_cash(self, include_settle: bool = False) -> float:
+        return self.cash + self.cash_delay if include_settle else self.cash
+
+    def check_stock(self, stock_id: str) -> bool:
+        return stock_id in self.stocks
+
+    def get_stock_list(self) -> List[str]:
+        return list(self.stocks)
+
+    def get_stock_amount(self, code: str) -> float:
+        return self.stocks[code][0] if code in self.stocks else 0
+
+    def get_stock_price(self, code: str) -> float:
+        return self.stocks[code][1]
+
+    def get_market_values(self, codes: List[str]) -> np.ndarray:
+        """
+        按 codes 顺序返回各资产市值数组 (cash 为现金，未持有或价格无效时为 0)
+        """
+        stocks, cash = self.stocks, self.cash
+        return np.array([
+            cash if code == 'cash' else self._market_value(stocks.get(code))
+            for code in codes
+        ], dtype=float)
+
+    @staticmethod
+    def _market_value(item) -> float:
+        if item is None:
+            return 0.0
+        amount, price = item
+        return amount * price if price and price > 0 else 0.0
+
+    def calculate_value(self) -> float:
+        value = 0
+        for amount, price in self.stocks.values():
+            value += amount * price
+        return value + self.cash + self.cash_delay
+
 class PermanentPortfolioStrategy(WeightStrategyBase):
     """
     哈利·布朗永久投资组合策略原子。
@@ -42,17 +101,117 @@ class PermanentPortfolioStrategy(WeightStrategyBase):
         # 如果未提供分组，则每个资产自成一组
         self.asset_groups = asset_groups or {asset: [asset] for asset in asset_weights}
         self.last_rebalance_date: Optional[pd.Timestamp] = None
+        self._compile_groups()
+        # 各交易步骤的周期键 (月份/年份)，在绑定执行器时根据交易日历预计算
+        self._step_keys: Optional[np.ndarray] = None
+        self._step_keys_range = None
+
+    def get_checkpoint_state(self) -> dict:
+        """
+        断点续跑需要保存的策略状态
+        """
+        return {"last_rebalance_date": self.last_rebalance_date}
+
+    def set_checkpoint_state(self, state: dict) -> None:
+        """
+        从断点恢复策略状态
+        """
+        self.last_rebalance_date = state["last_rebalance_date"]
+
+    def reset(self, level_infra: Any = None, common_infra: Any = None, outer_trade_decision: Any = None, **kwargs: Any) -> None:
+        super().reset(level_infra=level_infra, common_infra=common_infra, outer_trade_decision=outer_trade_decision, **kwargs)
+        # 交易日历可能已变化: 下一步时重新预计算周期键
+        if level_infra is not None:
+            self._step_keys_range = None
+
+    def _compile_step_keys(self):
+        """
+        根据交易日历预计算每个交易步骤的周期键: month 频率为月份，year 频率为年份。
+        与 generate_target_weight_position 的判断一致 (月份只比较月份数字)。
+        """
+        calendar = self.trade_calendar
+        self._step_keys_range = (calendar.start_index, calendar.end_index)
+        if self.rebalance_freq not in ("month", "year"):
+            self._step_keys = None
+            return
+        step_times = pd.DatetimeIndex([calendar.get_step_time(i)[0] for i in range(calendar.get_trade_len())])
+        self._step_keys = np.asarray(step_times.month if self.rebalance_freq == "month" else step_times.year)
+
+    def _is_noop_step(self, trade_step: int) -> bool:
+        """
+        判断当前步骤是否不可能再平衡 (与上次再平衡处于同一周期)，可直接返回空决策
+        """
+        if self.last_rebalance_date is None or self.rebalance_freq not in ("month", "year"):
+            return False
+        calendar = self.trade_calendar
+        if self._step_keys_range != (calendar.start_index, calendar.end_index):
+            self._compile_step_keys()
+        last_key = self.last_rebalance_date.month if self.rebalance_freq == "month" else self.last_rebalance_date.year
+        return self._step_keys[trade_step] == last_key
+
+    def _compile_groups(self):
+        """
+        将 asset_weights 与 asset_groups 预编译为 NumPy 索引/权重数组，供每步的向量化偏离度检查使用。
+        """
+        # 分组中出现的所有资产 (去重，保持首次出现的顺序)，cash 为现金伪资产
+        codes = list(dict.fromkeys(asset for assets in self.asset_groups.values() for asset in assets))
+        index = {code: i for i, code in enumerate(codes)}
+        self._codes = codes
+        target_weights = np.array([self.asset_weights.get(code, 0) for code in codes], dtype=float)
+        # 参与组内偏离度检查的资产 (目标权重 > 0)
+        self._checked_idx = np.flatnonzero(target_weights > 0)
+        self._checked_targets = target_weights[self._checked_idx]
+        # 组成员 -> 资产索引 / 组索引 (同一资产可出现在多个组中)
+        self._member_idx = np.array(
+            [index[asset] for assets in self.asset_groups.values() for asset in assets], dtype=np.intp
+        )
+        self._member_group = np.array(
+            [g for g, assets in enumerate(self.asset_groups.values()) for _ in assets], dtype=np.intp
+        )
+        self._n_groups = len(self.asset_groups)
+
+    @staticmethod
+    def _asset_value(current: Union[Position, PositionView], code: str) -> float:
+        """
+        资产当前市值 (cash 为现金，未持有或价格无效时为 0)
+        """
+        if code == 'cash':
+            return current.get_cash()
+        if current.check_stock(code):
+            price = current.get_stock_price(code)
+            if price and price > 0:
+                return current.get_stock_amount(code) * price
+        return 0.0
+
+    def _need_rebalance(self, current: Union[Position, PositionView], total_value: float) -> bool:
+        """
+        向量化检查当前持仓是否偏离目标: 组内资产相对偏离度超过阈值，或组总权重超出 [min_weight, max_weight]。
+        """
+        if isinstance(current, PositionView):
+            values = current.get_market_values(self._codes)
+        else:
+            values = np.array([self._asset_value(current, code) for code in self._codes], dtype=float)
+        weights = values / total_value
+
+        # 1. 组内单个资产的相对偏离度
+        target = self._checked_targets
+        if (np.abs(weights[self._checked_idx] - target) / target > self.internal_weight_threshold).any():
+            return True
+
+        # 2. 组总权重的上下限
+        group_weights = np.bincount(self._member_group, weights=weights[self._member_idx], minlength=self._n_groups)
+        return bool(((group_weights > self.max_weight) | (group_weights < self.min_weight)).any())
 
     def generate_target_weight_position(
         self, 
         trade_start_time: pd.Timestamp, 
-        current: Optional[Position] = None,
+        current: Optional[Union[Position, PositionView]] = None,
         **kwargs: Any
     ) -> Optional[Dict[str, float]]:
         """
         生成目标权重持仓。
         :param trade_start_time: 当前交易步骤的时间
-        :param current: 当前持仓对象
+        :param current: 当前持仓对象 (或其只读视图 PositionView)
         :param kwargs: 包含 score, trade_end_time 等冗余参数
         """
         # 1. 判断是否到达再平衡检查时间点（由频率决定）
@@ -77,41 +236,9 @@ class PermanentPortfolioStrategy(WeightStrategyBase):
         # 3. 检查偏离度逻辑
         if current is not None:
             total_value = current.calculate_value()
-            if total_value > 0:
-                need_rebalance = False
-                for group_name, assets in self.asset_groups.items():
-                    group_weight = 0.0
-                    for asset in assets:
-                        curr_asset_weight = 0.0
-                        if asset == 'cash':
-                            curr_asset_weight = current.get_cash() / total_value
-                        elif current.check_stock(asset):
-                            amount = current.get_stock_amount(asset)
-                            price = current.get_stock_price(asset)
-                            if price and price > 0:
-                                curr_asset_weight = (amount * price) / total_value
-                        
-                        group_weight += curr_asset_weight
-                        
-                        # 检查组内单个资产的偏离度
-                        target_asset_weight = self.asset_weights.get(asset, 0)
-                        if target_asset_weight > 0:
-                            relative_deviation = abs(curr_asset_weight - target_asset_weight) / target_asset_weight
-                            if relative_deviation > self.internal_weight_threshold:
-                                need_rebalance = True
-                                break
-                    
-                    if need_rebalance:
-                        break
-                    
-                    # 检查组总权重的触发条件
-                    if group_weight > self.max_weight or group_weight < self.min_weight:
-                        need_rebalance = True
-                        break
-                
-                # 如果所有检查都通过，则跳过本次再平衡
-                if not need_rebalance:
-                    return None
+            # 如果所有检查都通过，则跳过本次再平衡
+            if total_value > 0 and not self._need_rebalance(current, total_value):
+                return None
 
         self.last_rebalance_date = trade_start_time
         return self.asset_weights
@@ -121,24 +248,33 @@ class PermanentPortfolioStrategy(WeightStrategyBase):
         重写交易决策逻辑，绕过对 signal 的强制检查。
         """
         trade_step = self.trade_calendar.get_trade_step()
+        # 与上次再平衡处于同一周期: 不访问持仓与订单生成器，直接返回空决策
+        if self._is_noop_step(trade_step):
+            return TradeDecisionWO([], self)
+        
         trade_start_time, trade_end_time = self.trade_calendar.get_step_time(trade_step)
         
         # 预估信号的时间段（虽然本策略不用，但为了兼容性保留）
         pred_start_time, pred_end_time = self.trade_calendar.get_step_time(trade_step, shift=1)
         
-        # 获取当前持仓快照
+        # 获取当前持仓的只读视图 (不拷贝 Position)
         # self.trade_position 返回的是 BasePosition，这里显式转换为 Position
-        current_temp = cast(Position, copy.deepcopy(self.trade_position))
+        position = cast(Position, self.trade_position)
         
         # 获取目标权重
         target_weight_position = self.generate_target_weight_position(
             trade_start_time=trade_start_time,
             score=None, 
-            current=current_temp, 
+            current=PositionView(position), 
             trade_end_time=trade_end_time
         )
         
-        # 如果 target_weight_position 为 None，则 generate_order_list_from_target_weight_position 会返回空列表
+        # 无需再平衡: 直接返回空决策
+        if target_weight_position is None:
+            return TradeDecisionWO([], self)
+        
+        # 仅在需要下单时才深拷贝持仓，供订单生成器使用
+        current_temp = copy.deepcopy(position)
         order_list = self.order_generator.generate_order_list_from_target_weight_position(
             current=current_temp,
             trade_exchange=self.trade_exchange,
@@ -1,4 +1,8 @@
 from ..molecular.backtest_pipeline import standard_backtest_pipeline, permanent_portfolio_pipeline
+from ..molecular.sweep_pipeline import (
+    parameter_sweep_pipeline, walk_forward_pipeline, generate_walk_forward_windows, start_horizon_pipeline
+)
+from ..molecular.live_pipeline import permanent_live_pipeline
 
 def run_strategy_commander(config):
     """
@@ -22,14 +26,22 @@ def run_strategy_commander(config):
         #         end_time=cfg["end_time"],
         #         strategy_kwargs=cfg["strategy"]["kwargs"],
         #         provider_uri=cfg.get("provider_uri", "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"),
+        #         market=cfg.get("market") or "csi300",
         #         benchmark=cfg.get("benchmark", "SH000300"),
         #         account=cfg.get("account", 100000000),
-        #         exchange_kwargs=cfg.get("exchange_kwargs")
+        #         exchange_kwargs=cfg.get("exchange_kwargs"),
+        #         storage=cfg.get("storage") or "file",
+        #         quote_cache_dir=cfg.get("quote_cache_dir"),
+        #         checkpoint_path=cfg.get("checkpoint_path"),
+        #         checkpoint_every=cfg.get("checkpoint_every") or 250,
+        #         report_bundle=cfg.get("report_bundle", False),
+        #         report_mode=cfg.get("report_mode") or "sync"
         #     )
         # },
         {
             "step": "execute_backtest_permanent",
-            "condition": lambda cfg: cfg.get("strategy", {}).get("class") == "PermanentPortfolioStrategy",
+            "condition": lambda cfg: cfg.get("strategy", {}).get("class") == "PermanentPortfolioStrategy"
+                and not cfg.get("sweep") and not cfg.get("walk_forward") and not cfg.get("sensitivity") and not cfg.get("live"),
             "action": lambda cfg: permanent_portfolio_pipeline(
                 start_time=cfg["start_time"],
                 end_time=cfg["end_time"],
@@ -42,7 +54,126 @@ def run_strategy_commander(config):
                 provider_uri=cfg.get("provider_uri", "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"),
                 benchmark=cfg.get("benchmark", "SH000300"),
                 account=cfg.get("account", 100000000),
-                exchange_kwargs=cfg.get("exchange_kwargs")
+                exchange_kwargs=cfg.get("exchange_kwargs"),
+                storage=cfg.get("storage") or "file",
+                engine=cfg.get("engine") or "qlib",
+                quote_cache_dir=cfg.get("quote_cache_dir"),
+                checkpoint_path=cfg.get("checkpoint_path"),
+                checkpoint_every=cfg.get("checkpoint_every") or 250,
+                report_bundle=cfg.get("report_bundle", False),
+                report_mode=cfg.get("report_mode") or "sync"
+            )
+        },
+        {
+            "step": "execute_parameter_sweep",
+            "condition": lambda cfg: cfg.get("strategy", {}).get("class") == "PermanentPortfolioStrategy"
+                and bool(cfg.get("sweep")) and not cfg.get("walk_forward") and not cfg.get("sensitivity") and not cfg.get("live"),
+            "action": lambda cfg: parameter_sweep_pipeline(
+                start_time=cfg["start_time"],
+                end_time=cfg["end_time"],
+                asset_weights=cfg["sweep"].get("asset_weights", cfg["strategy"]["kwargs"]["asset_weights"]),
+                rebalance_freq=cfg["sweep"].get("rebalance_freq", cfg["strategy"]["kwargs"].get("rebalance_freq", "month")),
+                min_weight=cfg["sweep"].get("min_weight", cfg["strategy"]["kwargs"].get("min_weight", 0.15)),
+                max_weight=cfg["sweep"].get("max_weight", cfg["strategy"]["kwargs"].get("max_weight", 0.35)),
+                internal_weight_threshold=cfg["sweep"].get(
+                    "internal_weight_threshold", cfg["strategy"]["kwargs"].get("internal_weight_threshold", 0.1)
+                ),
+                windows=cfg["sweep"].get("windows"),
+                asset_groups=cfg["strategy"]["kwargs"].get("asset_groups"),
+                provider_uri=cfg.get("provider_uri", "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"),
+                benchmark=cfg.get("benchmark", "SH000300"),
+                account=cfg.get("account", 100000000),
+                exchange_kwargs=cfg.get("exchange_kwargs"),
+                storage=cfg.get("storage") or "file",
+                max_workers=cfg["sweep"].get("max_workers"),
+                plot=cfg["sweep"].get("plot", False),
+                report_bundle=cfg.get("report_bundle", False),
+                report_mode=cfg.get("report_mode") or "sync"
+            )
+        },
+        {
+            # 前推回测: 训练区间上的参数网格取自 sweep 配置 (未配置 sweep 时只使用 strategy.kwargs 中的一组参数)
+            "step": "execute_walk_forward",
+            "condition": lambda cfg: cfg.get("strategy", {}).get("class") == "PermanentPortfolioStrategy"
+                and bool(cfg.get("walk_forward")) and not cfg.get("sensitivity") and not cfg.get("live"),
+            "action": lambda cfg: walk_forward_pipeline(
+                windows=cfg["walk_forward"].get("windows") or generate_walk_forward_windows(
+                    cfg["start_time"],
+                    cfg["end_time"],
+                    train_months=cfg["walk_forward"].get("train_months", 24),
+                    test_months=cfg["walk_forward"].get("test_months", 12),
+                    step_months=cfg["walk_forward"].get("step_months"),
+                    anchored=cfg["walk_forward"].get("anchored", False)
+                ),
+                asset_weights=(cfg.get("sweep") or {}).get("asset_weights", cfg["strategy"]["kwargs"]["asset_weights"]),
+                rebalance_freq=(cfg.get("sweep") or {}).get(
+                    "rebalance_freq", cfg["strategy"]["kwargs"].get("rebalance_freq", "month")
+                ),
+                min_weight=(cfg.get("sweep") or {}).get("min_weight", cfg["strategy"]["kwargs"].get("min_weight", 0.15)),
+                max_weight=(cfg.get("sweep") or {}).get("max_weight", cfg["strategy"]["kwargs"].get("max_weight", 0.35)),
+                internal_weight_threshold=(cfg.get("sweep") or {}).get(
+                    "internal_weight_threshold", cfg["strategy"]["kwargs"].get("internal_weight_threshold", 0.1)
+                ),
+                asset_groups=cfg["strategy"]["kwargs"].get("asset_groups"),
+                select_metric=cfg["walk_forward"].get("select_metric", "Sharpe Ratio"),
+                select_ascending=cfg["walk_forward"].get("select_ascending", False),
+                provider_uri=cfg.get("provider_uri", "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"),
+                benchmark=cfg.get("benchmark", "SH000300"),
+                account=cfg.get("account", 100000000),
+                exchange_kwargs=cfg.get("exchange_kwargs"),
+                storage=cfg.get("storage") or "file",
+                max_workers=cfg["walk_forward"].get("max_workers")
+            )
+        },
+        {
+            # 起点 × 持有期敏感性分析: 一次计算所有起始月份与持有月数组合的指标
+            "step": "execute_sensitivity",
+            "condition": lambda cfg: cfg.get("strategy", {}).get("class") == "PermanentPortfolioStrategy"
+                and bool(cfg.get("sensitivity")) and not cfg.get("live"),
+            "action": lambda cfg: start_horizon_pipeline(
+                start_time=cfg["start_time"],
+                end_time=cfg["end_time"],
+                asset_weights=cfg["strategy"]["kwargs"]["asset_weights"],
+                rebalance_freq=cfg["strategy"]["kwargs"].get("rebalance_freq", "month"),
+                min_weight=cfg["strategy"]["kwargs"].get("min_weight", 0.15),
+                max_weight=cfg["strategy"]["kwargs"].get("max_weight", 0.35),
+                internal_weight_threshold=cfg["strategy"]["kwargs"].get("internal_weight_threshold", 0.1),
+                asset_groups=cfg["strategy"]["kwargs"].get("asset_groups"),
+                horizons=cfg["sensitivity"].get("horizons"),
+                exact=cfg["sensitivity"].get("exact", False),
+                provider_uri=cfg.get("provider_uri", "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"),
+                benchmark=cfg.get("benchmark", "SH000300"),
+                account=cfg.get("account", 100000000),
+                exchange_kwargs=cfg.get("exchange_kwargs"),
+                storage=cfg.get("storage") or "file",
+                max_workers=cfg["sensitivity"].get("max_workers")
+            )
+        },
+        {
+            # 实盘增量模式: 从完整回测的断点 (或给定持仓) 出发，只计算最新交易日的调仓决策
+            "step": "execute_live",
+            "condition": lambda cfg: cfg.get("strategy", {}).get("class") == "PermanentPortfolioStrategy"
+                and bool(cfg.get("live")),
+            "action": lambda cfg: permanent_live_pipeline(
+                asset_weights=cfg["strategy"]["kwargs"]["asset_weights"],
+                rebalance_freq=cfg["strategy"]["kwargs"].get("rebalance_freq", "month"),
+                min_weight=cfg["strategy"]["kwargs"].get("min_weight", 0.15),
+                max_weight=cfg["strategy"]["kwargs"].get("max_weight", 0.35),
+                asset_groups=cfg["strategy"]["kwargs"].get("asset_groups"),
+                internal_weight_threshold=cfg["strategy"]["kwargs"].get("internal_weight_threshold", 0.1),
+                trade_date=cfg["live"].get("trade_date"),
+                checkpoint_path=None if cfg["live"].get("position") else (
+                    cfg["live"].get("checkpoint_path") or cfg.get("checkpoint_path")
+                ),
+                position=cfg["live"].get("position"),
+                last_rebalance_date=cfg["live"].get("last_rebalance_date"),
+                provider_uri=cfg.get("provider_uri", "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"),
+                benchmark=cfg.get("benchmark", "SH000300"),
+                account=cfg.get("account", 100000000),
+                exchange_kwargs=cfg.get("exchange_kwargs"),
+                storage=cfg.get("storage") or "file",
+                quote_cache_dir=cfg.get("quote_cache_dir"),
+                save=cfg["live"].get("save", True)
             )
         }
     ]
@@ -54,7 +185,7 @@ def run_strategy_commander(config):
         if task["condition"](config):
             print(f"[Commander] 正在执行步骤: {step_name}")
             res = task["action"](config)
-            if res:
+            if res is not None:
                 results[step_name] = res
         else:
             # 对于可选的回测步骤，如果条件不满足且没有定义 on_fail，则跳过
@@ -63,5 +194,13 @@ def run_strategy_commander(config):
             print(f"[Commander] 跳过步骤: {step_name}")
 
     # 返回最后一次执行的回测结果
+    if "execute_live" in results:
+        return results["execute_live"]
+    if "execute_sensitivity" in results:
+        return results["execute_sensitivity"]
+    if "execute_walk_forward" in results:
+        return results["execute_walk_forward"]
+    if "execute_parameter_sweep" in results:
+        return results["execute_parameter_sweep"]
     final_res = results.get("execute_backtest_standard") or results.get("execute_backtest_permanent")
     return final_res
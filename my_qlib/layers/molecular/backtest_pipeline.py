@@ -1,27 +1,89 @@
+from qlib.data import D
 from ..atomic.env_init import init_qlib_env
 from ..atomic.backtest_executor import create_simulator_executor, run_backtest
 from ..atomic.report_generator import analyze_risk, calculate_summary_stats, plot_backtest_analysis
+from ..atomic.report_jobs import REPORT_MODES, submit_report
 from ..atomic.data_handler import get_simple_signal
+from ..atomic.signal_engine import compute_signals, iter_signal_chunks, StreamingSignal
 from ..atomic.strategy_pool import create_simple_strategy, create_permanent_strategy
+from ..atomic.fast_backtest import load_market_data, run_fast_backtest, market_price_panel
+from ..atomic.exchange_cache import exchange_price_panel
+
+def _with_benchmark(codes, benchmark):
+    """
+    交易所股票池: 策略标的 + 基准 (基准为单个标的代码时)
+    """
+    codes = list(codes)
+    if isinstance(benchmark, str) and benchmark not in codes:
+        codes.append(benchmark)
+    return codes
+
+def _check_report_mode(report_mode):
+    """
+    在回测开始前检查 report_mode，避免回测结束后才报错
+    """
+    if report_mode not in REPORT_MODES:
+        raise ValueError(f"未知的 report_mode: {report_mode}，可选 {REPORT_MODES}")
+
+def _generate_report(report_mode, report_normal, **plot_kwargs):
+    """
+    按 report_mode 生成图表: sync 同步绘图，async 提交到后台报告执行器并返回 Future，off 不绘图
+    """
+    if report_mode == "off":
+        return None
+    if report_mode == "async":
+        # 后台任务使用报表副本，调用方之后对结果的修改不影响绘图
+        return submit_report(plot_backtest_analysis, report_normal.copy(), **plot_kwargs)
+    plot_backtest_analysis(report_normal, **plot_kwargs)
+    return None
 
 def standard_backtest_pipeline(
     start_time, 
     end_time, 
     strategy_kwargs, 
     provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    market="csi300",
     benchmark="SH000300",
     account=100000000,
-    exchange_kwargs=None
+    exchange_kwargs=None,
+    storage="file",
+    feature_cache_dir=None,
+    signal_expressions=None,
+    signal_score=None,
+    stream_chunk_size=None,
+    quote_cache_dir=None,
+    checkpoint_path=None,
+    checkpoint_every=250,
+    report_bundle=False,
+    report_mode="sync"
 ):
     """
     标准回测流水线分子。
     线性组合：初始化 -> 信号生成 -> 创建策略 -> 创建执行器 -> 运行回测 -> 分析结果
+    :param market: 股票池名称，信号 (含流式模式) 在该股票池上计算，流式模式下交易所也加载其全部标的
+    :param signal_expressions: 信号表达式列表/字典，提供时使用向量化信号引擎 (compute_signals) 代替演示信号
+    :param signal_score: 传给 compute_signals 的 score 参数 (首列作为策略使用的分值)
+    :param stream_chunk_size: 提供时以流式模式按该交易日数分块生成信号，内存占用与回测区间长度无关
+    :param quote_cache_dir: 交易所行情表磁盘缓存目录，None 表示只使用内存缓存
+    :param checkpoint_path: 断点文件路径，提供时每 checkpoint_every 个交易日保存一次状态，再次运行时从断点续跑或向后扩展
+    :param report_bundle: 为 True 时图表输出为报告包 (共享 plotly.js、长序列降采样、index.html 索引页)
+    :param report_mode: sync 同步绘图 (默认)；async 在后台生成图表，结果中的 report_job 为对应的 Future
+                        (可用 report_jobs.wait_reports / cancel_reports 等待或取消)；off 不绘图
     """
     # 1. 环境初始化
-    init_qlib_env(provider_uri=provider_uri)
+    _check_report_mode(report_mode)
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
     
     # 2. 信号生成 (L4 原子)
-    signal = get_simple_signal(start_time, end_time)
+    if stream_chunk_size:
+        signal = StreamingSignal(iter_signal_chunks(
+            start_time, end_time, market=market, expressions=signal_expressions, chunk_size=stream_chunk_size,
+            score=signal_score
+        ))
+    elif signal_expressions:
+        signal = compute_signals(signal_expressions, start_time, end_time, market=market, score=signal_score)
+    else:
+        signal = get_simple_signal(start_time, end_time, market=market, cache_dir=feature_cache_dir)
     
     # 3. 创建策略 (L4 原子)
     strategy = create_simple_strategy(
@@ -33,7 +95,12 @@ def standard_backtest_pipeline(
     # 4. 创建执行器
     executor = create_simulator_executor()
     
-    # 5. 运行回测
+    # 5. 运行回测 (交易所只加载信号覆盖的标的与基准)
+    if isinstance(signal, StreamingSignal):
+        # 流式信号尚未生成，使用其股票池在回测区间内的全部标的
+        universe = D.list_instruments(D.instruments(market), start_time=start_time, end_time=end_time, as_list=True)
+    else:
+        universe = list(signal.index.get_level_values('instrument').unique())
     portfolio_metrics, indicators = run_backtest(
         start_time=start_time,
         end_time=end_time,
@@ -41,7 +108,11 @@ def standard_backtest_pipeline(
         executor=executor,
         benchmark=benchmark,
         account=account,
-        exchange_kwargs=exchange_kwargs
+        exchange_kwargs=exchange_kwargs,
+        codes=_with_benchmark(universe, benchmark),
+        quote_cache_dir=quote_cache_dir,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=checkpoint_every
     )
     
     # 4. 结果提取 (假设频率为 1day)
@@ -56,12 +127,18 @@ def standard_backtest_pipeline(
         
         # 6. 绘图分析 (L4 原子)
         # 获取标的列表 (用于绘制价格图)
-        instruments = list(signal.index.get_level_values('instrument').unique()) if not signal.empty else None
-        plot_backtest_analysis(
+        if isinstance(signal, StreamingSignal):
+            instruments = sorted(signal.instruments) or None
+        else:
+            instruments = list(signal.index.get_level_values('instrument').unique()) if not signal.empty else None
+        report_job = _generate_report(
+            report_mode,
             report_normal, 
             instruments=instruments, 
             start_time=start_time, 
-            end_time=end_time
+            end_time=end_time,
+            bundle=report_bundle,
+            prices=exchange_price_panel(executor.trade_exchange)
         )
         
         return {
@@ -69,7 +146,8 @@ def standard_backtest_pipeline(
             "positions": positions_normal,
             "indicators": indicators,
             "analysis": analysis,
-            "stats": stats
+            "stats": stats,
+            "report_job": report_job
         }
     
     return None
@@ -86,13 +164,63 @@ def permanent_portfolio_pipeline(
     provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
     benchmark="SH000300",
     account=100000000,
-    exchange_kwargs=None
+    exchange_kwargs=None,
+    storage="file",
+    engine="qlib",
+    quote_cache_dir=None,
+    checkpoint_path=None,
+    checkpoint_every=250,
+    report_bundle=False,
+    report_mode="sync"
 ):
     """
     永久投资组合回测流水线分子。
+    :param engine: 回测引擎，qlib (默认) 或 fast (纯 NumPy 快速引擎，结果与 qlib 一致，见 fast_backtest.py)
+    :param quote_cache_dir: 交易所行情表磁盘缓存目录，None 表示只使用内存缓存
+    :param checkpoint_path: 断点文件路径，提供时每 checkpoint_every 个交易日保存一次状态，再次运行时从断点续跑或向后扩展
+    :param report_bundle: 为 True 时图表输出为报告包 (共享 plotly.js、长序列降采样、index.html 索引页)
+    :param report_mode: sync 同步绘图 (默认)；async 在后台生成图表，结果中的 report_job 为对应的 Future
+                        (可用 report_jobs.wait_reports / cancel_reports 等待或取消)；off 不绘图
     """
     # 1. 环境初始化
-    init_qlib_env(provider_uri=provider_uri)
+    _check_report_mode(report_mode)
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
+
+    if engine == "fast":
+        # 快速引擎: 一次性加载行情，逐日撮合在 NumPy 数组上完成
+        exchange_kwargs = exchange_kwargs or {}
+        market = load_market_data(
+            list(asset_weights.keys()), start_time, end_time, benchmark=benchmark,
+            deal_price=exchange_kwargs.get("deal_price"), limit_threshold=exchange_kwargs.get("limit_threshold")
+        )
+        report_normal, positions_normal = run_fast_backtest(
+            market,
+            asset_weights=asset_weights,
+            rebalance_freq=rebalance_freq,
+            min_weight=min_weight,
+            max_weight=max_weight,
+            asset_groups=asset_groups,
+            internal_weight_threshold=internal_weight_threshold,
+            account=account,
+            exchange_kwargs=exchange_kwargs
+        )
+        report_job = _generate_report(
+            report_mode,
+            report_normal,
+            instruments=list(asset_weights.keys()),
+            start_time=start_time,
+            end_time=end_time,
+            bundle=report_bundle,
+            prices=market_price_panel(market)
+        )
+        return {
+            "report": report_normal,
+            "positions": positions_normal,
+            "indicators": None,
+            "analysis": analyze_risk(report_normal),
+            "stats": calculate_summary_stats(report_normal["return"]),
+            "report_job": report_job
+        }
 
     # 2. 创建策略 (L4 原子) - 固定权重策略不需要预测信号
     strategy = create_permanent_strategy(
@@ -107,7 +235,7 @@ def permanent_portfolio_pipeline(
     # 3. 创建执行器
     executor = create_simulator_executor()
 
-    # 4. 运行回测
+    # 4. 运行回测 (交易所只加载组合内的标的与基准)
     portfolio_metrics, indicators = run_backtest(
         start_time=start_time,
         end_time=end_time,
@@ -115,7 +243,11 @@ def permanent_portfolio_pipeline(
         executor=executor,
         benchmark=benchmark,
         account=account,
-        exchange_kwargs=exchange_kwargs
+        exchange_kwargs=exchange_kwargs,
+        codes=_with_benchmark([code for code in asset_weights if code != "cash"], benchmark),
+        quote_cache_dir=quote_cache_dir,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=checkpoint_every
     )
 
     # 5. 结果处理
@@ -128,11 +260,14 @@ def permanent_portfolio_pipeline(
         # 6. 绘图分析
         # 获取标的列表 (用于绘制价格图)
         instruments = list(asset_weights.keys())
-        plot_backtest_analysis(
+        report_job = _generate_report(
+            report_mode,
             report_normal, 
             instruments=instruments, 
             start_time=start_time, 
-            end_time=end_time
+            end_time=end_time,
+            bundle=report_bundle,
+            prices=exchange_price_panel(executor.trade_exchange)
         )
         
         return {
@@ -140,6 +275,7 @@ def permanent_portfolio_pipeline(
             "positions": positions_normal,
             "indicators": indicators,
             "analysis": analysis,
-            "stats": stats
+            "stats": stats,
+            "report_job": report_job
         }
     return None
@@ -0,0 +1,62 @@
+from ..atomic.env_init import init_qlib_env
+from ..atomic.backtest_executor import create_simulator_executor
+from ..atomic.strategy_pool import create_permanent_strategy
+from ..atomic.live_trading import run_live_step
+from .backtest_pipeline import _with_benchmark
+
+def permanent_live_pipeline(
+    asset_weights,
+    rebalance_freq="month",
+    min_weight=0.15,
+    max_weight=0.35,
+    asset_groups=None,
+    internal_weight_threshold=0.1,
+    trade_date=None,
+    checkpoint_path=None,
+    position=None,
+    last_rebalance_date=None,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs=None,
+    storage="file",
+    quote_cache_dir=None,
+    save=True
+):
+    """
+    永久投资组合实盘 (增量) 流水线分子。
+    线性组合：初始化 -> 创建策略 -> 创建执行器 -> 从断点/持仓计算最新交易日的调仓决策
+    :param checkpoint_path: 完整回测 (backtest.checkpoint_path) 保存的断点，决策与完整回测一致，并写回断点
+    :param position: 不使用断点时的当前持仓 {"cash": 现金, 代码: 数量}
+    :param last_rebalance_date: 使用 position 时上次再平衡的日期 (month/year 频率必填；day 频率可省略，
+                                按偏离度判断是否再平衡)
+    """
+    # 1. 环境初始化
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
+
+    # 2. 创建策略与执行器 (参数须与生成断点的回测一致)
+    strategy = create_permanent_strategy(
+        asset_weights=asset_weights,
+        rebalance_freq=rebalance_freq,
+        min_weight=min_weight,
+        max_weight=max_weight,
+        asset_groups=asset_groups,
+        internal_weight_threshold=internal_weight_threshold
+    )
+    executor = create_simulator_executor()
+
+    # 3. 计算新交易日的决策
+    return run_live_step(
+        strategy,
+        executor,
+        trade_date=trade_date,
+        checkpoint_path=checkpoint_path,
+        position=position,
+        strategy_state=None if position is None else {"last_rebalance_date": last_rebalance_date},
+        benchmark=benchmark,
+        account=account,
+        exchange_kwargs=exchange_kwargs,
+        codes=_with_benchmark([code for code in asset_weights if code != "cash"], benchmark),
+        quote_cache_dir=quote_cache_dir,
+        save=save
+    )
@@ -0,0 +1,382 @@
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from qlib.config import C
+
+from ..atomic.env_init import init_qlib_env
+from ..atomic.report_generator import analyze_risk, calculate_summary_stats, start_horizon_metrics, SENSITIVITY_METRICS
+from ..atomic.fast_backtest import load_market_data, run_fast_backtest, market_price_panel
+from ..atomic.batch_backtest import run_batch_backtest
+from .backtest_pipeline import _check_report_mode, _generate_report
+
+# 参数扫描的维度 (取值为单个值或列表，做笛卡尔积)
+SWEEP_PARAMS = ["rebalance_freq", "min_weight", "max_weight", "internal_weight_threshold", "asset_weights", "window"]
+
+# 子进程中只读共享的行情 (fork 时直接继承父进程内存，不做序列化)
+_SWEEP_MARKET = None
+
+def _init_sweep_worker(market):
+    global _SWEEP_MARKET
+    _SWEEP_MARKET = market
+
+def _as_list(value):
+    """
+    把单个取值统一成列表 (asset_weights 的字典、window 的 (start, end) 元组视为单个取值)
+    """
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def _sweep_worker(task):
+    """
+    子进程任务: 在共享行情上运行一组参数的快速回测，返回一行指标
+    """
+    params, asset_groups, account, exchange_kwargs, keep_report = task
+    start_time, end_time = params["window"]
+    report, _ = run_fast_backtest(
+        _SWEEP_MARKET,
+        asset_weights=params["asset_weights"],
+        rebalance_freq=params["rebalance_freq"],
+        min_weight=params["min_weight"],
+        max_weight=params["max_weight"],
+        asset_groups=asset_groups,
+        internal_weight_threshold=params["internal_weight_threshold"],
+        account=account,
+        exchange_kwargs=exchange_kwargs,
+        start_time=start_time,
+        end_time=end_time
+    )
+    row = {
+        "rebalance_freq": params["rebalance_freq"],
+        "min_weight": params["min_weight"],
+        "max_weight": params["max_weight"],
+        "internal_weight_threshold": params["internal_weight_threshold"],
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+    row.update({f"w_{code}": weight for code, weight in params["asset_weights"].items()})
+    row.update(calculate_summary_stats(report["return"]))
+    row.update(analyze_risk(report)["risk"].to_dict())
+    row["rebalance_days"] = int((report["turnover"] > 0).sum())
+    row["final_account"] = float(report["account"].iloc[-1])
+    return row, report if keep_report else None
+
+def _run_sweep_tasks(market, tasks, max_workers=None):
+    """
+    在共享行情上执行一批回测任务: 单进程时直接在当前进程运行，否则交给进程池
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if max_workers <= 1:
+        _init_sweep_worker(market)
+        return [_sweep_worker(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_sweep_worker, initargs=(market,)) as pool:
+        return list(pool.map(_sweep_worker, tasks, chunksize=max(1, len(tasks) // (max_workers * 4))))
+
+def _expand_grid(rebalance_freq, min_weight, max_weight, internal_weight_threshold, asset_weights):
+    """
+    展开除回测区间以外的参数网格，返回参数字典列表
+    """
+    grid = [_as_list(rebalance_freq), _as_list(min_weight), _as_list(max_weight),
+            _as_list(internal_weight_threshold), _as_list(asset_weights)]
+    return [dict(zip(SWEEP_PARAMS[:-1], values)) for values in itertools.product(*grid)]
+
+def _load_shared_market(weight_list, windows, benchmark, exchange_kwargs):
+    """
+    加载所有权重涉及的标的在所有区间并集上的行情，供各次回测只读共享
+    """
+    codes = list(dict.fromkeys(code for weights in weight_list for code in weights))
+    return load_market_data(
+        codes, min(pd.Timestamp(w[0]) for w in windows), max(pd.Timestamp(w[-1]) for w in windows),
+        benchmark=benchmark, deal_price=exchange_kwargs.get("deal_price"), limit_threshold=exchange_kwargs.get("limit_threshold")
+    )
+
+def parameter_sweep_pipeline(
+    start_time,
+    end_time,
+    asset_weights,
+    rebalance_freq="month",
+    min_weight=0.15,
+    max_weight=0.35,
+    internal_weight_threshold=0.1,
+    windows=None,
+    asset_groups=None,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs=None,
+    storage="file",
+    max_workers=None,
+    plot=False,
+    save_path=".",
+    report_bundle=False,
+    report_mode="sync"
+):
+    """
+    永久投资组合参数扫描流水线分子。
+    rebalance_freq / min_weight / max_weight / internal_weight_threshold / asset_weights 均可传单个值或列表，
+    对所有组合做笛卡尔积；行情只加载一次，由进程池只读共享，每个组合用快速回测引擎运行。
+    :param asset_weights: 权重字典，或权重字典的列表
+    :param windows: 回测区间列表 [(start_time, end_time), ...]，默认只使用 (start_time, end_time)
+    :param max_workers: 进程数，默认使用全部 CPU 核心
+    :param plot: 是否为每个组合绘图 (默认关闭)，图表保存在 save_path/sweep_<序号>/ 下
+    :param report_bundle: 绘图时输出报告包，所有组合共用 save_path/assets 下的 plotly.js
+    :param report_mode: 绘图时的报告生成方式: sync 同步绘图，async 在后台生成图表、扫描结果立即返回
+                        (用 report_jobs.wait_reports 等待)，off 不绘图
+    :return: 每个组合一行的 DataFrame (参数列 + calculate_summary_stats + risk_analysis 指标)
+    """
+    # 1. 环境初始化
+    _check_report_mode(report_mode)
+    plot = plot and report_mode != "off"
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
+    exchange_kwargs = dict(exchange_kwargs or {})
+    # 交易单位在父进程中确定，子进程不依赖 qlib 配置
+    exchange_kwargs.setdefault("trade_unit", C.trade_unit)
+
+    # 2. 展开参数网格 (回测区间为最后一个维度)
+    windows = [tuple(w) for w in windows] if windows else [(start_time, end_time)]
+    combos = [
+        {**params, "window": window}
+        for params in _expand_grid(rebalance_freq, min_weight, max_weight, internal_weight_threshold, asset_weights)
+        for window in windows
+    ]
+    print(f"参数扫描: 共 {len(combos)} 组参数")
+
+    # 3. 一次性加载所有组合涉及的标的与最大区间的行情
+    market = _load_shared_market(_as_list(asset_weights), windows, benchmark, exchange_kwargs)
+
+    # 4. 进程池并行回测
+    tasks = [(params, asset_groups, account, exchange_kwargs, plot) for params in combos]
+    results = _run_sweep_tasks(market, tasks, max_workers)
+
+    # 5. 绘图 (可选)
+    if plot:
+        # 价格图复用共享行情，不再读取磁盘
+        prices = market_price_panel(market)
+        for i, ((_, report), params) in enumerate(zip(results, combos)):
+            path = os.path.join(save_path, f"sweep_{i:03d}")
+            os.makedirs(path, exist_ok=True)
+            plot_kwargs = dict(instruments=list(params["asset_weights"].keys()), start_time=params["window"][0],
+                               end_time=params["window"][1], save_path=path, bundle=report_bundle,
+                               asset_dir=os.path.join(save_path, "assets"), prices=prices)
+            _generate_report(report_mode, report, **plot_kwargs)
+
+    return pd.DataFrame([row for row, _ in results])
+
+def batch_weights_pipeline(
+    start_time,
+    end_time,
+    weights,
+    rebalance_freq="month",
+    min_weight=0.15,
+    max_weight=0.35,
+    asset_groups=None,
+    internal_weight_threshold=0.1,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs=None,
+    storage="file",
+    return_series=False
+):
+    """
+    批量权重回测流水线分子。
+    在同一再平衡规则下一次性评估大量权重向量 (见 batch_backtest.run_batch_backtest)，适合成千上万组配置的比较。
+    :param weights: N × 资产 的权重 DataFrame (列为资产代码，可包含 cash)，可由 make_weight_grid 生成
+    :return: (metrics, returns)，metrics 每个组合一行，returns 为 date × N 的日收益 (return_series=False 时为 None)
+    """
+    # 1. 环境初始化
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
+    exchange_kwargs = exchange_kwargs or {}
+
+    # 2. 加载行情 (所有组合共享)
+    market = load_market_data(
+        list(weights.columns), start_time, end_time, benchmark=benchmark,
+        deal_price=exchange_kwargs.get("deal_price"), limit_threshold=exchange_kwargs.get("limit_threshold")
+    )
+
+    # 3. 批量回测
+    return run_batch_backtest(
+        market,
+        weights,
+        rebalance_freq=rebalance_freq,
+        min_weight=min_weight,
+        max_weight=max_weight,
+        asset_groups=asset_groups,
+        internal_weight_threshold=internal_weight_threshold,
+        account=account,
+        exchange_kwargs=exchange_kwargs,
+        return_series=return_series
+    )
+
+def generate_walk_forward_windows(start_time, end_time, train_months=24, test_months=12, step_months=None, anchored=False):
+    """
+    生成前推回测的训练/测试区间
+    :param step_months: 每次前推的月数，默认等于 test_months (测试区间首尾相接)
+    :param anchored: True 时训练区间起点固定在 start_time (扩展窗口)，否则随测试区间一起滚动
+    :return: 生成器，每项为 (train_start, train_end, test_start, test_end)
+    """
+    start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+    step = pd.DateOffset(months=step_months or test_months)
+    train_start = start
+    test_start = start + pd.DateOffset(months=train_months)
+    while test_start <= end:
+        test_end = min(test_start + pd.DateOffset(months=test_months) - pd.Timedelta(days=1), end)
+        yield (start if anchored else train_start, test_start - pd.Timedelta(days=1), test_start, test_end)
+        train_start += step
+        test_start += step
+
+def walk_forward_pipeline(
+    windows,
+    asset_weights,
+    rebalance_freq="month",
+    min_weight=0.15,
+    max_weight=0.35,
+    internal_weight_threshold=0.1,
+    asset_groups=None,
+    select_metric="Sharpe Ratio",
+    select_ascending=False,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs=None,
+    storage="file",
+    max_workers=None
+):
+    """
+    前推 (walk-forward) / 滚动区间回测流水线分子。
+    windows 中每项为 (test_start, test_end) 或 (train_start, train_end, test_start, test_end)。
+    有训练区间时，先在训练区间上回测参数网格 (取值可为列表，同 parameter_sweep_pipeline)，按 select_metric 选出最优参数，
+    再用该参数回测测试区间。qlib 只初始化一次，行情按所有区间的并集只加载一次，各区间共享 (可并行)。
+    :param windows: 区间列表或生成器 (如 generate_walk_forward_windows)
+    :param select_metric: 选参指标 (calculate_summary_stats / risk_analysis 的列名)
+    :param select_ascending: True 表示指标越小越好 (如 Max Drawdown)
+    :param max_workers: 进程数，默认使用全部 CPU 核心
+    :return: {"windows": 每个区间一行的指标, "reports": {区间序号: 测试区间报告},
+              "oos_returns": 拼接的样本外日收益, "oos_equity": 样本外净值曲线, "stats": 样本外摘要指标}
+    """
+    # 1. 环境初始化 (只做一次)
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
+    exchange_kwargs = dict(exchange_kwargs or {})
+    exchange_kwargs.setdefault("trade_unit", C.trade_unit)
+
+    windows = [tuple(w) for w in windows]
+    if not windows:
+        raise ValueError("windows 不能为空")
+    combos = _expand_grid(rebalance_freq, min_weight, max_weight, internal_weight_threshold, asset_weights)
+    if len(combos) > 1 and any(len(w) == 2 for w in windows):
+        raise ValueError("没有训练区间的窗口只能使用一组参数")
+
+    # 2. 按所有区间的并集加载一次行情
+    market = _load_shared_market(_as_list(asset_weights), windows, benchmark, exchange_kwargs)
+
+    # 3. 训练: 每个区间在训练区间上回测全部参数组合，按 select_metric 选参
+    train_keys, train_tasks = [], []
+    for i, window in enumerate(windows):
+        if len(window) == 4 and len(combos) > 1:
+            for c, params in enumerate(combos):
+                train_keys.append((i, c))
+                train_tasks.append(({**params, "window": window[:2]}, asset_groups, account, exchange_kwargs, False))
+    chosen, train_scores = {}, {}
+    for (i, c), (row, _) in zip(train_keys, _run_sweep_tasks(market, train_tasks, max_workers) if train_tasks else []):
+        score = row[select_metric]
+        if i not in chosen or (score < train_scores[i] if select_ascending else score > train_scores[i]):
+            chosen[i], train_scores[i] = c, score
+    print(f"前推回测: {len(windows)} 个区间, 每个训练区间 {len(combos)} 组参数")
+
+    # 4. 测试: 用选出的参数回测各测试区间
+    test_tasks = [
+        ({**combos[chosen.get(i, 0)], "window": window[-2:]}, asset_groups, account, exchange_kwargs, True)
+        for i, window in enumerate(windows)
+    ]
+    rows, reports = [], {}
+    for i, (window, (row, report)) in enumerate(zip(windows, _run_sweep_tasks(market, test_tasks, max_workers))):
+        test_start, test_end = row.pop("start_time"), row.pop("end_time")
+        rows.append({
+            "window": i,
+            "train_start": window[0] if len(window) == 4 else None,
+            "train_end": window[1] if len(window) == 4 else None,
+            "test_start": test_start,
+            "test_end": test_end,
+            f"train_{select_metric}": train_scores.get(i),
+            **row
+        })
+        reports[i] = report
+
+    # 5. 拼接样本外收益 (测试区间重叠时保留较早区间的收益)
+    oos_returns = pd.concat([report["return"] for report in reports.values()])
+    oos_returns = oos_returns[~oos_returns.index.duplicated(keep="first")].sort_index()
+    return {
+        "windows": pd.DataFrame(rows),
+        "reports": reports,
+        "oos_returns": oos_returns,
+        "oos_equity": (account * (1 + oos_returns).cumprod()).rename("equity"),
+        "stats": calculate_summary_stats(oos_returns)
+    }
+
+def start_horizon_pipeline(
+    start_time,
+    end_time,
+    asset_weights,
+    rebalance_freq="month",
+    min_weight=0.15,
+    max_weight=0.35,
+    internal_weight_threshold=0.1,
+    asset_groups=None,
+    horizons=None,
+    exact=False,
+    provider_uri="/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data",
+    benchmark="SH000300",
+    account=100000000,
+    exchange_kwargs=None,
+    storage="file",
+    max_workers=None
+):
+    """
+    起点 × 持有期敏感性分析流水线分子: 对 start_time ~ end_time 内的每个起始月份与持有月数计算
+    总收益、年化收益、最大回撤与夏普，代替逐个区间 (如 2024、2025、2024-25、2013-25) 单独回测。
+    默认只回测一次全历史，各组合直接截取同一条日收益 (起点处的持仓沿用全历史回测的持仓)；
+    exact=True 时每个起始月份从现金开始单独回测一次至 end_time (建仓与调仓节奏随起点变化)，
+    同一起点的所有持有期共用这条收益路径，回测次数为起点数而不是组合数。行情只加载一次，各次回测共享 (可并行)。
+    :param horizons: 持有月数列表，None 表示所有可能的持有期
+    :param exact: 是否按起点重新模拟
+    :param max_workers: 精确模式的进程数，默认使用全部 CPU 核心
+    :return: {"table": 以 (start, horizon) 为索引的指标表, "heatmaps": {指标: 起始月份 × 持有月数的矩阵},
+              "report": 全历史回测报告 (精确模式为 None), "exact": exact}
+    """
+    # 1. 环境初始化与行情 (只做一次)
+    init_qlib_env(provider_uri=provider_uri, storage=storage)
+    exchange_kwargs = dict(exchange_kwargs or {})
+    exchange_kwargs.setdefault("trade_unit", C.trade_unit)
+    start_time, end_time = pd.Timestamp(start_time), pd.Timestamp(end_time)
+    market = _load_shared_market([asset_weights], [(start_time, end_time)], benchmark, exchange_kwargs)
+    params = {
+        "rebalance_freq": rebalance_freq, "min_weight": min_weight, "max_weight": max_weight,
+        "internal_weight_threshold": internal_weight_threshold, "asset_weights": asset_weights
+    }
+
+    # 2. 各起点的收益路径: 全历史一条，或每个起始月份单独回测一条
+    if exact:
+        months = pd.date_range(start_time.to_period("M").to_timestamp(), end_time, freq="MS")
+        tasks = [
+            ({**params, "window": (max(month, start_time), end_time)}, asset_groups, account, exchange_kwargs, True)
+            for month in months
+        ]
+        print(f"起点敏感性分析 (精确模式): {len(tasks)} 个起始月份")
+        results = _run_sweep_tasks(market, tasks, max_workers)
+        returns = pd.DataFrame({month: report["return"] for month, (_, report) in zip(months, results)})
+        report = None
+    else:
+        (_, report), = _run_sweep_tasks(market, [({**params, "window": (start_time, end_time)}, asset_groups, account, exchange_kwargs, True)], 1)
+        returns = report["return"]
+
+    # 3. 一次向量化计算全部 (起点, 持有期) 组合
+    table = start_horizon_metrics(returns, horizons=horizons)
+    print(f"起点敏感性分析: {table.index.get_level_values('start').nunique()} 个起始月份, {len(table)} 个组合")
+    return {
+        "table": table,
+        "heatmaps": {metric: table[metric].unstack("horizon") for metric in SENSITIVITY_METRICS},
+        "report": report,
+        "exact": exact
+    }
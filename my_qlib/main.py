@@ -5,9 +5,10 @@ import pandas as pd
 # 将当前目录加入路径，以便 import layers
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from layers.atomic.report_generator import format_positions_df
+from layers.atomic.report_generator import format_positions_df, write_positions_table
 from layers.coordination.commander import run_strategy_commander
 from layers.atomic.config_loader import load_yaml_config
+from layers.atomic.report_jobs import wait_reports, cancel_reports, get_report_jobs_stats
 
 def main():
     print("=== Qlib 4层原子架构回测框架 ===")
@@ -24,30 +25,81 @@ def main():
         "start_time": backtest_cfg.get("start_time"),
         "end_time": backtest_cfg.get("end_time"),
         "provider_uri": backtest_cfg.get("provider_uri"),
+        "market": backtest_cfg.get("market", "csi300"),
         "benchmark": backtest_cfg.get("benchmark", "SH000300"),
         "account": backtest_cfg.get("account", 1000000),
         "exchange_kwargs": backtest_cfg.get("exchange_kwargs"),
-        "strategy": strategy_cfg
+        "storage": backtest_cfg.get("storage", "file"),
+        "engine": backtest_cfg.get("engine", "qlib"),
+        "quote_cache_dir": backtest_cfg.get("quote_cache_dir"),
+        "checkpoint_path": backtest_cfg.get("checkpoint_path"),
+        "checkpoint_every": backtest_cfg.get("checkpoint_every", 250),
+        "positions_path": backtest_cfg.get("positions_path"),
+        "positions_print_days": backtest_cfg.get("positions_print_days", 20),
+        "report_bundle": backtest_cfg.get("report_bundle", False),
+        "report_mode": backtest_cfg.get("report_mode", "sync"),
+        "strategy": strategy_cfg,
+        "sweep": raw_config.get("sweep"),
+        "walk_forward": raw_config.get("walk_forward"),
+        "sensitivity": raw_config.get("sensitivity"),
+        "live": raw_config.get("live")
     }
 
     try:
         results = run_strategy_commander(config)
-        if results:
+        if isinstance(results, pd.DataFrame):
+            print("\n参数扫描完成！各组合指标：")
+            pd.set_option('display.max_rows', None)
+            pd.set_option('display.width', None)
+            print(results)
+        elif results and "orders" in results:
+            print(f"\n实盘决策完成！交易日: {results['date'].date()}，"
+                  f"{'需要再平衡' if results['rebalance'] else '无需再平衡'}")
+            pd.set_option('display.width', None)
+            if not results["orders"].empty:
+                print(results["orders"])
+            print("最新持仓:")
+            print(format_positions_df({results["date"]: results["position"]}))
+        elif results and "heatmaps" in results:
+            print(f"\n起点敏感性分析完成！{'(精确模式) ' if results['exact'] else ''}各持有年数在不同起始月份下的指标分布：")
+            pd.set_option('display.width', None)
+            table = results["table"]
+            yearly = table[table.index.get_level_values("horizon") % 12 == 0]
+            print(yearly.groupby(level="horizon")[["annualized_return", "max_drawdown", "sharpe"]].describe(percentiles=[0.5]))
+            if config["sensitivity"].get("save_path"):
+                table.to_csv(config["sensitivity"]["save_path"])
+                print(f"已保存完整指标表到: {config['sensitivity']['save_path']}")
+        elif results and "oos_returns" in results:
+            print("\n前推回测完成！各区间指标：")
+            pd.set_option('display.width', None)
+            print(results["windows"])
+            print("样本外拼接收益摘要指标：")
+            for k, v in results["stats"].items():
+                print(f"{k}: {v:.4f}")
+        elif results:
             print("\n回测完成！摘要指标：")
             for k, v in results["stats"].items():
                 print(f"{k}: {v:.4f}")
 
             print("=============== 持仓明细 (Positions) ===============")
-            pos_df = format_positions_df(results["positions"])
+            # 完整持仓明细以长表分块写入文件，终端只渲染最后 positions_print_days 个交易日 (null 表示全部)
+            if config["positions_path"]:
+                write_positions_table(results["positions"], config["positions_path"])
+            pos_df = format_positions_df(results["positions"], last_n=config["positions_print_days"])
             # 设置 pandas 打印选项以便更好地显示
             pd.set_option('display.max_rows', None) # 设置最大显示行数为 None (代表无限制，全部打印)
             pd.set_option('display.max_colwidth', None)
             pd.set_option('display.width', None)
-            # print(pos_df.tail(20)) # 默认打印最后20行
-            print(pos_df) # 默认打印最后20行
+            print(pos_df)
             print("===================================================")
 
+        # 后台生成的图表 (report_mode: async) 在退出前等待完成
+        if get_report_jobs_stats()["pending"]:
+            print("等待后台报告生成完成...")
+            wait_reports()
+
     except Exception as e:
+        cancel_reports()
         print(f"执行失败: {e}")
 
 if __name__ == "__main__":
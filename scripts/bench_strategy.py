@@ -0,0 +1,72 @@
+import os
+import sys
+import copy
+import time
+import argparse
+import pandas as pd
+
+# 直接使用 my_qlib 中的策略原子 (不需要初始化 qlib，持仓为合成数据)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_qlib"))
+from qlib.backtest.position import Position
+from layers.atomic.strategy_pool import PermanentPortfolioStrategy, PositionView
+
+def make_portfolio(n_assets, n_groups, total_value=1e6, cash_weight=0.25):
+    """
+    构造合成的持仓与策略: n_assets 个资产平均分入 n_groups 个组，另有 cash 伪资产。
+    持仓恰好处于目标权重，因此每一步都会完整执行偏离度检查且不触发再平衡。
+    """
+    codes = [f"SH{510000 + i}" for i in range(n_assets)]
+    asset_weight = (1 - cash_weight) / n_assets
+    asset_weights = {code: asset_weight for code in codes}
+    asset_weights["cash"] = cash_weight
+    asset_groups = {f"g{g}": codes[g::n_groups] for g in range(n_groups)}
+    asset_groups["cash"] = ["cash"]
+
+    position = Position(cash=total_value * cash_weight, position_dict={
+        code: {"amount": total_value * asset_weight / 10.0, "price": 10.0} for code in codes
+    })
+    strategy = PermanentPortfolioStrategy(
+        asset_weights=asset_weights,
+        rebalance_freq="day",
+        min_weight=0.0,
+        max_weight=1.0,
+        asset_groups=asset_groups,
+    )
+    strategy.last_rebalance_date = pd.Timestamp("2013-01-04")
+    return strategy, position
+
+def bench(func, steps):
+    """
+    执行 steps 次 func，返回每步平均耗时 (微秒)
+    """
+    t_start = time.perf_counter()
+    for _ in range(steps):
+        func()
+    return (time.perf_counter() - t_start) / steps * 1e6
+
+def run(n_assets, n_groups, steps):
+    strategy, position = make_portfolio(n_assets, n_groups)
+    trade_time = pd.Timestamp("2013-01-07")
+
+    def deepcopy_step():
+        # 旧实现: 每步深拷贝持仓后再检查
+        current = copy.deepcopy(position)
+        return strategy.generate_target_weight_position(trade_start_time=trade_time, current=current)
+
+    def view_step():
+        # 新实现: 只读视图，仅在需要下单时拷贝
+        return strategy.generate_target_weight_position(trade_start_time=trade_time, current=PositionView(position))
+
+    assert deepcopy_step() is None and view_step() is None
+    before = bench(deepcopy_step, steps)
+    after = bench(view_step, steps)
+    print(f"  资产 {n_assets:>4}, 分组 {n_groups:>3}: 深拷贝 {before:9.1f} us/步, 只读视图 {after:9.1f} us/步, 加速 {before / after:5.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PermanentPortfolioStrategy 单步决策耗时基准")
+    parser.add_argument("--steps", type=int, default=2000, help="每组配置执行的步数")
+    args = parser.parse_args()
+
+    print("PermanentPortfolioStrategy 单步权重检查耗时:")
+    for n_assets, n_groups in [(4, 4), (6, 4), (30, 5), (300, 20), (600, 150)]:
+        run(n_assets, n_groups, args.steps)
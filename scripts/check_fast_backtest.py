@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+
+# 直接使用 my_qlib 中的原子
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_qlib"))
+from layers.atomic.env_init import init_qlib_env
+from layers.atomic.backtest_executor import create_simulator_executor, run_backtest
+from layers.atomic.strategy_pool import create_permanent_strategy
+from layers.atomic.fast_backtest import load_market_data, run_fast_backtest
+from layers.atomic.batch_backtest import run_batch_backtest
+
+# 合成数据的标的: 代码 -> (上市位置, 退市位置, 停牌概率, 涨跌停概率, 是否有复权因子)
+SYNTHETIC_CODES = {
+    "SH510001": (0.0, 1.0, 0.0, 0.0, True),    # 全程正常交易
+    "SH510002": (0.0, 1.0, 0.05, 0.0, True),   # 随机停牌
+    "SH510003": (0.3, 1.0, 0.0, 0.0, True),    # 回测中途上市
+    "SZ150004": (0.0, 1.0, 0.02, 0.08, True),  # 频繁触及涨跌停
+    "SZ150005": (0.0, 0.7, 0.0, 0.0, True),    # 回测中途退市
+    "SH510006": (0.0, 1.0, 0.0, 0.0, False),   # 没有复权因子 (触发 qlib 的复权价交易模式)
+}
+BENCHMARK = "SH000300"
+
+def write_bin(symbol_dir, field, start_idx, values):
+    """
+    按 qlib 格式写入单个字段: [start_index, values...] (float32)
+    """
+    with open(os.path.join(symbol_dir, f"{field}.day.bin"), 'wb') as f:
+        np.array([start_idx], dtype='<f4').tofile(f)
+        np.asarray(values, dtype='<f4').tofile(f)
+
+def make_synthetic_data(data_dir, n_days=750, seed=0):
+    """
+    生成合成的 qlib 数据目录 (日历、股票池与 close/open/change/factor/volume 特征)
+    """
+    rng = np.random.default_rng(seed)
+    calendar = pd.bdate_range("2018-01-02", periods=n_days)
+    os.makedirs(os.path.join(data_dir, "calendars"))
+    os.makedirs(os.path.join(data_dir, "instruments"))
+    with open(os.path.join(data_dir, "calendars", "day.txt"), 'w') as f:
+        f.write("\n".join(calendar.strftime("%Y-%m-%d")) + "\n")
+
+    lines = []
+    specs = dict(SYNTHETIC_CODES)
+    specs[BENCHMARK] = (0.0, 1.0, 0.0, 0.0, True)
+    for code, (listed, delisted, p_suspend, p_limit, has_factor) in specs.items():
+        lo, hi = int(listed * n_days), int(delisted * n_days)
+        n = hi - lo
+        ret = rng.normal(0.0003, 0.012, n)
+        limit_days = rng.random(n) < p_limit
+        ret[limit_days] = rng.choice([0.1, -0.1, 0.095, -0.095], limit_days.sum())
+        close = 1.0 + np.cumprod(1 + ret)
+        change = np.concatenate([[np.nan], close[1:] / close[:-1] - 1])
+        # 一部分涨跌幅恰好等于 float32 的阈值，检验比较精度
+        change[limit_days] = ret[limit_days]
+        suspended = rng.random(n) < p_suspend
+        close[suspended] = np.nan
+        symbol_dir = os.path.join(data_dir, "features", code.lower())
+        os.makedirs(symbol_dir)
+        write_bin(symbol_dir, "close", lo, close)
+        write_bin(symbol_dir, "open", lo, close * (1 + rng.normal(0, 0.003, n)))
+        write_bin(symbol_dir, "change", lo, change)
+        write_bin(symbol_dir, "volume", lo, rng.integers(1e5, 1e7, n))
+        if has_factor:
+            write_bin(symbol_dir, "factor", lo, np.full(n, 1.0) if code[-1] != "2" else rng.uniform(0.5, 2.0, n))
+        lines.append(f"{code}\t{calendar[lo].strftime('%Y-%m-%d')}\t{calendar[hi - 1].strftime('%Y-%m-%d')}")
+    with open(os.path.join(data_dir, "instruments", "all.txt"), 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return calendar
+
+def scenarios():
+    """
+    参数组合: 覆盖再平衡频率、分组 (含只覆盖部分资产的分组)、现金伪资产、成交价、涨跌停、账户规模 (最低佣金与现金约束) 与复权价模式
+    """
+    base_weights = {"SH510001": 0.25, "SH510002": 0.2, "SH510003": 0.15, "SZ150004": 0.15, "SZ150005": 0.1}
+    groups = {"a": ["SH510001", "SH510002"], "b": ["SH510003", "SZ150004"], "c": ["SZ150005"]}
+    yield "day", dict(asset_weights=base_weights, rebalance_freq="day", internal_weight_threshold=0.2,
+                      min_weight=0.05, max_weight=0.6, asset_groups=groups), 1000000, {}
+    # 分组只覆盖部分资产: 未分组的资产不参与偏离度检查
+    yield "partial-groups", dict(asset_weights=base_weights, rebalance_freq="day", internal_weight_threshold=0.05,
+                                 min_weight=0.05, max_weight=0.6,
+                                 asset_groups={"a": ["SH510001", "SH510002"], "b": ["SH510003"]}), 1000000, {}
+    yield "month", dict(asset_weights=base_weights, rebalance_freq="month", internal_weight_threshold=0.1), 1000000, {}
+    yield "year", dict(asset_weights=base_weights, rebalance_freq="year", internal_weight_threshold=0.05), 1000000, {}
+    yield "small-account", dict(asset_weights=base_weights, rebalance_freq="day", internal_weight_threshold=0.05,
+                                min_weight=0.0, max_weight=1.0), 20000, {"min_cost": 5}
+    yield "cash-asset", dict(asset_weights={**base_weights, "cash": 0.15}, rebalance_freq="day", min_weight=0.1,
+                             max_weight=0.5, asset_groups={**groups, "cash": ["cash"]}), 1000000, {}
+    yield "open-price", dict(asset_weights=base_weights, rebalance_freq="month"), 1000000, {"deal_price": "open"}
+    yield "limit-0.095", dict(asset_weights=base_weights, rebalance_freq="day", internal_weight_threshold=0.1),\
+        1000000, {"limit_threshold": 0.095}
+    yield "no-limit", dict(asset_weights=base_weights, rebalance_freq="day", internal_weight_threshold=0.1),\
+        1000000, {"limit_threshold": None}
+    yield "adjusted-price", dict(asset_weights={**base_weights, "SH510006": 0.1}, rebalance_freq="day",
+                                 internal_weight_threshold=0.1), 1000000, {}
+
+def position_amounts(positions):
+    """
+    把持仓历史 (qlib Position 对象或快速引擎的持仓字典) 统一转换为 date × code 的数量表
+    """
+    rows = {}
+    for date, pos in positions.items():
+        raw = pos.position if hasattr(pos, "position") else pos
+        rows[date] = {code: v["amount"] for code, v in raw.items() if isinstance(v, dict)}
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index(axis=1).fillna(0.0)
+
+def check_scenario(name, strategy_kwargs, account, extra_kwargs, start_time, end_time):
+    exchange_kwargs = {"limit_threshold": 0.1, "deal_price": "close", "open_cost": 0.0005,
+                       "close_cost": 0.0015, "min_cost": 5, **extra_kwargs}
+    codes = sorted(set(strategy_kwargs["asset_weights"]) - {"cash"})
+
+    # 1. qlib 回测 (交易所只加载组合自身的标的，复权价模式按同一股票池判定)
+    t_start = time.perf_counter()
+    strategy = create_permanent_strategy(**strategy_kwargs)
+    portfolio_metrics, _ = run_backtest(
+        start_time, end_time, strategy, create_simulator_executor(), benchmark=BENCHMARK,
+        account=account, exchange_kwargs={**exchange_kwargs, "codes": codes}
+    )
+    qlib_report, qlib_positions = portfolio_metrics["1day"]
+    t_qlib = time.perf_counter() - t_start
+
+    # 2. 快速引擎
+    t_start = time.perf_counter()
+    market = load_market_data(codes, start_time, end_time, benchmark=BENCHMARK,
+                              deal_price=exchange_kwargs["deal_price"], limit_threshold=exchange_kwargs["limit_threshold"])
+    t_load = time.perf_counter() - t_start
+    t_start = time.perf_counter()
+    fast_report, fast_positions = run_fast_backtest(market, account=account, exchange_kwargs=exchange_kwargs, **strategy_kwargs)
+    t_fast = time.perf_counter() - t_start
+
+    # 3. 比对: 报告逐位一致、再平衡日期一致、每日持仓数量一致
+    report_diff = float((fast_report - qlib_report).abs().max().max())
+    same_report = fast_report.equals(qlib_report)
+    qlib_amounts, fast_amounts = position_amounts(qlib_positions), position_amounts(fast_positions)
+    same_positions = qlib_amounts.equals(fast_amounts)
+    same_dates = ((qlib_report["turnover"] > 0) == (fast_report["turnover"] > 0)).all()
+    # 4. 批量模拟器: 单个组合的日收益与快速引擎一致 (市值求和顺序不同，允许浮点误差)
+    _, batch_returns = run_batch_backtest(
+        market, pd.DataFrame([strategy_kwargs["asset_weights"]]), account=account, exchange_kwargs=exchange_kwargs,
+        return_series=True, **{k: v for k, v in strategy_kwargs.items() if k != "asset_weights"}
+    )
+    batch_diff = float((batch_returns[0] - fast_report["return"]).abs().max())
+    ok = same_report and same_positions and same_dates and batch_diff < 1e-10
+    print(f"  {name:<15} {'一致' if ok else '不一致':<4} 报告最大差异 {report_diff:.3g}, 批量模拟器差异 {batch_diff:.3g}, "
+          f"调仓 {int((qlib_report['turnover'] > 0).sum()):>3} 天, 复权价模式 {market['trade_w_adj_price']}, "
+          f"qlib {t_qlib:6.2f}s, 快速引擎 {t_fast:.3f}s (+加载 {t_load:.3f}s), 加速 {t_qlib / (t_fast + t_load):5.0f}x")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在合成数据上比对快速回测引擎与 qlib 回测的结果")
+    parser.add_argument("--days", type=int, default=750, help="合成数据的交易日数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="保留生成的合成数据目录")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    data_dir = tempfile.mkdtemp(prefix="qlib_synthetic_")
+    try:
+        calendar = make_synthetic_data(data_dir, n_days=args.days, seed=args.seed)
+        init_qlib_env(provider_uri=data_dir)
+        start_time, end_time = calendar[5].strftime("%Y-%m-%d"), calendar[-5].strftime("%Y-%m-%d")
+        print(f"合成数据: {data_dir}, 回测区间 {start_time} ~ {end_time}")
+        results = [check_scenario(name, kwargs, account, extra, start_time, end_time)
+                   for name, kwargs, account, extra in scenarios()]
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if all(results):
+        print("\n全部场景与 qlib 一致。")
+        sys.exit(0)
+    print(f"\n{results.count(False)} 个场景与 qlib 不一致！")
+    sys.exit(1)
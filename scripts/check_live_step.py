@@ -0,0 +1,94 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import warnings
+import pandas as pd
+
+# 直接使用 my_qlib 中的原子
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_qlib"))
+import qlib
+from qlib.backtest.utils import TradeCalendarManager
+from qlib.data import D
+from qlib.utils.time import epsilon_change
+from layers.atomic.env_init import init_qlib_env
+from layers.atomic.backtest_executor import create_simulator_executor
+from layers.atomic.strategy_pool import create_permanent_strategy
+from layers.atomic.live_trading import extend_step_calendar, run_live_step
+from check_fast_backtest import BENCHMARK, make_synthetic_data
+
+ASSET_WEIGHTS = {"SH510001": 0.5, "SH510003": 0.5}
+ACCOUNT = 1000000
+EXCHANGE_KWARGS = {"limit_threshold": 0.1, "deal_price": "close", "open_cost": 0.0005, "close_cost": 0.0015, "min_cost": 5}
+
+def check_calendar(calendar):
+    """
+    固定 qlib 交易日历的内部行为: 最后一个交易日补齐右端点后步骤区间正确，
+    中间交易日不做修改，且 qlib 全局日历不受影响
+    """
+    last = TradeCalendarManager(freq="day", start_time=calendar[-1], end_time=calendar[-1])
+    extended = extend_step_calendar(last)
+    last_ok = extended and last.get_step_time(0) == (calendar[-1], epsilon_change(calendar[-1] + pd.offsets.BDay(1)))
+    middle = TradeCalendarManager(freq="day", start_time=calendar[-10], end_time=calendar[-10])
+    middle_ok = not extend_step_calendar(middle) and middle.get_step_time(0) == (calendar[-10], epsilon_change(calendar[-9]))
+    global_ok = len(D.calendar(freq="day")) == len(calendar)
+    ok = last_ok and middle_ok and global_ok
+    print(f"  日历补齐 (qlib {qlib.__version__}): {'一致' if ok else '不一致'} "
+          f"(最后交易日 {last_ok}, 中间交易日 {middle_ok}, 全局日历未修改 {global_ok})")
+    return ok
+
+def live_step(position, rebalance_freq="day", last_rebalance_date=None):
+    strategy = create_permanent_strategy(
+        asset_weights=ASSET_WEIGHTS, rebalance_freq=rebalance_freq, min_weight=0.0, max_weight=1.0,
+        internal_weight_threshold=0.1
+    )
+    return run_live_step(
+        strategy, create_simulator_executor(), position=position,
+        strategy_state={"last_rebalance_date": last_rebalance_date}, benchmark=BENCHMARK, account=ACCOUNT,
+        exchange_kwargs=EXCHANGE_KWARGS, codes=list(ASSET_WEIGHTS) + [BENCHMARK], save=False
+    )
+
+def check_position_mode(calendar):
+    """
+    持仓模式: 没有上次再平衡日期时，day 频率按偏离度判断 (持仓在目标附近不下单)，month/year 频率报错
+    """
+    close = D.features(list(ASSET_WEIGHTS), ["$close"], calendar[-2], calendar[-2])["$close"]
+    on_target = {code: ACCOUNT * weight / float(close.xs(code, level="instrument").iloc[0])
+                 for code, weight in ASSET_WEIGHTS.items()}
+    on_target["cash"] = 0.0
+    quiet = live_step(on_target)
+    drifted = live_step({"cash": ACCOUNT * 0.5, "SH510001": on_target["SH510001"]})
+    try:
+        live_step(on_target, rebalance_freq="month")
+        month_ok = False
+    except ValueError:
+        month_ok = True
+    ok = not quiet["rebalance"] and drifted["rebalance"] and month_ok
+    print(f"  持仓模式: {'一致' if ok else '不一致'} (目标持仓不下单 {not quiet['rebalance']}, "
+          f"偏离持仓再平衡 {drifted['rebalance']}, month 频率缺少日期时报错 {month_ok})")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在合成数据上校验实盘模式的日历补齐 (固定 qlib 内部行为) 与持仓模式的再平衡判断")
+    parser.add_argument("--days", type=int, default=120, help="合成数据的交易日数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="保留生成的合成数据目录")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    data_dir = tempfile.mkdtemp(prefix="qlib_synthetic_")
+    try:
+        calendar = make_synthetic_data(data_dir, n_days=args.days, seed=args.seed)
+        init_qlib_env(provider_uri=data_dir)
+        print(f"合成数据: {data_dir}, 最后交易日 {calendar[-1].date()}")
+        results = [check_calendar(calendar), check_position_mode(calendar)]
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if all(results):
+        print("\n实盘模式校验通过。")
+        sys.exit(0)
+    print(f"\n{results.count(False)} 项校验不一致！")
+    sys.exit(1)
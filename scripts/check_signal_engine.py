@@ -0,0 +1,153 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+
+# 直接使用 my_qlib 中的原子
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_qlib"))
+from qlib.data import D
+from layers.atomic.env_init import init_qlib_env
+from layers.atomic.data_handler import load_market_spans
+from layers.atomic.signal_engine import compute_signals
+
+MARKET = "synthetic"
+
+# 截面算子的表达式: 直接作用于原始字段，以及作用于需要回看窗口的时间序列算子
+EXPRESSIONS = {
+    "rank_close": "rank($close)",
+    "rank_ret": "rank(ret($close, 5))",
+    "cs_zscore_volume": "cs_zscore($volume)",
+    # 时间序列算子: 成交量为 0 的次日比值为 inf (前后两日均为 0 时为 NaN)，以及 1e9 量级的数值水平
+    "mean_volume_ratio": "mean($volume / ref($volume, 1), 5)",
+    "std_volume_ratio": "std($volume / ref($volume, 1), 5)",
+    "zscore_volume": "zscore($volume * 100, 10)",
+}
+
+# 时间序列算子与 pandas rolling 比对的相对误差容限 (pandas 的滚动方差为在线算法，本身有约 1e-7 的相对误差)
+TS_TOLERANCE = 1e-6
+TS_EXPRESSIONS = {"mean_volume_ratio", "std_volume_ratio", "zscore_volume"}
+
+def write_bin(symbol_dir, field, start_idx, values):
+    """
+    按 qlib 格式写入单个字段: [start_index, values...] (float32)
+    """
+    with open(os.path.join(symbol_dir, f"{field}.day.bin"), 'wb') as f:
+        np.array([start_idx], dtype='<f4').tofile(f)
+        np.asarray(values, dtype='<f4').tofile(f)
+
+def make_synthetic_data(data_dir, n_codes=40, n_days=300, seed=0):
+    """
+    生成合成的 qlib 数据目录: 标的全程有数据 (含随机停牌与成交量为 0 的交易日)，但只在随机的 1~3 个区间内属于股票池 MARKET
+    """
+    rng = np.random.default_rng(seed)
+    calendar = pd.bdate_range("2018-01-02", periods=n_days)
+    os.makedirs(os.path.join(data_dir, "calendars"))
+    os.makedirs(os.path.join(data_dir, "instruments"))
+    with open(os.path.join(data_dir, "calendars", "day.txt"), 'w') as f:
+        f.write("\n".join(calendar.strftime("%Y-%m-%d")) + "\n")
+
+    all_lines, market_lines = [], []
+    for i in range(n_codes):
+        code = f"SH{600000 + i}"
+        close = 10.0 * np.cumprod(1 + rng.normal(0.0003, 0.02, n_days))
+        close[rng.random(n_days) < 0.03] = np.nan
+        symbol_dir = os.path.join(data_dir, "features", code.lower())
+        os.makedirs(symbol_dir)
+        write_bin(symbol_dir, "close", 0, close)
+        volume = rng.integers(1e5, 1e7, n_days).astype(np.float64)
+        volume[rng.random(n_days) < 0.05] = 0.0
+        write_bin(symbol_dir, "volume", 0, volume)
+        all_lines.append(f"{code}\t{calendar[0].strftime('%Y-%m-%d')}\t{calendar[-1].strftime('%Y-%m-%d')}")
+        bounds = np.sort(rng.choice(np.arange(1, n_days), size=2 * rng.integers(1, 4), replace=False))
+        for lo, hi in bounds.reshape(-1, 2):
+            market_lines.append(f"{code}\t{calendar[lo].strftime('%Y-%m-%d')}\t{calendar[hi].strftime('%Y-%m-%d')}")
+    with open(os.path.join(data_dir, "instruments", "all.txt"), 'w') as f:
+        f.write("\n".join(all_lines) + "\n")
+    with open(os.path.join(data_dir, "instruments", f"{MARKET}.txt"), 'w') as f:
+        f.write("\n".join(market_lines) + "\n")
+    return calendar
+
+def reference_signals(data_dir, start_time, end_time):
+    """
+    参考实现: 逐标的用 pandas 计算时间序列部分，只保留股票池成员的行后按日期分组做截面排名/标准化
+    """
+    spans = load_market_spans(MARKET, data_dir)
+    codes = sorted({code for code, _, _ in spans})
+    df = D.features(codes, ["$close", "$volume"], freq="day").astype(np.float64)
+    close = df["$close"].groupby(level="instrument")
+    ratio = df["$volume"] / df["$volume"].groupby(level="instrument").shift(1)
+    level = df["$volume"] * 100
+
+    def rolling(series, n, func):
+        return series.groupby(level="instrument", group_keys=False).apply(lambda x: getattr(x.rolling(n, min_periods=1), func)())
+
+    level_std = rolling(level, 10, "std")
+    base = pd.DataFrame({
+        "close": df["$close"],
+        "ret": df["$close"] / close.shift(5) - 1,
+        "volume": df["$volume"],
+        "mean_volume_ratio": rolling(ratio, 5, "mean"),
+        "std_volume_ratio": rolling(ratio, 5, "std"),
+        "zscore_volume": (level - rolling(level, 10, "mean")) / level_std.where(level_std > 0),
+    })
+    dates = base.index.get_level_values("datetime")
+    instruments = base.index.get_level_values("instrument")
+    member = np.zeros(len(base), dtype=bool)
+    for code, start, end in spans:
+        member |= (instruments == code) & (dates >= start) & (dates <= end)
+    base = base[member & (dates >= pd.Timestamp(start_time)) & (dates <= pd.Timestamp(end_time))]
+    by_date = base.groupby(level="datetime")
+    volume_std = by_date["volume"].transform(lambda x: x.std(ddof=0))
+    ref = pd.DataFrame({
+        "rank_close": by_date["close"].rank(pct=True),
+        "rank_ret": by_date["ret"].rank(pct=True),
+        "cs_zscore_volume": (base["volume"] - by_date["volume"].transform("mean")) / volume_std.where(volume_std > 0),
+        **{name: base[name] for name in TS_EXPRESSIONS},
+    })
+    return ref.swaplevel().sort_index()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在合成数据上比对信号引擎的截面算子与逐日期分组 (仅股票池成员)、时间序列算子与 pandas rolling 的结果")
+    parser.add_argument("--codes", type=int, default=40, help="合成标的数")
+    parser.add_argument("--days", type=int, default=300, help="合成数据的交易日数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="保留生成的合成数据目录")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    data_dir = tempfile.mkdtemp(prefix="qlib_synthetic_")
+    try:
+        calendar = make_synthetic_data(data_dir, n_codes=args.codes, n_days=args.days, seed=args.seed)
+        init_qlib_env(provider_uri=data_dir)
+        start_time, end_time = calendar[10], calendar[-1]
+        print(f"合成数据: {data_dir}, 区间 {start_time.date()} ~ {end_time.date()}")
+        signals = compute_signals(EXPRESSIONS, start_time, end_time, market=MARKET)
+        signals = signals.reorder_levels(["datetime", "instrument"]).sort_index()
+        ref = reference_signals(data_dir, start_time, end_time).reorder_levels(["datetime", "instrument"]).sort_index()
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    same_index = signals.index.equals(ref.index)
+    results = []
+    for name in EXPRESSIONS:
+        left, right = signals[name].reindex(ref.index), ref[name]
+        same_nan = (left.isna() == right.isna()).all()
+        if name in TS_EXPRESSIONS:
+            diff = float(((left - right).abs() / right.abs().clip(lower=1.0)).max()) if left.notna().any() else 0.0
+            ok = same_index and same_nan and diff < TS_TOLERANCE
+        else:
+            diff = float((left - right).abs().max()) if left.notna().any() else 0.0
+            ok = same_index and same_nan and diff < 1e-9
+        print(f"  {name:<18} {'一致' if ok else '不一致':<4} 最大{'相对' if name in TS_EXPRESSIONS else ''}差异 {diff:.3g}, 行数 {len(left)}")
+        results.append(ok)
+
+    if all(results):
+        print("\n全部表达式与参考实现一致。")
+        sys.exit(0)
+    print(f"\n{results.count(False)} 个表达式不一致！")
+    sys.exit(1)
@@ -1,13 +1,23 @@
 import pandas as pd
 import numpy as np
 import os
+import io
+import sys
+import json
+import hashlib
+import time
+import argparse
 import shutil
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 # 配置路径
 SOURCE_DIR = "/mnt/data/mycode/my_akshare/data"
 QLIB_DATA_DIR = "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"
 
+# 增量模式的水位线文件: 记录每个标的已写入的最后日期与 CSV 读取位置
+WATERMARK_FILE = "watermarks.json"
+
 # 列名映射
 # AkShare 数据列名 -> Qlib 标准列名
 COLUMN_MAP = {
@@ -20,6 +30,12 @@ COLUMN_MAP = {
     '成交额': 'amount'
 }
 
+# 需要写入 .bin 的字段 (factor 单独处理)
+FIELDS = ['open', 'close', 'high', 'low', 'volume', 'amount']
+
+# 列式快照目录: 每个字段一个 date×instrument 的 Arrow IPC 文件 (单个 record batch，可内存映射读取)
+SNAPSHOT_DIR = "snapshot"
+
 def get_symbol_prefix(code):
     """
     确定市场前缀
@@ -30,122 +46,663 @@ def get_symbol_prefix(code):
         return 'sz'
     return 'sh'
 
+def get_symbol(file):
+    """
+    由 CSV 文件名得到 Qlib symbol，假设文件名类似 518880_黄金ETF.csv
+    """
+    code = file.split('_')[0]
+    prefix = get_symbol_prefix(code)
+    return f"{prefix}{code}".lower()
+
+def load_calendar(calendar_path):
+    """
+    读取日历文件，返回有序日期字符串列表
+    """
+    dates = []
+    if os.path.exists(calendar_path):
+        with open(calendar_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                date_str = line.strip()
+                if date_str:
+                    dates.append(date_str)
+    return dates
+
+def read_source_csv(file_path, offset=0):
+    """
+    读取 AkShare CSV 并统一列名与日期格式。
+    offset > 0 时只读取该字节位置之后追加的行 (表头仍取文件首行)。
+    """
+    if offset > 0:
+        with open(file_path, 'rb') as f:
+            header = f.readline()
+            f.seek(offset)
+            tail = f.read()
+        df = pd.read_csv(io.BytesIO(header + b"\n" + tail))
+    else:
+        df = pd.read_csv(file_path)
+    df = df.rename(columns=COLUMN_MAP)
+    if df.empty:
+        return df
+
+    # 转换日期格式
+    df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+    return df.sort_values('date')
+
+def read_tail_line(file_path, offset):
+    """
+    读取文件在 offset 之前的最后一个非空行，用于判断 CSV 是否被整体重写
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, offset - 4096))
+        chunk = f.read(offset - max(0, offset - 4096))
+    lines = [line for line in chunk.splitlines() if line.strip()]
+    return lines[-1].decode('utf-8', errors='replace') if lines else ""
+
+def file_digest(file_path, size):
+    """
+    计算文件前 size 字节的 sha1，用于判断已转换的部分是否被修改
+    """
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def make_watermark(file_path, symbol_dir, start_date, last_date, length):
+    """
+    生成单个标的的水位线记录: CSV 的读取位置、修改时间与内容摘要，以及已写入 .bin 的区间与字段
+    """
+    st = os.stat(file_path)
+    return {
+        "file": os.path.basename(file_path),
+        "start_date": start_date,
+        "last_date": last_date,
+        "offset": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "digest": file_digest(file_path, st.st_size),
+        "last_line": read_tail_line(file_path, st.st_size),
+        "length": int(length),
+        "fields": sorted(f[:-len(".day.bin")] for f in os.listdir(symbol_dir) if f.endswith(".day.bin")),
+    }
+
+def classify_source(file_path, wm):
+    """
+    与水位线比对 CSV 的变化: "same" 未变化, "append" 仅在末尾追加, "rewrite" 已转换的历史被修改
+    (旧版水位线没有摘要时退回比较读取位置之前的最后一行)
+    """
+    st = os.stat(file_path)
+    offset = wm["offset"]
+    if "digest" in wm:
+        if st.st_size == offset and st.st_mtime_ns == wm.get("mtime_ns"):
+            return "same"
+        if st.st_size >= offset and file_digest(file_path, offset) == wm["digest"]:
+            return "same" if st.st_size == offset else "append"
+        return "rewrite"
+    if st.st_size >= offset and read_tail_line(file_path, offset) == wm["last_line"]:
+        return "same" if st.st_size == offset else "append"
+    return "rewrite"
+
+def check_symbol_bins(symbol_dir, wm, date_to_idx, calendar_len):
+    """
+    检查已转换标的的 .bin 是否与水位线及日历一致 (字段齐全、起始位置与长度相符、不超出日历)，
+    返回不一致的原因，一致时返回 None。中断的转换 (日历最后写入) 会在这里被发现。
+    """
+    expected_start = date_to_idx.get(wm.get("start_date"))
+    if "start_date" in wm and expected_start is None:
+        return f"起始日期 {wm['start_date']} 不在日历中"
+    for field in wm.get("fields") or ["factor"]:
+        bin_path = os.path.join(symbol_dir, f"{field}.day.bin")
+        if not os.path.exists(bin_path) or os.path.getsize(bin_path) < 4:
+            return f"缺少 {field}.day.bin"
+        start_idx, length = read_bin_range(bin_path)
+        if expected_start is None:
+            expected_start = start_idx
+        if start_idx != expected_start or length != wm["length"] or start_idx + length > calendar_len:
+            return f"{field}.day.bin 与水位线/日历不一致 (start_idx {start_idx}, 长度 {length})"
+    return None
+
+def load_watermarks():
+    path = os.path.join(QLIB_DATA_DIR, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_watermarks(watermarks):
+    path = os.path.join(QLIB_DATA_DIR, WATERMARK_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def write_calendar(calendar_path, dates):
+    """
+    写入日历文件 (先写临时文件再替换)
+    """
+    os.makedirs(os.path.dirname(calendar_path), exist_ok=True)
+    tmp_path = calendar_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("".join(f"{d}\n" for d in dates))
+    os.replace(tmp_path, calendar_path)
+
+def replace_bin(bin_path, data):
+    """
+    以临时文件 + os.replace 写入整个 .bin 文件 (data 含文件头 start_idx)。
+    所有 .bin 写入 (全量、追加、改写文件头) 都不原地截断或修改: 其他进程 (如 mmap_storage.MmapCache)
+    已映射的旧文件在替换后保持完整，避免读取被截断的页触发 SIGBUS。
+    """
+    tmp_path = f"{bin_path}.{os.getpid()}.tmp"
+    np.asarray(data, dtype='<f4').tofile(tmp_path)
+    os.replace(tmp_path, bin_path)
+
+def write_symbol_bins(symbol_dir, df, start_idx):
+    """
+    将已按日历对齐的单个标的数据完整写入 .bin 文件
+    """
+    os.makedirs(symbol_dir, exist_ok=True)
+    header = np.array([start_idx], dtype='<f4')
+    # 转换为 float32 并填充 NaN
+    for col in FIELDS:
+        if col in df.columns:
+            # Qlib 存储格式: [start_index(float32), data1(float32), data2(float32), ...]
+            values = df[col].astype(np.float32).values
+            replace_bin(os.path.join(symbol_dir, f"{col}.day.bin"), np.concatenate([header, values]))
+
+    # 必须写入 factor.day.bin (复权因子，如果没有则全 1.0)
+    replace_bin(os.path.join(symbol_dir, "factor.day.bin"), np.concatenate([header, np.ones(len(df), dtype='<f4')]))
+
+def append_symbol_bins(symbol_dir, df):
+    """
+    将已按日历对齐的新增数据以 float32 追加到现有 .bin 文件末尾，历史数据不变。
+    缺失的列按 NaN 追加，保证各字段长度一致。追加后的文件整体经 replace_bin 替换。
+    """
+    for col in FIELDS:
+        bin_path = os.path.join(symbol_dir, f"{col}.day.bin")
+        if not os.path.exists(bin_path):
+            continue
+        if col in df.columns:
+            values = df[col].astype(np.float32).values
+        else:
+            values = np.full(len(df), np.nan, dtype=np.float32)
+        replace_bin(bin_path, np.concatenate([np.fromfile(bin_path, dtype='<f4'), values]))
+
+    factor_bin_path = os.path.join(symbol_dir, "factor.day.bin")
+    replace_bin(factor_bin_path, np.concatenate([np.fromfile(factor_bin_path, dtype='<f4'), np.ones(len(df), dtype='<f4')]))
+
+def read_bin_range(bin_path):
+    """
+    只读取 .bin 文件头，返回 (start_idx, 数据长度)
+    """
+    with open(bin_path, 'rb') as f:
+        start_idx = int(np.frombuffer(f.read(4), dtype='<f4')[0])
+    return start_idx, os.path.getsize(bin_path) // 4 - 1
+
+def shift_bin_headers(features_dir, shift, skip=()):
+    """
+    日历在头部插入 shift 个日期后，改写所有 .bin 文件头的 start_idx (数据不变，经 replace_bin 整体替换)
+    skip 中的标的会被重新完整写入，无需改写。
+    """
+    count = 0
+    if not os.path.isdir(features_dir):
+        return count
+    for symbol in os.listdir(features_dir):
+        symbol_dir = os.path.join(features_dir, symbol)
+        if symbol in skip or not os.path.isdir(symbol_dir):
+            continue
+        for file in os.listdir(symbol_dir):
+            if not file.endswith('.bin'):
+                continue
+            bin_path = os.path.join(symbol_dir, file)
+            data = np.fromfile(bin_path, dtype='<f4')
+            data[0] = int(data[0]) + shift
+            replace_bin(bin_path, data)
+            count += 1
+    return count
+
+def update_instruments(ranges):
+    """
+    更新 instruments/all.txt, ranges 为 {symbol: (start_date, end_date)}
+    """
+    inst_path = os.path.join(QLIB_DATA_DIR, "instruments/all.txt")
+    os.makedirs(os.path.dirname(inst_path), exist_ok=True)
+
+    # 读取现有的 instruments
+    existing_inst = {}
+    if os.path.exists(inst_path):
+        with open(inst_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split('\t')
+                if len(parts) >= 3:
+                    existing_inst[parts[0].upper()] = (parts[1], parts[2])
+
+    # 添加/更新新数据
+    for symbol, (start_date, end_date) in ranges.items():
+        existing_inst[symbol.upper()] = (start_date, end_date)
+
+    # 排序并写回
+    with open(inst_path, 'w', encoding='utf-8') as f:
+        for s, (sd, ed) in sorted(existing_inst.items()):
+            f.write(f"{s}\t{sd}\t{ed}\n")
+
+    print(f"  已更新 instruments 列表: {inst_path}")
+    return existing_inst
+
 def convert_to_bin():
     print(f"开始转换数据: {SOURCE_DIR} -> {QLIB_DATA_DIR}")
-    
+
     # 1. 收集所有 CSV 数据并记录日期
     all_data = {}
+    all_files = {}
     all_dates = set()
-    
+
     # 加载现有日历
     calendar_path = os.path.join(QLIB_DATA_DIR, "calendars/day.txt")
-    if os.path.exists(calendar_path):
-        with open(calendar_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                date_str = line.strip()
-                if date_str:
-                    all_dates.add(date_str)
+    old_calendar = load_calendar(calendar_path)
+    if old_calendar:
+        all_dates.update(old_calendar)
         print(f"  已加载现有日历，包含 {len(all_dates)} 个日期")
 
     # 处理每个 CSV 文件
     for file in os.listdir(SOURCE_DIR):
         if file.endswith('.csv'):
-            # 假设文件名类似 518880_黄金ETF.csv
-            code = file.split('_')[0]
-            prefix = get_symbol_prefix(code)
-            symbol = f"{prefix}{code}".lower()
-            
+            symbol = get_symbol(file)
+
             file_path = os.path.join(SOURCE_DIR, file)
             try:
-                df = pd.read_csv(file_path)
-                df = df.rename(columns=COLUMN_MAP)
-                
-                # 转换日期格式
-                df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
-                df = df.sort_values('date')
-                
+                df = read_source_csv(file_path)
+                if df.empty:
+                    continue
+
                 all_data[symbol] = df
+                all_files[symbol] = file_path
                 all_dates.update(df['date'].tolist())
                 print(f"  读取文件: {file} -> {symbol}")
             except Exception as e:
                 print(f"  读取文件 {file} 出错: {e}")
-    
+
     if not all_data:
         print("未找到可处理的 CSV 文件。")
         return
 
     # 2. 更新并保存日历
     sorted_dates = sorted(list(all_dates))
-    os.makedirs(os.path.dirname(calendar_path), exist_ok=True)
-    with open(calendar_path, 'w', encoding='utf-8') as f:
-        for d in sorted_dates:
-            f.write(f"{d}\n")
+    write_calendar(calendar_path, sorted_dates)
     print(f"  已更新日历文件: {calendar_path} (共 {len(sorted_dates)} 天)")
-    
+
     date_to_idx = {d: i for i, d in enumerate(sorted_dates)}
-    
+
     # 3. 转换为 Qlib 二进制格式 (.bin)
     features_dir = os.path.join(QLIB_DATA_DIR, "features")
-    
+    watermarks = {}
+
+    # 日历头部新增日期时，本次不重写的已有标的需要显式后移 start_idx
+    shift = date_to_idx[old_calendar[0]] if old_calendar else 0
+    if shift > 0:
+        count = shift_bin_headers(features_dir, shift, skip=set(all_data))
+        print(f"  日历头部新增 {shift} 天，已将 {count} 个未重写 .bin 文件的 start_idx 后移 {shift}")
+
     for symbol, df in all_data.items():
         symbol_dir = os.path.join(features_dir, symbol)
-        os.makedirs(symbol_dir, exist_ok=True)
-        
+
         start_date = df['date'].iloc[0]
         end_date = df['date'].iloc[-1]
         start_idx = date_to_idx[start_date]
-        
+
         # 为了保证数据对齐，我们按日历重采样该股票的数据范围
-        df = df.set_index('date')
+        aligned = df.set_index('date')
         symbol_calendar = sorted_dates[start_idx : date_to_idx[end_date] + 1]
-        df = df.reindex(symbol_calendar)
-        
-        # 转换为 float32 并填充 NaN
-        fields = ['open', 'close', 'high', 'low', 'volume', 'amount']
-        for col in fields:
-            if col in df.columns:
-                # Qlib 存储格式: [start_index(float32), data1(float32), data2(float32), ...]
-                values = df[col].astype(np.float32).values
-                bin_path = os.path.join(symbol_dir, f"{col}.day.bin")
-                
-                with open(bin_path, 'wb') as f:
-                    # 写入起始索引
-                    np.array([start_idx], dtype='<f4').tofile(f)
-                    # 写入序列数据
-                    values.tofile(f)
-        
-        # 必须写入 factor.day.bin (复权因子，如果没有则全 1.0)
-        factor_bin_path = os.path.join(symbol_dir, "factor.day.bin")
-        with open(factor_bin_path, 'wb') as f:
-            np.array([start_idx], dtype='<f4').tofile(f)
-            np.ones(len(df), dtype='<f4').tofile(f)
-            
+        aligned = aligned.reindex(symbol_calendar)
+
+        write_symbol_bins(symbol_dir, aligned, start_idx)
+        watermarks[symbol] = make_watermark(all_files[symbol], symbol_dir, start_date, end_date, len(aligned))
+
         print(f"  完成二进制转换: {symbol} ({start_date} 至 {end_date})")
 
     # 4. 更新 instruments/all.txt
-    inst_path = os.path.join(QLIB_DATA_DIR, "instruments/all.txt")
-    os.makedirs(os.path.dirname(inst_path), exist_ok=True)
-    
-    # 读取现有的 instruments
-    existing_inst = {}
-    if os.path.exists(inst_path):
-        with open(inst_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                parts = line.strip().split('\t')
-                if len(parts) >= 3:
-                    existing_inst[parts[0].upper()] = (parts[1], parts[2])
-    
-    # 添加/更新新数据
-    for symbol, df in all_data.items():
-        existing_inst[symbol.upper()] = (df['date'].iloc[0], df['date'].iloc[-1])
-    
-    # 排序并写回
-    with open(inst_path, 'w', encoding='utf-8') as f:
-        for s, (sd, ed) in sorted(existing_inst.items()):
-            f.write(f"{s}\t{sd}\t{ed}\n")
-    
-    print(f"  已更新 instruments 列表: {inst_path}")
+    update_instruments({s: (df['date'].iloc[0], df['date'].iloc[-1]) for s, df in all_data.items()})
+
+    # 5. 全量转换后重置水位线，供后续增量模式使用
+    save_watermarks(watermarks)
     print("\n转换任务全部完成！")
 
+def convert_incremental():
+    """
+    增量转换: 依据每个标的的水位线只读取 CSV 新增行，
+    将新数据追加到现有 .bin 文件末尾并扩展日历，不重写历史数据。
+    CSV 的历史被修改、或 .bin 与水位线/日历不一致 (字段缺失、上次转换被中断) 的标的按全量重新转换。
+    日历最后写入 (临时文件 + 替换)，中断的运行可以被检测并直接重新运行。
+    """
+    print(f"开始增量转换数据: {SOURCE_DIR} -> {QLIB_DATA_DIR}")
+
+    calendar_path = os.path.join(QLIB_DATA_DIR, "calendars/day.txt")
+    features_dir = os.path.join(QLIB_DATA_DIR, "features")
+    calendar = load_calendar(calendar_path)
+    watermarks = load_watermarks()
+    if not calendar or not watermarks:
+        print("  未找到现有日历或水位线，执行全量转换。")
+        return convert_to_bin()
+
+    # 1. 检查已转换标的的 .bin 与水位线/日历是否一致，不一致的标的重新全量转换
+    date_to_idx = {d: i for i, d in enumerate(calendar)}
+    rebuild = set()
+    for symbol, wm in watermarks.items():
+        reason = check_symbol_bins(os.path.join(features_dir, symbol), wm, date_to_idx, len(calendar))
+        if reason:
+            rebuild.add(symbol)
+            print(f"  {symbol}: {reason}，重新全量转换")
+
+    # 2. 只读取各 CSV 在水位线之后的新增行
+    new_data = {}
+    new_files = {}
+    for file in os.listdir(SOURCE_DIR):
+        if not file.endswith('.csv'):
+            continue
+        symbol = get_symbol(file)
+        file_path = os.path.join(SOURCE_DIR, file)
+        wm = watermarks.get(symbol)
+        try:
+            change = "rewrite" if wm is None or symbol in rebuild else classify_source(file_path, wm)
+            if change == "same":
+                continue
+            if change == "append":
+                # 文件仅在末尾追加: 从上次读取位置继续
+                df = read_source_csv(file_path, offset=wm["offset"])
+                df = df[df['date'] > wm["last_date"]]
+            else:
+                # 新标的、历史被修改或 .bin 不一致: 读取全部历史并整体重写
+                if wm is not None and symbol not in rebuild:
+                    print(f"  {file} 的已转换部分被修改，重新全量转换 {symbol}")
+                    rebuild.add(symbol)
+                df = read_source_csv(file_path)
+        except Exception as e:
+            print(f"  读取文件 {file} 出错: {e}")
+            continue
+
+        if df.empty:
+            continue
+        new_data[symbol] = df
+        new_files[symbol] = file_path
+        print(f"  读取新增数据: {file} -> {symbol} ({len(df)} 行)")
+
+    missing = sorted(rebuild - set(new_data))
+    if missing:
+        print(f"  警告: {len(missing)} 个需要重新转换的标的没有可用的 CSV (如 {missing[0]})，保持原样")
+    if not new_data:
+        print("没有新增数据，无需更新。")
+        return
+
+    # 3. 对新日期分类: 追加到尾部 / 插入到头部 / 落在日历中间的缺口 (日历本身最后写入)
+    old_calendar = calendar
+    calendar_set = set(calendar)
+    new_dates = set()
+    for df in new_data.values():
+        new_dates.update(df['date'].tolist())
+    new_dates -= calendar_set
+    head_dates = sorted(d for d in new_dates if d < calendar[0])
+    tail_dates = sorted(d for d in new_dates if d > calendar[-1])
+    gap_dates = sorted(new_dates - set(head_dates) - set(tail_dates))
+
+    if gap_dates:
+        # 中间插入日期会改变其后所有数据的位置，无法只追加，退回全量转换
+        print(f"  发现 {len(gap_dates)} 个落在现有日历中间的新日期 (如 {gap_dates[0]})，执行全量转换。")
+        return convert_to_bin()
+
+    if head_dates:
+        # 日历头部插入日期: 所有已存在 .bin 的 start_idx 必须整体后移，显式改写文件头 (本次整体重写的标的除外)
+        shift = len(head_dates)
+        count = shift_bin_headers(features_dir, shift, skip=rebuild | set(new_data) - set(watermarks))
+        calendar = head_dates + calendar
+        print(f"  日历头部新增 {shift} 天 ({head_dates[0]} 起)，已将 {count} 个 .bin 文件的 start_idx 后移 {shift}")
+
+    if tail_dates:
+        calendar = calendar + tail_dates
+        print(f"  日历尾部追加 {len(tail_dates)} 天: {tail_dates[0]} 至 {tail_dates[-1]}")
+
+    date_to_idx = {d: i for i, d in enumerate(calendar)}
+
+    # 4. 追加写入 .bin (需要重新转换的标的整体重写)
+    ranges = {}
+    for symbol, df in new_data.items():
+        symbol_dir = os.path.join(features_dir, symbol)
+        first_idx = date_to_idx[df['date'].iloc[0]]
+        last_idx = date_to_idx[df['date'].iloc[-1]]
+        aligned = df.set_index('date')
+
+        if symbol in watermarks and symbol not in rebuild:
+            start_idx, length = read_bin_range(os.path.join(symbol_dir, "factor.day.bin"))
+            end_idx = start_idx + length - 1
+            if first_idx <= end_idx:
+                print(f"  跳过 {symbol}: 新数据 {df['date'].iloc[0]} 早于已写入数据末尾，请执行全量转换")
+                continue
+            # 从已有数据末尾的下一天开始对齐，中间缺失的交易日以 NaN 填充
+            aligned = aligned.reindex(calendar[end_idx + 1 : last_idx + 1])
+            append_symbol_bins(symbol_dir, aligned)
+            start_date = calendar[start_idx]
+            length += len(aligned)
+        else:
+            aligned = aligned.reindex(calendar[first_idx : last_idx + 1])
+            write_symbol_bins(symbol_dir, aligned, first_idx)
+            start_date = df['date'].iloc[0]
+            length = len(aligned)
+
+        ranges[symbol] = (start_date, df['date'].iloc[-1])
+        watermarks[symbol] = make_watermark(new_files[symbol], symbol_dir, start_date, df['date'].iloc[-1], length)
+        print(f"  完成增量写入: {symbol} (+{len(aligned)} 天, 至 {df['date'].iloc[-1]})")
+
+    # 5. 更新 instruments/all.txt 与水位线，最后写入日历
+    update_instruments(ranges)
+    save_watermarks(watermarks)
+    if calendar != old_calendar:
+        write_calendar(calendar_path, calendar)
+        print(f"  已更新日历文件: {calendar_path} (共 {len(calendar)} 天)")
+    print("\n增量转换任务完成！")
+
+# ---------------- 并行全量转换 ----------------
+# 进程池中共享的日历 (datetime64[D])，由 initializer 注入，避免每个任务重复传输
+_CALENDAR = None
+
+def _init_calendar(calendar):
+    global _CALENDAR
+    _CALENDAR = calendar
+
+def _parse_dates(values):
+    """
+    向量化解析日期，优先按固定格式解析
+    """
+    try:
+        return pd.to_datetime(values, format='%Y-%m-%d').values.astype('datetime64[D]')
+    except ValueError:
+        return pd.to_datetime(values).values.astype('datetime64[D]')
+
+def _read_csv_worker(file_path):
+    """
+    阶段一 worker: 只读取 COLUMN_MAP 中的列并指定 dtype，返回按日期排序的 numpy 列
+    """
+    dtypes = {src: (str if dst == 'date' else np.float64) for src, dst in COLUMN_MAP.items()}
+    df = pd.read_csv(file_path, usecols=lambda c: c in COLUMN_MAP, dtype=dtypes, engine='c')
+    df = df.rename(columns=COLUMN_MAP)
+    dates = _parse_dates(df['date'].values)
+    # 按日期排序并去重 (重复日期保留最后一条)
+    order = np.argsort(dates, kind='stable')
+    dates = dates[order]
+    keep = np.append(dates[1:] != dates[:-1], True) if len(dates) else np.array([], dtype=bool)
+    columns = {col: df[col].values[order][keep] for col in FIELDS if col in df.columns}
+    return file_path, dates[keep], columns, len(df)
+
+def _write_symbol_worker(symbol_dir, dates, columns):
+    """
+    阶段二 worker: 用 searchsorted 将数据对齐到共享日历后写入 .bin
+    """
+    positions = np.searchsorted(_CALENDAR, dates)
+    start_idx, end_idx = int(positions[0]), int(positions[-1])
+    offsets = positions - start_idx
+    aligned = {}
+    for col, values in columns.items():
+        # 日历中存在但该标的缺失的交易日以 NaN 填充
+        series = np.full(end_idx - start_idx + 1, np.nan, dtype=np.float32)
+        series[offsets] = values
+        aligned[col] = series
+    write_symbol_bins(symbol_dir, pd.DataFrame(aligned), start_idx)
+    return start_idx, end_idx
+
+def convert_to_bin_parallel(workers=None):
+    """
+    并行全量转换，分两阶段:
+    1. 进程池并行读取 CSV (列裁剪 + 显式 dtype + 向量化日期解析)，合并得到完整日历;
+    2. 日历确定后，进程池并行对齐并写入各标的 .bin。
+    结果与 convert_to_bin() 一致。
+    """
+    workers = workers or os.cpu_count()
+    print(f"开始并行转换数据: {SOURCE_DIR} -> {QLIB_DATA_DIR} (进程数: {workers})")
+    t_start = time.perf_counter()
+
+    calendar_path = os.path.join(QLIB_DATA_DIR, "calendars/day.txt")
+    features_dir = os.path.join(QLIB_DATA_DIR, "features")
+    old_calendar = load_calendar(calendar_path)
+    files = [os.path.join(SOURCE_DIR, f) for f in sorted(os.listdir(SOURCE_DIR)) if f.endswith('.csv')]
+
+    # 1. 并行读取 CSV
+    all_data = {}
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_read_csv_worker, path) for path in files]
+        for future in futures:
+            try:
+                file_path, dates, columns, rows = future.result()
+            except Exception as e:
+                print(f"  读取文件出错: {e}")
+                continue
+            if len(dates) == 0:
+                continue
+            all_data[get_symbol(os.path.basename(file_path))] = (file_path, dates, columns)
+            total_rows += rows
+
+    if not all_data:
+        print("未找到可处理的 CSV 文件。")
+        return
+    t_read = time.perf_counter()
+    print(f"  阶段一完成: 读取 {len(all_data)} 个文件, {total_rows} 行, 用时 {t_read - t_start:.2f}s")
+
+    # 2. 合并日历 (现有日历 + 所有新日期)
+    parts = [dates for _, dates, _ in all_data.values()]
+    if old_calendar:
+        parts.append(np.array(old_calendar, dtype='datetime64[D]'))
+    calendar = np.unique(np.concatenate(parts))
+    calendar_str = np.datetime_as_string(calendar, unit='D')
+    write_calendar(calendar_path, calendar_str)
+    print(f"  已更新日历文件: {calendar_path} (共 {len(calendar)} 天)")
+
+    # 日历头部新增日期时，本次不重写的已有标的需要显式后移 start_idx
+    shift = int(np.searchsorted(calendar, np.datetime64(old_calendar[0], 'D'))) if old_calendar else 0
+    if shift > 0:
+        count = shift_bin_headers(features_dir, shift, skip=set(all_data))
+        print(f"  日历头部新增 {shift} 天，已将 {count} 个未重写 .bin 文件的 start_idx 后移 {shift}")
+
+    # 3. 并行写入 .bin
+    ranges = {}
+    watermarks = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_calendar, initargs=(calendar,)) as pool:
+        futures = {
+            symbol: pool.submit(_write_symbol_worker, os.path.join(features_dir, symbol), dates, columns)
+            for symbol, (_, dates, columns) in all_data.items()
+        }
+        for symbol, future in futures.items():
+            start_idx, end_idx = future.result()
+            ranges[symbol] = (calendar_str[start_idx], calendar_str[end_idx])
+            watermarks[symbol] = make_watermark(
+                all_data[symbol][0], os.path.join(features_dir, symbol),
+                calendar_str[start_idx], calendar_str[end_idx], end_idx - start_idx + 1
+            )
+    t_write = time.perf_counter()
+    print(f"  阶段二完成: 写入 {len(ranges)} 个标的, 用时 {t_write - t_read:.2f}s")
+
+    # 4. 更新 instruments/all.txt 与水位线
+    update_instruments(ranges)
+    save_watermarks(watermarks)
+
+    elapsed = time.perf_counter() - t_start
+    print(f"\n并行转换任务完成！总用时 {elapsed:.2f}s, "
+          f"{total_rows / elapsed:,.0f} 行/秒, {len(ranges) / elapsed:,.1f} 标的/秒")
+
+# ---------------- 列式快照导出 ----------------
+def export_panel_snapshot(fields=None):
+    """
+    从 .bin 文件导出 date×instrument 的列式快照 (每个字段一个 Arrow IPC 文件)，
+    供 data_handler.load_panel_snapshot 快速读取整个股票池。
+    schema 元数据记录导出时的日历/.bin 数据版本 (data_handler.get_data_version)，
+    之后 .bin 被重写或追加而未重新导出时，读取端据此发现快照已过期。
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("未安装 pyarrow，跳过列式快照导出 (pip install pyarrow)。")
+        return
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_qlib"))
+    from layers.atomic.data_handler import get_data_version
+
+    t_start = time.perf_counter()
+    fields = fields or FIELDS + ['factor']
+    calendar = load_calendar(os.path.join(QLIB_DATA_DIR, "calendars/day.txt"))
+    features_dir = os.path.join(QLIB_DATA_DIR, "features")
+    snapshot_dir = os.path.join(QLIB_DATA_DIR, SNAPSHOT_DIR)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    symbols = sorted(s for s in os.listdir(features_dir) if os.path.isdir(os.path.join(features_dir, s)))
+    datetime_col = pa.array(pd.to_datetime(calendar).values)
+
+    for field in fields:
+        panel = np.full((len(calendar), len(symbols)), np.nan, dtype=np.float32)
+        names = []
+        columns = []
+        # 各标的在 .bin 中的数据区间，写入 schema 元数据，用于区分"停牌 NaN"与"区间外"
+        data_range = {}
+        for j, symbol in enumerate(symbols):
+            bin_path = os.path.join(features_dir, symbol, f"{field}.day.bin")
+            if not os.path.exists(bin_path) or os.path.getsize(bin_path) < 8:
+                continue
+            data = np.memmap(bin_path, dtype='<f4', mode='r')
+            start_idx = int(data[0])
+            values = data[1 : 1 + len(calendar) - start_idx]
+            if len(values) == 0:
+                continue
+            panel[start_idx : start_idx + len(values), j] = values
+            names.append(symbol.upper())
+            columns.append(j)
+            data_range[symbol.upper()] = [calendar[start_idx], calendar[start_idx + len(values) - 1]]
+        if not names:
+            continue
+        arrays = [datetime_col] + [pa.array(panel[:, j]) for j in columns]
+        batch = pa.RecordBatch.from_arrays(arrays, names=['datetime'] + names)
+        batch = batch.replace_schema_metadata({
+            "data_range": json.dumps(data_range),
+            "data_version": get_data_version([f"${field}"], instruments=names, provider_uri=QLIB_DATA_DIR),
+        })
+        path = os.path.join(snapshot_dir, f"{field}.arrow")
+        with pa.OSFile(path + ".tmp", 'wb') as sink:
+            with pa.ipc.new_file(sink, batch.schema) as writer:
+                writer.write_batch(batch)
+        os.replace(path + ".tmp", path)
+        print(f"  已导出列式快照: {path} ({len(calendar)} 天 × {len(names)} 个标的)")
+
+    print(f"  列式快照导出完成，用时 {time.perf_counter() - t_start:.2f}s")
+
 if __name__ == "__main__":
-    convert_to_bin()
+    parser = argparse.ArgumentParser(description="AkShare CSV -> Qlib .bin 转换")
+    parser.add_argument("--incremental", action="store_true", help="增量模式: 只追加水位线之后的新数据")
+    parser.add_argument("--workers", type=int, default=0, help="并行全量转换的进程数 (>1 时启用并行模式)")
+    parser.add_argument("--snapshot", action="store_true", help="转换完成后导出 date×instrument 列式快照 (需要 pyarrow)")
+    args = parser.parse_args()
+
+    if args.incremental:
+        convert_incremental()
+    elif args.workers > 1:
+        convert_to_bin_parallel(workers=args.workers)
+    else:
+        convert_to_bin()
+
+    if args.snapshot:
+        export_panel_snapshot()
@@ -1,20 +1,241 @@
-import qlib
-from qlib.data import D
-import pandas as pd
-
-# 初始化 Qlib
-qlib_dir = "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"
-qlib.init(provider_uri=qlib_dir)
-
-# 查询转换后的数据
-instruments = ['SH518880', 'SZ159513', 'SZ159338', 'SH511130', 'SH510300']
-fields = ['$open', '$close', '$high', '$low', '$volume', '$amount', '$factor']
-
-try:
-    df = D.features(instruments, fields, start_time='2025-01-01', end_time='2025-12-31')
-    print("\n查询成功！数据样例 (2025年):")
-    print(df.head())
-    print("\n数据列:")
-    print(df.columns)
-except Exception as e:
-    print(f"\n查询失败: {e}")
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+
+from convert_data import SOURCE_DIR, FIELDS, get_symbol, load_calendar, read_source_csv
+
+# 数据目录 (不需要初始化 qlib，直接校验二进制文件)
+QLIB_DATA_DIR = "/mnt/data/mycode/my_qlib/.qlib/qlib_data/cn_data"
+
+# 校验清单: 记录每个 .bin 文件的大小、修改时间与校验和以及校验上下文，只重新校验发生变化的文件
+MANIFEST_FILE = "manifest.json"
+
+def load_instruments(inst_path):
+    """
+    读取 instruments/all.txt，返回 {symbol(小写): (start_date, end_date)}
+    """
+    instruments = {}
+    if os.path.exists(inst_path):
+        with open(inst_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split('\t')
+                if len(parts) >= 3:
+                    instruments[parts[0].lower()] = (parts[1], parts[2])
+    return instruments
+
+def file_checksum(data):
+    """
+    计算文件内容的校验和
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def verification_context(compare_source):
+    """
+    影响校验结果的全局输入: 比对模式以及日历、instruments/*.txt 的校验和。
+    与清单中记录的不一致时 (如日历追加了新交易日、股票池区间变化、切换到 --source)，所有标的都需要重新校验。
+    """
+    def checksum(path):
+        with open(path, 'rb') as f:
+            return file_checksum(f.read())
+
+    inst_dir = os.path.join(QLIB_DATA_DIR, "instruments")
+    return {
+        "compare_source": compare_source,
+        "calendar": checksum(os.path.join(QLIB_DATA_DIR, "calendars/day.txt")),
+        "instruments": {
+            name: checksum(os.path.join(inst_dir, name))
+            for name in sorted(os.listdir(inst_dir)) if name.endswith('.txt')
+        } if os.path.isdir(inst_dir) else {},
+    }
+
+def nan_runs(values):
+    """
+    向量化统计 NaN 连续段: 返回 (段数, 最长段长度)
+    """
+    is_nan = np.isnan(values).astype(np.int8)
+    if not is_nan.any():
+        return 0, 0
+    edges = np.diff(np.concatenate(([0], is_nan, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return len(starts), int((ends - starts).max())
+
+def verify_symbol(symbol_dir, files, calendar, calendar_idx, inst_range, source_df=None):
+    """
+    校验单个标的的所有 .bin 文件，返回错误信息列表与统计信息
+    """
+    errors = []
+    stats = {}
+    lengths = {}
+    arrays = {}
+    for file in files:
+        path = os.path.join(symbol_dir, file)
+        if os.path.getsize(path) < 8 or os.path.getsize(path) % 4 != 0:
+            errors.append(f"{file}: 文件大小异常 ({os.path.getsize(path)} 字节)")
+            continue
+        data = np.memmap(path, dtype='<f4', mode='r')
+        header = float(data[0])
+        start_idx = int(header)
+        if header != start_idx or start_idx < 0 or start_idx >= len(calendar_idx):
+            errors.append(f"{file}: 文件头 start_idx={header} 不在日历范围内")
+            continue
+        values = data[1:]
+        if start_idx + len(values) > len(calendar_idx):
+            errors.append(f"{file}: 数据长度 {len(values)} 超出日历末尾")
+        lengths[file] = (start_idx, len(values))
+        arrays[file.split('.')[0]] = values
+
+    # 1. 各字段起点与长度一致
+    if len(set(lengths.values())) > 1:
+        errors.append(f"字段起点/长度不一致: {lengths}")
+
+    # 2. 文件头与 instruments/all.txt、日历对齐
+    if lengths and inst_range is not None:
+        start_idx, length = next(iter(lengths.values()))
+        start_date, end_date = inst_range
+        expected_start = calendar_idx.get(start_date)
+        expected_end = calendar_idx.get(end_date)
+        if expected_start is None or expected_end is None:
+            errors.append(f"instruments 日期 {start_date}~{end_date} 不在日历中")
+        else:
+            if start_idx != expected_start:
+                errors.append(f"start_idx={start_idx} 与 instruments 起始日 {start_date} (索引 {expected_start}) 不符")
+            if start_idx + length - 1 != expected_end:
+                errors.append(f"数据末尾索引 {start_idx + length - 1} 与 instruments 结束日 {end_date} (索引 {expected_end}) 不符")
+    elif inst_range is None:
+        errors.append("未出现在 instruments/all.txt 中")
+
+    # 3. NaN 连续段统计
+    if 'close' in arrays:
+        stats['nan_runs'], stats['max_nan_run'] = nan_runs(arrays['close'])
+
+    # 4. 与源 CSV 逐值比对 (向量化)
+    if source_df is not None and lengths:
+        start_idx, length = next(iter(lengths.values()))
+        dates = source_df['date'].values.astype(calendar.dtype)
+        cal_positions = np.minimum(np.searchsorted(calendar, dates), len(calendar) - 1)
+        positions = cal_positions - start_idx
+        valid = (calendar[cal_positions] == dates) & (positions >= 0) & (positions < length)
+        if not valid.all():
+            errors.append(f"源 CSV 有 {int((~valid).sum())} 行落在 .bin 范围之外")
+        mismatches = 0
+        for col in FIELDS:
+            if col not in arrays or col not in source_df.columns:
+                continue
+            expected = source_df[col].values.astype(np.float32)[valid]
+            actual = np.asarray(arrays[col])[positions[valid]]
+            mismatches += int((~((expected == actual) | (np.isnan(expected) & np.isnan(actual)))).sum())
+        if mismatches:
+            errors.append(f"与源 CSV 不一致的数值: {mismatches} 个")
+    return errors, stats
+
+def verify_data(compare_source=False, full=False):
+    print(f"开始校验数据: {QLIB_DATA_DIR}")
+    t_start = time.perf_counter()
+
+    calendar = np.array(load_calendar(os.path.join(QLIB_DATA_DIR, "calendars/day.txt")))
+    calendar_idx = {d: i for i, d in enumerate(calendar)}
+    instruments = load_instruments(os.path.join(QLIB_DATA_DIR, "instruments/all.txt"))
+    features_dir = os.path.join(QLIB_DATA_DIR, "features")
+    manifest_path = os.path.join(QLIB_DATA_DIR, MANIFEST_FILE)
+    manifest = {"files": {}, "errors": {}}
+    if os.path.exists(manifest_path) and not full:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    # 日历/股票池/比对模式变化时上次的结果全部失效；源 CSV 不在清单中，--source 时总是全部重新比对
+    context = verification_context(compare_source)
+    reuse_results = not compare_source and manifest.get("context") == context
+    # 按标的分组清单中的文件，用于发现被删除的文件
+    manifest_files = {}
+    for key in manifest["files"]:
+        manifest_files.setdefault(key.split('/')[0], set()).add(key)
+
+    sources = {}
+    if compare_source and os.path.isdir(SOURCE_DIR):
+        sources = {get_symbol(f): os.path.join(SOURCE_DIR, f) for f in os.listdir(SOURCE_DIR) if f.endswith('.csv')}
+
+    new_manifest = {"context": context, "files": {}, "errors": {}}
+    nan_stats = {}
+    checked, skipped = 0, 0
+    symbols = sorted(os.listdir(features_dir))
+    for symbol in symbols:
+        symbol_dir = os.path.join(features_dir, symbol)
+        files = sorted(f for f in os.listdir(symbol_dir) if f.endswith('.day.bin'))
+
+        # 1. 依据清单判断是否有文件变化: 大小与修改时间相同直接跳过，否则比较校验和
+        entries = {}
+        changed = set(manifest_files.get(symbol, ())) != {f"{symbol}/{file}" for file in files}
+        for file in files:
+            key = f"{symbol}/{file}"
+            st = os.stat(os.path.join(symbol_dir, file))
+            old = manifest["files"].get(key)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                entries[key] = old
+                continue
+            with open(os.path.join(symbol_dir, file), 'rb') as f:
+                checksum = file_checksum(f.read())
+            entries[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "checksum": checksum}
+            if not (old and old["checksum"] == checksum):
+                changed = True
+        new_manifest["files"].update(entries)
+
+        if reuse_results and not changed and files:
+            # 文件与校验上下文均未变化: 沿用上次的校验结果
+            if symbol in manifest["errors"]:
+                new_manifest["errors"][symbol] = manifest["errors"][symbol]
+            skipped += 1
+            continue
+
+        # 2. 对发生变化的标的执行完整校验
+        source_df = None
+        if symbol in sources:
+            try:
+                source_df = read_source_csv(sources[symbol])
+            except Exception as e:
+                print(f"  读取源文件 {sources[symbol]} 出错: {e}")
+        errors, stats = verify_symbol(symbol_dir, files, calendar, calendar_idx, instruments.get(symbol), source_df)
+        if not files:
+            errors.append("没有任何 .bin 文件")
+        checked += 1
+        if stats.get('nan_runs'):
+            nan_stats[symbol] = stats
+        if errors:
+            new_manifest["errors"][symbol] = errors
+
+    failed = new_manifest["errors"]
+    # 3. instruments 中有记录但没有数据目录的标的
+    missing = sorted(set(instruments) - set(symbols))
+
+    with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    elapsed = time.perf_counter() - t_start
+    print(f"  标的总数: {len(symbols)}, 本次校验: {checked}, 未变化跳过: {skipped}, 用时 {elapsed:.2f}s")
+    if nan_stats:
+        worst = sorted(nan_stats.items(), key=lambda kv: -kv[1]['max_nan_run'])[:5]
+        print(f"  含 NaN 段的标的: {len(nan_stats)} 个，最长 NaN 段: "
+              + ", ".join(f"{s}({v['max_nan_run']}天/{v['nan_runs']}段)" for s, v in worst))
+    if missing:
+        print(f"  instruments 中缺少数据目录的标的: {len(missing)} 个，如 {missing[:5]}")
+    for symbol, errors in failed.items():
+        for err in errors:
+            print(f"  [错误] {symbol}: {err}")
+
+    if failed or missing:
+        print(f"\n校验失败: {len(failed)} 个标的存在问题。")
+        return False
+    print("\n校验通过！")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="校验 Qlib .bin 数据")
+    parser.add_argument("--source", action="store_true", help="同时与源 CSV 逐值比对")
+    parser.add_argument("--full", action="store_true", help="忽略校验清单，重新校验全部文件")
+    args = parser.parse_args()
+
+    sys.exit(0 if verify_data(compare_source=args.source, full=args.full) else 1)